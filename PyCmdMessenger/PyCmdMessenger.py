@@ -10,7 +10,13 @@ communication library.
 __author__ = "Michael J. Harms"
 __date__ = "2016-05-20"
 
-import re, warnings, time, struct
+import re, warnings, time, struct, collections, binascii
+import concurrent.futures
+import numpy as np
+
+from .codec import CommandCodec, FrameFields, numpy_dtype
+from .correlation import QueryCorrelator
+from .metrics import LinkMetrics
 
 class CmdMessenger:
     """
@@ -24,7 +30,8 @@ class CmdMessenger:
                  field_separator=",",
                  command_separator=";",
                  escape_separator="/",
-                 warnings=True):
+                 warnings=True,
+                 crc=False):
         """
         Input:
             board_instance:
@@ -38,6 +45,9 @@ class CmdMessenger:
                 a list of lists, where the first element in the list specifies
                 the command name and the second the formats for the arguments.
                 (e.g. commands = [["who_are_you",""],["my_name_is","s"]])
+                An optional third element names the command the arduino sends
+                back in reply (e.g. ["who_are_you","","my_name_is"]).  query
+                uses it to match replies to queries.
 
             field_separator:
                 character that separates fields within a message
@@ -54,6 +64,14 @@ class CmdMessenger:
             warnings:
                 warnings for user
                 Default: True
+
+            crc:
+                add a CRC16 (XModem) field to the end of every message and
+                check it on every message received.  Messages that fail the
+                check are counted (see corruption_stats) and skipped.  The
+                sketch must call cmdMessenger.useCrc16() (see the bundled
+                CmdMessenger.cpp).
+                Default: False
  
             The separators and escape_separator should match what's
             in the arduino code that initializes the CmdMessenger.  The default
@@ -70,14 +88,34 @@ class CmdMessenger:
         self.command_separator = command_separator
         self.escape_separator = escape_separator
         self.give_warnings = warnings
+        self.crc = crc
 
         self._cmd_name_to_int = {}
         self._int_to_cmd_name = {}
         self._cmd_name_to_format = {}
+        self._cmd_name_to_response = {}
         for i, c in enumerate(commands):
             self._cmd_name_to_int[c[0]] = i
             self._int_to_cmd_name[i] = c[0]
             self._cmd_name_to_format[c[0]] = c[1]
+            if len(c) > 2 and c[2] is not None:
+                self._cmd_name_to_response[c[0]] = c[2]
+
+        for cmd, response_cmd in self._cmd_name_to_response.items():
+            if response_cmd not in self._cmd_name_to_int:
+                err = "Response '{}' to command '{}' not recognized.\n".format(response_cmd,cmd)
+                raise ValueError(err)
+
+        # Counters for messages, errors, timeouts and query latency
+        self.metrics = LinkMetrics(self._find_command_name)
+
+        # Queries waiting on replies, and messages that arrived while a query
+        # was waiting on something else (at most max_unsolicited of them; the
+        # oldest are dropped and counted in dropped_unsolicited)
+        self._correlator = QueryCorrelator(self.metrics)
+        self._unsolicited = collections.deque()
+        self.max_unsolicited = 1000
+        self.dropped_unsolicited = 0
  
         self._byte_field_sep = self.field_separator.encode("ascii")
         self._byte_command_sep = self.command_separator.encode("ascii")
@@ -91,6 +129,35 @@ class CmdMessenger:
         self._escape_re = re.compile("([{}{}{}\0])".format(self.field_separator,
                                                            self.command_separator,
                                                            self.escape_separator).encode('ascii'))
+        self._unescape_re = re.compile(re.escape(self._byte_escape_sep) + \
+                                       b"([" + re.escape(self._byte_field_sep +
+                                                         self._byte_command_sep +
+                                                         self._byte_escape_sep) + \
+                                       b"\0])")
+
+        # Bytes read off the serial port that have not yet been framed into
+        # messages, and how far into them we have already looked for a
+        # command separator.
+        self._receive_buffer = bytearray()
+        self._receive_scan = 0
+
+        # When each chunk still in the receive buffer was read, as (offset of
+        # its first byte, time.perf_counter()).  Offsets count every byte ever
+        # buffered; _receive_offset is the offset of the first byte still in
+        # the buffer.  _frame_time is the message_time of the last message
+        # taken out of the buffer.
+        self._receive_times = collections.deque()
+        self._receive_offset = 0
+        self._frame_time = None
+
+        # Puts time.perf_counter() on the time.time() scale (see clock)
+        self._clock_offset = time.time() - time.perf_counter()
+
+        # Messages received and how many of them were corrupted
+        self.corrupted_cmds = 0.0
+        self._num_received = 0
+        self._num_corrupted = 0
+        self._num_crc_errors = 0
 
         self._send_methods = {"c":self._send_char,
                               "b":self._send_byte,
@@ -116,6 +183,19 @@ class CmdMessenger:
                               "?":self._recv_bool,
                               "g":self._recv_guess}
 
+        # Compile an argument codec for every command up front.  Codecs for
+        # arg_formats passed to send/receive are compiled on first use.
+        self._codecs = {}
+        for c in commands:
+            self._codecs[c[0]] = CommandCodec(self,
+                                              self._cmd_name_to_int[c[0]],
+                                              c[1])
+        self._override_codecs = {}
+        self._guess_codec = CommandCodec(self,None,None)
+
+        self._prefix_to_cmd_name = dict([(codec.prefix,cmd_name) for cmd_name, codec
+                                         in self._codecs.items()])
+
     def send(self,cmd,*args,**kwargs):
         """
         Send a command (which may or may not have associated arguments) to an 
@@ -128,179 +208,381 @@ class CmdMessenger:
         formats specified on initialization.  
         """
 
-        # Turn the command into an integer.
-        try:
-            command_as_int = self._cmd_name_to_int[cmd]
-        except KeyError:
-            err = "Command '{}' not recognized.\n".format(cmd)
-            raise ValueError(err)
-
         # Grab arg_formats from kwargs
         arg_formats = kwargs.pop('arg_formats', None)
         if kwargs:
             raise TypeError("'send()' got unexpected keyword arguments: {}".format(', '.join(kwargs.keys())))
 
-        # Figure out what formats to use for each argument.  
-        arg_format_list = []
-        if arg_formats != None:
+        compiled_bytes = self._encode(cmd,args,arg_formats)
 
-            # The user specified formats
-            arg_format_list = list(arg_formats)
+        # Send the message.
+        self.board.write(compiled_bytes)
 
-        else:
-            try:
-                # See if class was initialized with a format for arguments to this
-                # command
-                arg_format_list = self._cmd_name_to_format[cmd]
-            except KeyError:
-                # if not, guess for all arguments
-                arg_format_list = ["g" for i in range(len(args))]
-  
-        # Deal with "*" format  
-        arg_format_list = self._treat_star_format(arg_format_list,args)
-
-        if len(args) > 0:
-            if len(arg_format_list) != len(args):
-                err = "Number of argument formats must match the number of arguments."
-                raise ValueError(err)
+    def send_many(self,commands,max_chunk_size=None):
+        """
+        Send a batch of commands in as few serial writes as possible.  commands
+        is a list of (cmd, args) pairs, where args is a tuple of arguments for
+        that command (e.g. [("kValuePing",(1,2.0)),("kAreYouReady",())]).  All
+        messages are encoded into one contiguous buffer and written at once.
 
-        # Go through each argument and create a bytes representation in the
-        # proper format to send.  Escape appropriate characters. 
-        fields = ["{}".format(command_as_int).encode("ascii")]
-        for i, a in enumerate(args):
-            fields.append(self._send_methods[arg_format_list[i]](a))
-            fields[-1] = self._escape_re.sub(self._byte_escape_sep + r"\1".encode("ascii"),fields[-1])
+        max_chunk_size optionally limits the number of bytes handed to the
+        serial port per write (e.g. to avoid overrunning the arduino's 64 byte
+        input buffer).  Chunks are split at message boundaries where
+        possible.
 
-        # Make something that looks like cmd,field1,field2,field3;
-        compiled_bytes = self._byte_field_sep.join(fields) + self._byte_command_sep
+        Returns a list with the number of bytes sent for each command.
+        """
 
-        # Send the message.
-        self.board.write(compiled_bytes)
+        chunks, num_bytes = self._compile_batch(commands,max_chunk_size)
+        for chunk in chunks:
+            self.board.write(chunk)
+
+        return num_bytes
+
+    def send_array(self,cmd,*args):
+        """
+        Send a command with a "*" format (e.g. "f*" or "if*"), where the last
+        argument is a numpy array (or anything np.asarray accepts) holding the
+        repeated values.  Any arguments before the array are sent first, using
+        the formats at the front of the format string.  The whole array is
+        range checked and packed by numpy in one call rather than one value at
+        a time.
+
+        e.g. c.send_array("multi_ping",np.array([1.0,2.0,3.0]))
+        """
+
+        self.board.write(self._encode_array(cmd,args))
+
+    def _encode_array(self,cmd,args):
+        """
+        Turn a command and its arguments, the last one an array of the
+        repeated values, into the escaped bytes of the message (see
+        send_array).
+        """
 
-    def receive(self,arg_formats=None):
+        if len(args) == 0:
+            err = "send_array requires an array argument."
+            raise ValueError(err)
+
+        codec = self._get_codec(cmd)
+        arg_formats = codec.arg_formats
+        if arg_formats is None or arg_formats[-1:] != "*":
+            err = "send_array requires a command with a '*' format, not '{}'.".format(arg_formats)
+            raise ValueError(err)
+
+        # Fields before the array take their formats from the front of the
+        # format string, then from the repeated format.
+        leading = args[:-1]
+        repeated_format = arg_formats[-2]
+        leading_formats = (arg_formats[:-2] + repeated_format*len(leading))[:len(leading)]
+        if len(leading) < len(arg_formats) - 2:
+            err = "Number of argument formats must match the number of arguments."
+            raise ValueError(err)
+
+        fields = self._get_codec(cmd,leading_formats).encode(leading)
+        fields.extend(self._pack_array(args[-1],repeated_format))
+
+        return self._compile_message(codec.prefix,fields)
+
+    def receive(self,arg_formats=None,as_array=False):
         """
         Recieve commands coming off the serial port. 
 
         arg_formats is an optimal keyword that specifies the formats to use to
         parse incoming arguments.  If specified here, arg_formats supercedes
         the formats specified on initialization.  
+
+        If as_array is True, the repeated values of a "*" format are returned
+        as a single numpy array at the end of the received list (e.g. a "if*"
+        command gives [int_value, array_of_floats]).
+
+        message_time is when the first byte of the message was read off the
+        serial port, in seconds on the clock() scale.
         """
 
-        # Read serial input until a command separator or empty character is
-        # reached 
-        msg = [[]]
-        raw_msg = []
-        escaped = False
-        command_sep_found = False
-        while True:
+        # Messages held back by query come first, then the serial port
+        if self._unsolicited:
+            fields, message_time = self._unsolicited.popleft()
+        else:
+            fields = self._read_fields()
+            if fields is None:
+                return None
+            message_time = self._frame_time
 
-            tmp = self.board.read()
-            raw_msg.append(tmp)
+        if as_array:
+            cmd_name, received = self._decode_array(fields,arg_formats)
+        else:
+            cmd_name, received = self._decode(fields,arg_formats)
 
-            if escaped:
+        return cmd_name, received, message_time
 
-                # Either drop the escape character or, if this wasn't really
-                # an escape, keep previous escape character and new character
-                if tmp in self._escaped_characters:
-                    msg[-1].append(tmp)
-                    escaped = False
-                else:
-                    msg[-1].append(self._byte_escape_sep)
-                    msg[-1].append(tmp)
-                    escaped = False
-            else:
+    def clock(self):
+        """
+        Current time on the scale of message_time: time.perf_counter() (a
+        monotonic, high resolution clock) shifted to match time.time() when
+        the messenger was created.  Unlike time.time() it never jumps when the
+        system clock is set, so it slowly drifts away from wall time.
+        """
 
-                # look for escape character
-                if tmp == self._byte_escape_sep:
-                    escaped = True
+        return time.perf_counter() + self._clock_offset
+    
+    def messages(self,timeout=None,commands=None,arg_formats=None):
+        """
+        Iterate over messages as they arrive, yielding (cmd_name, received,
+        message_time) like receive.  Partial messages are kept buffered rather
+        than thrown away while waiting.
+
+        timeout: stop once no message has arrived for this many seconds.  If
+                 None, keep waiting forever.
+        commands: only yield these commands (names); others are skipped.
+        arg_formats: as for receive.
+        """
 
-                # or field separator
-                elif tmp == self._byte_field_sep:
-                    msg.append([])
+        prefixes = self._command_prefixes(commands)
 
-                # or command separator
-                elif tmp == self._byte_command_sep:
-                    command_sep_found = True
-                    break
+        while True:
 
-                # or any empty characater 
-                elif tmp == b'':
+            if timeout is None:
+                deadline = None
+            else:
+                deadline = time.monotonic() + timeout
+
+            while True:
+                msg = self._next_fields(deadline)
+                if msg is None:
+                    if deadline is None:
+                        continue
+                    return
+
+                fields, message_time = msg
+                if prefixes is None or fields[0].strip() in prefixes:
                     break
 
-                # okay, must be something
-                else:
-                    msg[-1].append(tmp)
-  
-        # No message received given timeouts
-        if len(msg) == 1 and len(msg[0]) == 0:
-            return None
+            cmd_name, received = self._decode(fields,arg_formats)
 
-        # Make sure the message terminated properly
-        if not command_sep_found:
-          
-            # empty message (likely from line endings being included) 
-            joined_raw = b''.join(raw_msg) 
-            if joined_raw.strip() == b'':
-                return  None
-           
-            err = "Incomplete message ({})".format(joined_raw.decode())
-            raise EOFError(err)
+            yield cmd_name, received, message_time
 
-        # Turn message into fields
-        fields = [b''.join(m) for m in msg]
+    def receive_many(self,max_count,deadline=None,arg_formats=None):
+        """
+        Receive up to max_count messages in one call, returning a list of
+        (cmd_name, received, message_time).  Returns as soon as max_count
+        messages are in, or once deadline seconds have passed (None waits for
+        all max_count).  deadline=0 returns whatever has already arrived
+        without waiting.
+        """
 
-        # Get the command name.
-        cmd = fields[0].strip().decode()
-        try:
-            cmd_name = self._int_to_cmd_name[int(cmd)]
-        except (ValueError,IndexError):
+        if deadline is not None:
+            deadline = time.monotonic() + deadline
 
-            if self.give_warnings:
-                cmd_name = "unknown"
-                w = "Recieved unrecognized command ({}).".format(cmd)
-                warnings.warn(w,Warning)
-        
-        # Figure out what formats to use for each argument.  
-        arg_format_list = []
-        if arg_formats != None:
+        batch = []
+        while len(batch) < max_count:
 
-            # The user specified formats
-            arg_format_list = list(arg_formats)
+            msg = self._next_fields(deadline)
+            if msg is None:
+                if deadline is None:
+                    continue
+                break
 
-        else:
-            try:
-                # See if class was initialized with a format for arguments to this
-                # command
-                arg_format_list = self._cmd_name_to_format[cmd_name]
-            except KeyError:
-                # if not, guess for all arguments
-                arg_format_list = ["g" for i in range(len(fields[1:]))]
+            fields, message_time = msg
+            cmd_name, received = self._decode(fields,arg_formats)
+            batch.append((cmd_name,received,message_time))
+
+        return batch
+
+    def _next_fields(self,deadline=None):
+        """
+        Fields of the next message and the time it arrived, reading from the
+        board until deadline (a time.monotonic() value; None waits up to the
+        serial timeout).  Unlike _read_fields, a partial message stays in the
+        buffer when time runs out.  Returns None if no message arrived in time.
+        """
+
+        if self._unsolicited:
+            return self._unsolicited.popleft()
+
+        return self._read_frame_fields(deadline)
+
+    def _read_frame_fields(self,deadline=None):
+        """
+        _next_fields straight from the board, skipping held back messages.
+        """
+
+        timed_out = False
+        while True:
+
+            frame = self._extract_frame()
+            if frame is not None:
+
+                # Empty message (e.g. a lone command separator)
+                if len(frame) == 0:
+                    continue
+
+                fields = self._frame_fields(frame)
+                if fields is None:
+                    continue
+
+                return fields, self._frame_time
+
+            if timed_out:
+                return None
+
+            if deadline is None:
+                chunk = self.board.read_available()
+            else:
+                remaining = max(deadline - time.monotonic(),0)
+                chunk = self.board.read_available(min(remaining,self.board.timeout))
 
-        # Deal with "*" format  
-        arg_format_list = self._treat_star_format(arg_format_list,fields[1:])
+                # Checked after every read, not just empty ones: a port that
+                # streams without ever sending a command separator never
+                # goes quiet
+                timed_out = time.monotonic() >= deadline
 
-        if len(fields[1:]) > 0:
-            if len(arg_format_list) != len(fields[1:]):
-                err = "Number of argument formats must match the number of received arguments."
+            if len(chunk) == 0:
+                if deadline is None:
+                    return None
+                continue
+
+            self._buffer_chunk(chunk)
+
+    def _command_prefixes(self,commands):
+        """
+        Set of command id fields (bytes) for command names, or None if
+        commands is None.
+        """
+
+        if commands is None:
+            return None
+
+        prefixes = set()
+        for cmd in commands:
+            try:
+                prefixes.add(self._codecs[cmd].prefix)
+            except KeyError:
+                err = "Command '{}' not recognized.\n".format(cmd)
                 raise ValueError(err)
 
-        received = []
-        for i, f in enumerate(fields[1:]):
-            received.append(self._recv_methods[arg_format_list[i]](f))
-        
-        # Record the time the message arrived
-        message_time = time.time()
+        return prefixes
 
-        return cmd_name, received, message_time
-    
     def query(self,cmd,*args, **kwargs):
         """
         Send a command (which may or may not have associated arguments) to an 
         arduino using the CmdMessage protocol and check for a response.  The command and any parameters
         should be passed as direct arguments to send.
+
+        If the command was declared with a reply command, query waits for
+        that reply, returning None if it does not arrive within timeout
+        seconds (a keyword argument, defaulting to the board timeout) however
+        much other traffic arrives.  Other messages that show up in the
+        meantime are held for later receive() calls rather than returned as
+        the reply.
+        """
+
+        timeout = kwargs.pop("timeout",self.board.timeout)
+
+        if cmd not in self._cmd_name_to_response:
+            self.send(cmd,*args,**kwargs)
+            return self.receive()
+
+        future = self._expect_reply(cmd)
+        try:
+            self.send(cmd,*args,**kwargs)
+        except Exception:
+            self._correlator.discard([future])
+            raise
+
+        return self._gather_replies([future],timeout)[0]
+
+    def query_many(self,queries,max_chunk_size=None,timeout=None):
+        """
+        Send a batch of queries (a list of (cmd, args) pairs) in one write and
+        then gather the replies, so the whole batch costs about one round trip.
+        Replies are matched to queries by their reply command, first in, first
+        out.  Returns the replies in the same order as queries, with None for
+        any that did not arrive within timeout seconds (default: the board
+        timeout).  See send_many for max_chunk_size.
+        """
+
+        futures = [self._expect_reply(cmd) for cmd, args in queries]
+        try:
+            self.send_many(queries,max_chunk_size)
+        except Exception:
+            self._correlator.discard(futures)
+            raise
+
+        return self._gather_replies(futures,timeout)
+
+    def _expect_reply(self,cmd):
+        """
+        Register a query for cmd and return the future its reply will land in.
+        Commands without a declared reply take the next unclaimed message.
+        """
+
+        if cmd not in self._cmd_name_to_int:
+            err = "Command '{}' not recognized.\n".format(cmd)
+            raise ValueError(err)
+
+        return self._correlator.expect(self._cmd_name_to_response.get(cmd),
+                                       concurrent.futures.Future())
+
+    def _gather_replies(self,futures,timeout=None):
+        """
+        Read messages until every future has its reply or timeout seconds
+        (default: the board timeout) have passed.  Anything that is not a
+        reply is held for receive(); a partial message stays buffered.
+        """
+
+        if timeout is None:
+            timeout = self.board.timeout
+        deadline = time.monotonic() + timeout
+
+        try:
+            while not all([f.done() for f in futures]):
+
+                # Checked here too: a steady stream of other messages never
+                # lets the read itself time out
+                if time.monotonic() >= deadline:
+                    break
+
+                msg = self._read_frame_fields(deadline)
+                if msg is None:
+                    break
+
+                fields, message_time = msg
+                if not self._resolve_reply(fields,message_time):
+                    self._hold(fields,message_time)
+        finally:
+            self._correlator.discard(futures)
+
+        return [f.result() if f.done() else None for f in futures]
+
+    def _hold(self,fields,message_time):
+        """
+        Keep a message that arrived during a query for receive(), dropping the
+        oldest held message if max_unsolicited are already waiting.
+        """
+
+        if len(self._unsolicited) >= self.max_unsolicited:
+            self._unsolicited.popleft()
+            self.dropped_unsolicited += 1
+
+        self._unsolicited.append((fields,message_time))
+
+    def _resolve_reply(self,fields,message_time):
+        """
+        If a query is waiting on this message, decode it and hand it over.
+        Returns True if a query took the message.
         """
-        self.send(cmd,*args,**kwargs)
-        return self.receive()
+
+        if not self._correlator.has_pending():
+            return False
+
+        cmd_name = self._command_name(fields[0])
+        if not self._correlator.expects(cmd_name):
+            return False
+
+        received = self._decode_args(self._get_codec(cmd_name),fields)
+
+        return self._correlator.resolve(cmd_name,(cmd_name,received,message_time))
 
     def _treat_star_format(self,arg_format_list,args):
         """
@@ -330,6 +612,589 @@ class CmdMessenger:
 
         return arg_format_list 
 
+    def _get_codec(self,cmd_name,arg_formats=None):
+        """
+        Return the codec for a command, compiling (and caching) a new one if
+        arg_formats overrides the formats specified on initialization.
+        """
+
+        if arg_formats is None:
+            try:
+                return self._codecs[cmd_name]
+            except KeyError:
+                # if not, guess for all arguments
+                return self._guess_codec
+
+        key = (cmd_name,"".join(arg_formats))
+        try:
+            return self._override_codecs[key]
+        except KeyError:
+            pass
+
+        codec = CommandCodec(self,self._cmd_name_to_int.get(cmd_name),key[1])
+        self._override_codecs[key] = codec
+
+        return codec
+
+    def _encode(self,cmd,args,arg_formats=None):
+        """
+        Turn a command and its arguments into the escaped bytes that are
+        written to the serial port (something like cmd,field1,field2;).
+        """
+
+        # Turn the command into an integer.
+        if cmd not in self._cmd_name_to_int:
+            err = "Command '{}' not recognized.\n".format(cmd)
+            raise ValueError(err)
+
+        codec = self._get_codec(cmd,arg_formats)
+
+        # Create a bytes representation of each argument in the proper format
+        # to send.
+        return self._compile_message(codec.prefix,codec.encode(args))
+
+    def _compile_batch(self,commands,max_chunk_size=None):
+        """
+        Encode a list of (cmd, args) pairs.  Returns the bytes to write (as a
+        list of chunks no bigger than max_chunk_size) and the number of bytes
+        in each message.
+        """
+
+        messages = [self._encode(cmd,args) for cmd, args in commands]
+        num_bytes = [len(m) for m in messages]
+
+        if max_chunk_size is None:
+            return [b"".join(messages)], num_bytes
+
+        if max_chunk_size < 1:
+            err = "max_chunk_size must be at least 1."
+            raise ValueError(err)
+
+        chunks = []
+        current = bytearray()
+        for m in messages:
+
+            if len(current) + len(m) > max_chunk_size and len(current) > 0:
+                chunks.append(bytes(current))
+                current = bytearray()
+
+            # A message bigger than a whole chunk has to be split
+            while len(m) > max_chunk_size:
+                chunks.append(m[:max_chunk_size])
+                m = m[max_chunk_size:]
+
+            current += m
+
+        if len(current) > 0:
+            chunks.append(bytes(current))
+
+        return chunks, num_bytes
+
+    def _compile_message(self,prefix,fields):
+        """
+        Escape appropriate characters in each (binary) field and assemble the
+        message.  Binary values rarely contain separators, escapes or NULs, so
+        look for any of them across all fields in one pass and skip escaping
+        entirely if there are none.  The message is counted as sent in
+        metrics.
+        """
+
+        num_escapes = 0
+        unescaped = b"".join(fields)
+        if self._escape_re.search(unescaped) is not None:
+            fields = [self._escape_field(f) for f in fields]
+            num_escapes = sum([len(f) for f in fields]) - len(unescaped)
+
+        # Make something that looks like cmd,field1,field2,field3;
+        msg = self._byte_field_sep.join([prefix] + fields)
+        if self.crc:
+            crc_field = self._crc_field(msg)
+            num_escapes += len(crc_field) - 2
+            msg += self._byte_field_sep + crc_field
+
+        msg += self._byte_command_sep
+        self.metrics.count_sent(prefix,len(msg),num_escapes)
+
+        return msg
+
+    def _crc_field(self,msg):
+        """
+        Escaped CRC16 (XModem) of msg, as a two byte little-endian field.
+        """
+
+        field = struct.pack("<H",binascii.crc_hqx(msg,0))
+        if self._escape_re.search(field) is not None:
+            field = self._escape_field(field)
+
+        return field
+
+    def _escape_field(self,value):
+        """
+        Put an escape character in front of every separator, escape character
+        and NUL in value.  The escape character has to be done first.
+        """
+
+        esc = self._byte_escape_sep
+
+        value = value.replace(esc,esc + esc)
+        value = value.replace(self._byte_field_sep,esc + self._byte_field_sep)
+        value = value.replace(self._byte_command_sep,esc + self._byte_command_sep)
+
+        return value.replace(b"\0",esc + b"\0")
+
+    def _decode(self,fields,arg_formats=None):
+        """
+        Turn the unescaped fields of a received message into a command name and
+        a list of python values.
+        """
+
+        try:
+            if type(fields) is FrameFields:
+                cmd_name = self._command_name(fields.command)
+                received = self._get_codec(cmd_name,arg_formats).decode_frame(fields)
+            else:
+                cmd_name = self._command_name(fields[0])
+                received = self._get_codec(cmd_name,arg_formats).decode(fields[1:])
+        except (ValueError,struct.error):
+            self.metrics.count_error("decode")
+            raise
+
+        return cmd_name, received
+
+    def _decode_counted(self,fields,arg_formats=None):
+        """
+        _decode for the readers that cannot raise to a caller: a message that
+        cannot be decoded is counted as corrupted and None is returned.
+        """
+
+        try:
+            return self._decode(fields,arg_formats)
+        except (ValueError,KeyError,IndexError,struct.error) as e:
+            self._count_corrupted("Could not decode message {}: {}".format(fields,e))
+            return None
+
+    def _decode_args(self,codec,fields):
+        """
+        Decode the arguments (everything after the command id) of fields,
+        either FrameFields or a list of bytes.
+        """
+
+        try:
+            if type(fields) is FrameFields:
+                return codec.decode_frame(fields)
+            return codec.decode(fields[1:])
+        except (ValueError,struct.error):
+            self.metrics.count_error("decode")
+            raise
+
+    def _command_name(self,field):
+        """
+        Get the command name from the first field of a received message.
+        """
+
+        # Usually the id arrives exactly as we would send it
+        try:
+            return self._prefix_to_cmd_name[field]
+        except KeyError:
+            pass
+
+        cmd_name = self._find_command_name(field)
+        if cmd_name is None:
+            cmd_name = "unknown"
+            if self.give_warnings:
+                w = "Recieved unrecognized command ({}).".format(field.strip().decode("ascii","replace"))
+                warnings.warn(w,Warning)
+
+        return cmd_name
+
+    def _find_command_name(self,field):
+        """
+        Command name for a command id field, or None if it is not recognized.
+        """
+
+        try:
+            return self._prefix_to_cmd_name[field]
+        except KeyError:
+            pass
+
+        try:
+            return self._int_to_cmd_name[int(field)]
+        except (ValueError,KeyError):
+            return None
+
+    def _decode_array(self,fields,arg_formats=None):
+        """
+        Like _decode, but the repeated fields of a "*" format are decoded
+        straight into one numpy array with np.frombuffer.
+        """
+
+        cmd_name = self._command_name(fields[0])
+
+        codec = self._get_codec(cmd_name,arg_formats)
+        if codec.arg_formats is None or codec.arg_formats[-1:] != "*":
+            return cmd_name, self._decode_args(codec,fields)
+
+        num_leading = len(codec.arg_formats) - 2
+        leading_formats = codec.arg_formats[:num_leading]
+        received = self._get_codec(cmd_name,leading_formats).decode(fields[1:num_leading+1])
+
+        dtype = numpy_dtype(self.board,codec.arg_formats[-2])
+        first = num_leading + 1
+
+        if type(fields) is FrameFields:
+            lengths = fields.lengths[first:]
+        else:
+            lengths = [len(v) for v in fields[first:]]
+
+        for length in lengths:
+            if length != dtype.itemsize:
+                self.metrics.count_error("decode")
+                err = "Received {} byte value for a {} byte '{}' array.".format(length,
+                                                                              dtype.itemsize,
+                                                                              codec.arg_formats[-2])
+                raise ValueError(err)
+
+        if type(fields) is FrameFields:
+
+            # Values sit one separator apart in the buffer: read them with a
+            # strided view and copy once into a contiguous array
+            num_values = len(lengths)
+            if num_values == 0:
+                values = np.zeros(0,dtype=dtype)
+            else:
+                values = np.ndarray((num_values,),dtype=dtype,
+                                    buffer=fields.buffer,
+                                    offset=fields.starts[first],
+                                    strides=(dtype.itemsize + 1,)).copy()
+        else:
+            values = np.frombuffer(b"".join(fields[first:]),dtype=dtype)
+
+        received.append(values)
+
+        return cmd_name, received
+
+    def _pack_array(self,values,arg_format):
+        """
+        Range check and pack an array of values in one numpy call, returning
+        one (unescaped) bytes field per value.
+        """
+
+        dtype = numpy_dtype(self.board,arg_format)
+        values = np.asarray(values).ravel()
+
+        if arg_format in "fd":
+            value_min, value_max = self.board.float_min, self.board.float_max
+        elif arg_format == "?":
+            value_min, value_max = 0, 1
+            if np.any((values != 0) & (values != 1)):
+                err = "{} is not boolean.".format(values)
+                raise ValueError(err)
+        elif arg_format == "b":
+            value_min, value_max = 0, 255
+        else:
+            bounds = {"i":(self.board.int_min,self.board.int_max),
+                      "I":(self.board.unsigned_int_min,self.board.unsigned_int_max),
+                      "l":(self.board.long_min,self.board.long_max),
+                      "L":(self.board.unsigned_long_min,self.board.unsigned_long_max)}
+            value_min, value_max = bounds[arg_format]
+
+            # Coerce to int, like _send_int and friends do
+            if values.dtype.kind not in "iub":
+                new_values = np.trunc(values.astype(np.float64))
+                if self.give_warnings:
+                    w = "Coercing {} into int ({})".format(values,new_values)
+                    warnings.warn(w,Warning)
+                values = new_values
+
+        # Range check
+        if len(values) > 0 and (values.max() > value_max or values.min() < value_min):
+            err = "Value in array exceeds the size of the board's '{}' type.".format(arg_format)
+            raise OverflowError(err)
+
+        packed = values.astype(dtype).tobytes()
+        size = dtype.itemsize
+
+        return [packed[i:i+size] for i in range(0,len(packed),size)]
+
+    def _read_fields(self):
+        """
+        Read from the board until a complete message is buffered, then split it
+        into unescaped fields.  Returns None if nothing (or only white space)
+        arrived before the serial timeout.  Any bytes that arrive after the
+        message stay in the receive buffer for the next call.
+        """
+
+        while True:
+
+            frame = self._extract_frame()
+            if frame is not None:
+
+                # Empty message (e.g. a lone command separator)
+                if len(frame) == 0:
+                    return None
+
+                fields = self._frame_fields(frame)
+                if fields is None:
+                    continue
+
+                return fields
+
+            chunk = self.board.read_available()
+            if len(chunk) == 0:
+                break
+
+            self._buffer_chunk(chunk)
+
+        # Timed out before seeing a command separator.  Throw away whatever
+        # partial message we have.
+        raw_msg = bytes(self._receive_buffer)
+        del self._receive_buffer[:]
+        self._receive_scan = 0
+        self._receive_offset += len(raw_msg)
+        self._receive_times.clear()
+
+        # No message (or only line endings) received given timeouts
+        if raw_msg.strip() == b'':
+            self.metrics.count_timeout("receive")
+            return None
+
+        self.metrics.count_error("incomplete")
+        err = "Incomplete message ({})".format(raw_msg.decode())
+        raise EOFError(err)
+
+    def _frames_from_chunk(self,chunk):
+        """
+        Add bytes just read off the serial port to the receive buffer and
+        yield (fields, message_time) for every complete message now in it.
+        This is the frame loop shared by the readers that are handed their
+        bytes (CmdMessengerThreaded, AsyncCmdMessenger and MessengerHub).
+        Empty messages and messages failing their CRC are skipped.  Replies
+        to pending queries go to the query rather than being yielded; a reply
+        that cannot be decoded is counted as corrupted and skipped.
+        """
+
+        self._buffer_chunk(chunk)
+        while True:
+
+            frame = self._extract_frame()
+            if frame is None:
+                return
+            message_time = self._frame_time
+
+            # Empty message (e.g. a lone command separator)
+            if len(frame) == 0:
+                continue
+
+            fields = self._frame_fields(frame)
+            if fields is None:
+                continue
+
+            try:
+                if self._resolve_reply(fields,message_time):
+                    continue
+            except (ValueError,KeyError,IndexError,struct.error) as e:
+                self._count_corrupted("Could not decode message {}: {}".format(fields,e))
+                continue
+
+            yield fields, message_time
+
+    def _buffer_chunk(self,chunk):
+        """
+        Add bytes just read off the serial port to the receive buffer, noting
+        when they arrived.
+        """
+
+        self._receive_times.append((self._receive_offset + len(self._receive_buffer),
+                                    time.perf_counter()))
+        self._receive_buffer += chunk
+
+    def _extract_frame(self):
+        """
+        Pop the first complete message (without its command separator) off of
+        the receive buffer.  Returns None if the buffer does not yet hold a
+        complete message.  _frame_time is set to when the first byte of the
+        message was read.
+        """
+
+        buf = self._receive_buffer
+
+        end = self._find_unescaped(buf,self._byte_command_sep,self._receive_scan)
+        if end < 0:
+            self._receive_scan = len(buf)
+            return None
+
+        # Chunks read before the one holding the first byte are done with
+        times = self._receive_times
+        while len(times) > 1 and times[1][0] <= self._receive_offset:
+            times.popleft()
+
+        if len(times) > 0:
+            self._frame_time = times[0][1] + self._clock_offset
+        else:
+            self._frame_time = self.clock()
+
+        frame = bytes(buf[:end])
+        del buf[:end+1]
+        self._receive_scan = 0
+        self._receive_offset += end + 1
+
+        return frame
+
+    def _find_unescaped(self,buf,sep,start=0):
+        """
+        Find the first separator in buf (at or after start) that is not escaped.
+        A separator is escaped if it is preceded by an odd number of escape
+        characters.  Returns -1 if there is no such separator.
+        """
+
+        esc = self._byte_escape_sep[0]
+
+        pos = buf.find(sep,start)
+        while pos >= 0:
+
+            i = pos - 1
+            while i >= 0 and buf[i] == esc:
+                i -= 1
+
+            if (pos - 1 - i) % 2 == 0:
+                return pos
+
+            pos = buf.find(sep,pos + 1)
+
+        return -1
+
+    def _frame_fields(self,frame):
+        """
+        Count a received message (without its command separator) and split it
+        into unescaped fields.  In crc mode, the CRC field is checked and
+        removed first; if it does not match, the message is counted as
+        corrupted and None is returned.  The message is counted in metrics.
+        """
+
+        self._num_received += 1
+        num_bytes = len(frame) + 1
+
+        if self.crc:
+            body = self._check_crc(frame)
+            if body is None:
+                self._num_crc_errors += 1
+                self.metrics.count_received(None,num_bytes)
+                self.metrics.count_error("crc")
+                self._count_corrupted("CRC mismatch in message {}".format(frame))
+                return None
+            frame = body
+
+        self.corrupted_cmds = 100.0*self._num_corrupted/self._num_received
+
+        fields = self._split_frame(frame)
+        self.metrics.count_received(fields.command,num_bytes,
+                                    len(frame) - len(fields.buffer))
+
+        return fields
+
+    def _check_crc(self,frame):
+        """
+        Check the CRC field at the end of frame.  The CRC covers the escaped
+        bytes from the command id up to (not including) the last unescaped
+        field separator.  Returns the frame without the CRC field, or None if
+        the CRC is missing or does not match.
+        """
+
+        # Line endings from an arduino that calls printLfCr are not covered
+        if frame[:1].isspace():
+            frame = frame.lstrip()
+
+        sep = self._byte_field_sep[0]
+        esc = self._byte_escape_sep[0]
+
+        # Usually the CRC needed no escaping: ...,xy
+        if len(frame) > 3 and frame[-3] == sep and frame[-2] != esc and \
+           frame[-4] != esc:
+            body = frame[:-3]
+            received = frame[-2] | (frame[-1] << 8)
+        else:
+            pos = self._find_last_unescaped(frame,self._byte_field_sep)
+            if pos < 0:
+                return None
+
+            body = frame[:pos]
+            trailer = self._unescape_re.sub(b"\\1",frame[pos+1:])
+            if len(trailer) != 2:
+                return None
+            received = trailer[0] | (trailer[1] << 8)
+
+        if received != binascii.crc_hqx(body,0):
+            return None
+
+        return body
+
+    def _count_corrupted(self,reason):
+        """
+        Record a received message that could not be used.
+        """
+
+        self._num_corrupted += 1
+        self.corrupted_cmds = 100.0*self._num_corrupted/self._num_received
+
+        if self.give_warnings:
+            warnings.warn(reason,Warning)
+
+    def corruption_stats(self):
+        """
+        Counts of messages received and of messages thrown away as corrupted
+        (failed CRC checks, plus messages CmdMessengerThreaded could not
+        decode), with the percentage corrupted.
+        """
+
+        return {"received":self._num_received,
+                "corrupted":self._num_corrupted,
+                "crc_errors":self._num_crc_errors,
+                "percent_corrupted":self.corrupted_cmds}
+
+    def _find_last_unescaped(self,buf,sep):
+        """
+        Find the last separator in buf that is not escaped.  Returns -1 if
+        there is no such separator.
+        """
+
+        esc = self._byte_escape_sep[0]
+
+        pos = buf.rfind(sep)
+        while pos >= 0:
+
+            i = pos - 1
+            while i >= 0 and buf[i] == esc:
+                i -= 1
+
+            if (pos - 1 - i) % 2 == 0:
+                return pos
+
+            pos = buf.rfind(sep,0,pos)
+
+        return -1
+
+    def _split_frame(self,frame):
+        """
+        Turn a message (without its command separator) into FrameFields.  A
+        message without escape characters is used as is.  Otherwise it is
+        unescaped in one pass, plus a second pass that marks where the real
+        field separators are.
+        """
+
+        if self._byte_escape_sep not in frame:
+            return FrameFields(frame,self._byte_field_sep)
+
+        # Splitting on escapes gives the text between them and the escaped
+        # characters in turn, so joining the pieces unescapes the message.
+        # (This stays in C; a "\\1" substitution template does not.)  Joining
+        # just the text with a stand-in for each escaped character gives the
+        # layout.
+        pieces = self._unescape_re.split(frame)
+        buffer = b"".join(pieces)
+        layout = b"\0".join(pieces[::2])
+
+        return FrameFields(buffer,self._byte_field_sep,layout)
+
     def _send_char(self,value):
         """
         Convert a single char to a bytes object.
@@ -0,0 +1,355 @@
+__description__ = \
+"""
+asyncio version of CmdMessenger.  Reading is driven by the event loop watching
+the serial file descriptor, so no threads are needed and nothing blocks.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import asyncio, errno, os
+
+from .PyCmdMessenger import CmdMessenger
+
+class AsyncCmdMessenger(CmdMessenger):
+    """
+    Interface for talking to an arduino running the CmdMessenger library from
+    asyncio code.  Uses the same command tables, formats and codecs as
+    CmdMessenger:
+
+        c = AsyncCmdMessenger(board,commands)
+        await c.send("who_are_you")
+        msg = await c.receive()
+        msg = await c.query("sum_two_ints",2,3)
+        async for cmd_name, received, message_time in c:
+            ...
+
+    The event loop reads the board's serial file descriptor directly (via
+    loop.add_reader), so this requires a POSIX serial port (or pty).
+    """
+
+    def __init__(self,
+                 board_instance,
+                 commands,
+                 field_separator=",",
+                 command_separator=";",
+                 escape_separator="/",
+                 warnings=True,
+                 crc=False):
+        """
+        Input:
+            board_instance:
+                instance of ArduinoBoard initialized with correct serial
+                connection (points to correct serial with correct baud rate) and
+                correct board parameters (float bytes, etc.)
+
+            commands:
+                a list or tuple of commands specified in the arduino .ino file
+                *in the same order* they are listed there.  commands should be
+                a list of lists, where the first element in the list specifies
+                the command name and the second the formats for the arguments.
+                (e.g. commands = [["who_are_you",""],["my_name_is","s"]])
+                An optional third element names the command the arduino sends
+                back in reply (e.g. ["who_are_you","","my_name_is"]).
+
+            field_separator:
+                character that separates fields within a message
+                Default: ","
+
+            command_separator:
+                character that separates messages (commands) from each other
+                Default: ";"
+
+            escape_separator:
+                escape character to allow separators within messages.
+                Default: "/"
+
+            warnings:
+                warnings for user
+                Default: True
+
+            crc:
+                add and check a CRC16 field on every message (see
+                CmdMessenger)
+                Default: False
+
+        The event loop starts watching the serial port the first time the
+        messenger is used from a coroutine.
+        """
+
+        CmdMessenger.__init__(self,board_instance,commands,field_separator,
+                              command_separator,escape_separator,warnings,crc)
+
+        self._fd = self.board.comm.fileno()
+        self._loop = None
+        self._messages = None
+        self._write_lock = None
+        self._closed = False
+        self._error = None
+
+    def _start_reading(self):
+        """
+        Hook the serial file descriptor into the running event loop.
+        """
+
+        if self._loop is not None:
+            return
+
+        if self._closed:
+            err = "messenger is closed"
+            raise RuntimeError(err)
+
+        self._loop = asyncio.get_running_loop()
+        self._messages = asyncio.Queue()
+        self._write_lock = asyncio.Lock()
+        self._loop.add_reader(self._fd,self._on_readable)
+
+    def _on_readable(self):
+        """
+        Called by the event loop when the serial port has data.  Read all of it
+        in one go, then queue every complete message.
+        """
+
+        try:
+            chunk = os.read(self._fd,65536)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._connection_lost(e)
+            return
+
+        if len(chunk) == 0:
+            self._connection_lost(EOFError("serial port closed"))
+            return
+
+        self.board.log_read(chunk)
+        for fields, message_time in self._frames_from_chunk(chunk):
+            self._messages.put_nowait((fields,message_time))
+
+    def _connection_lost(self,exc):
+        """
+        Stop reading and wake up anyone waiting on a message.
+        """
+
+        self._error = exc
+        self._correlator.fail_all(exc)
+        self.close()
+
+    async def send(self,cmd,*args,**kwargs):
+        """
+        Send a command (which may or may not have associated arguments) to an
+        arduino using the CmdMessage protocol.  The command and any parameters
+        should be passed as direct arguments to send.
+
+        arg_formats can be passed as a keyword argument. arg_formats is an
+        optional string that specifies the formats to use for each argument
+        when passed to the arduino. If specified here, arg_formats supercedes
+        formats specified on initialization.
+        """
+
+        # Grab arg_formats from kwargs
+        arg_formats = kwargs.pop('arg_formats', None)
+        if kwargs:
+            raise TypeError("'send()' got unexpected keyword arguments: {}".format(', '.join(kwargs.keys())))
+
+        await self.write(self._encode(cmd,args,arg_formats))
+
+    async def send_array(self,cmd,*args):
+        """
+        Send a command with a "*" format whose last argument is a numpy array
+        of the repeated values (see CmdMessenger.send_array), without blocking
+        the event loop.
+        """
+
+        await self.write(self._encode_array(cmd,args))
+
+    async def send_many(self,commands,max_chunk_size=None):
+        """
+        Send a batch of (cmd, args) pairs in as few writes as possible.  Returns
+        a list with the number of bytes sent for each command.
+        """
+
+        chunks, num_bytes = self._compile_batch(commands,max_chunk_size)
+        for chunk in chunks:
+            await self.write(chunk)
+
+        return num_bytes
+
+    async def write(self,data):
+        """
+        Write bytes to the serial port without blocking the event loop.  Writes
+        from different tasks are never interleaved.
+        """
+
+        self._start_reading()
+
+        async with self._write_lock:
+
+            self.board.log_write(data)
+            data = memoryview(data)
+            while len(data) > 0:
+
+                try:
+                    num_written = os.write(self._fd,data)
+                except BlockingIOError:
+                    num_written = 0
+                except OSError as e:
+                    if e.errno != errno.EAGAIN:
+                        raise
+                    num_written = 0
+
+                data = data[num_written:]
+                if len(data) > 0:
+                    await self._writable()
+
+    def _writable(self):
+        """
+        Return a future that completes when the serial port can take more data.
+        """
+
+        future = self._loop.create_future()
+
+        def on_writable():
+            self._loop.remove_writer(self._fd)
+            if not future.done():
+                future.set_result(None)
+
+        self._loop.add_writer(self._fd,on_writable)
+
+        return future
+
+    async def receive(self,arg_formats=None,timeout=None):
+        """
+        Wait for the next message coming off the serial port and return it as
+        (cmd_name, received, message_time).  Returns None if timeout (seconds)
+        passes first.
+
+        arg_formats is an optimal keyword that specifies the formats to use to
+        parse incoming arguments.  If specified here, arg_formats supercedes
+        the formats specified on initialization.
+        """
+
+        self._start_reading()
+
+        try:
+            fields, message_time = await asyncio.wait_for(self._messages.get(),
+                                                          timeout)
+        except asyncio.TimeoutError:
+            self.metrics.count_timeout("receive")
+            return None
+
+        # Closing puts a None on the queue to wake up waiting receivers
+        if fields is None:
+            self._messages.put_nowait((None,None))
+            if self._error is not None:
+                raise self._error
+            return None
+
+        cmd_name, received = self._decode(fields,arg_formats)
+
+        return cmd_name, received, message_time
+
+    async def query(self,cmd,*args,**kwargs):
+        """
+        Send a command (which may or may not have associated arguments) to an
+        arduino and wait for the reply.  timeout can be passed as a keyword
+        argument; None is returned if it passes first.
+
+        If the command was declared with a reply command, the reply is matched
+        to this query, so any number of tasks can have queries in flight at
+        once and other messages still go to receive.  Otherwise the next
+        message that comes back is the reply.
+        """
+
+        timeout = kwargs.pop("timeout",None)
+
+        if cmd not in self._cmd_name_to_response:
+            await self.send(cmd,*args,**kwargs)
+            return await self.receive(timeout=timeout)
+
+        future = self._expect_async_reply(cmd)
+        try:
+            await self.send(cmd,*args,**kwargs)
+        except BaseException:
+            self._correlator.discard([future])
+            raise
+
+        return (await self._wait_replies([future],timeout))[0]
+
+    async def query_many(self,queries,max_chunk_size=None,timeout=None):
+        """
+        Send a batch of queries (a list of (cmd, args) pairs) in one write and
+        wait for the replies.  Returns the replies in the same order as
+        queries, with None for any that did not arrive within timeout.
+        """
+
+        futures = [self._expect_async_reply(cmd) for cmd, args in queries]
+        try:
+            await self.send_many(queries,max_chunk_size)
+        except BaseException:
+            self._correlator.discard(futures)
+            raise
+
+        return await self._wait_replies(futures,timeout)
+
+    def _expect_async_reply(self,cmd):
+        """
+        Register a query for cmd and return the asyncio future its reply will
+        land in.
+        """
+
+        self._start_reading()
+
+        if cmd not in self._cmd_name_to_int:
+            err = "Command '{}' not recognized.\n".format(cmd)
+            raise ValueError(err)
+
+        return self._correlator.expect(self._cmd_name_to_response.get(cmd),
+                                       self._loop.create_future())
+
+    async def _wait_replies(self,futures,timeout):
+        """
+        Wait up to timeout seconds for the futures, then stop waiting on any
+        that are left.
+        """
+
+        try:
+            await asyncio.wait(futures,timeout=timeout)
+        finally:
+            self._correlator.discard(futures)
+
+        return [f.result() if f.done() else None for f in futures]
+
+    def close(self):
+        """
+        Stop watching the serial port.  Anything already received can still be
+        read; after that, receive returns None (or raises the error if the
+        connection was lost) and iteration stops.  The board itself is left
+        open.
+        """
+
+        if self._closed:
+            return
+
+        self._closed = True
+        if self._loop is not None:
+            self._loop.remove_reader(self._fd)
+            self._messages.put_nowait((None,None))
+
+    def __aiter__(self):
+        self._start_reading()
+        return self
+
+    async def __anext__(self):
+
+        msg = await self.receive()
+        if msg is None:
+            raise StopAsyncIteration
+
+        return msg
+
+    async def __aenter__(self):
+        self._start_reading()
+        return self
+
+    async def __aexit__(self,exc_type,exc_val,exc_tb):
+        self.close()
@@ -9,14 +9,107 @@ __author__ = "Michael J. Harms, chrisgrosse"
 __date__ = "2017-09-25"
 
 
-import warnings, time
-import numpy as np
+import warnings, time, os, select, collections
+import concurrent.futures
 import struct
-from PyCmdMessenger import CmdMessenger
-from PyCRC.CRCCCITT import CRCCCITT as CRC
+from .PyCmdMessenger import CmdMessenger
+from .inbound import InboundQueue
+from .outbound import OutboundWriter
 #from serial.threaded import Packetizer
 import threading
 
+class _CommandHandler:
+    """
+    Callback registered for one command with CmdMessengerThreaded.on, plus the
+    queue of messages waiting for it and counters for how it is keeping up.
+    Messages for one command are handled one at a time, in order, even when
+    they run on a thread pool.
+    """
+
+    def __init__(self,cmd_name,callback,executor=None):
+
+        self.cmd_name = cmd_name
+        self.callback = callback
+        self.executor = executor
+
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._running = False
+
+        self.calls = 0
+        self.errors = 0
+        self.max_queue_depth = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def handle(self,cmd_name,received,message_time):
+        """
+        Called on the reader thread with a decoded message.
+        """
+
+        if self.executor is None:
+            self._call(cmd_name,received,message_time)
+            return
+
+        with self._lock:
+            self._pending.append((cmd_name,received,message_time))
+            if len(self._pending) > self.max_queue_depth:
+                self.max_queue_depth = len(self._pending)
+
+            # A drain is already running for this command; it will get to
+            # this message in turn
+            if self._running:
+                return
+            self._running = True
+
+        self.executor.submit(self._drain)
+
+    def _drain(self):
+        """
+        Handle queued messages in order until there are none left.
+        """
+
+        while True:
+            with self._lock:
+                if len(self._pending) == 0:
+                    self._running = False
+                    return
+                msg = self._pending.popleft()
+
+            self._call(*msg)
+
+    def _call(self,cmd_name,received,message_time):
+
+        start = time.perf_counter()
+        try:
+            self.callback(cmd_name,received,message_time)
+        except Exception as e:
+            self.errors += 1
+            w = "handler for {} raised {}: {}".format(cmd_name,type(e).__name__,e)
+            warnings.warn(w,Warning)
+        elapsed = time.perf_counter() - start
+
+        self.calls += 1
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+
+    def stats(self):
+
+        if self.calls > 0:
+            mean_time = self.total_time/self.calls
+        else:
+            mean_time = 0.0
+
+        return {"calls":self.calls,
+                "errors":self.errors,
+                "queue_depth":len(self._pending),
+                "max_queue_depth":self.max_queue_depth,
+                "total_time":self.total_time,
+                "mean_time":mean_time,
+                "max_time":self.max_time}
+
+
 class CmdMessengerThreaded(CmdMessenger, threading.Thread):
     """
     Basic interface for interfacing over a serial connection to an arduino
@@ -30,7 +123,8 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
                  field_separator=",",
                  command_separator=";",
                  escape_separator="/",
-                 warnings=True):
+                 warnings=True,
+                 crc=False):
         """
         Input:
             board_instance:
@@ -44,6 +138,8 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
                 a list of lists, where the first element in the list specifies
                 the command name and the second the formats for the arguments.
                 (e.g. commands = [["who_are_you",""],["my_name_is","s"]])
+                An optional third element names the command the arduino sends
+                back in reply (e.g. ["who_are_you","","my_name_is"]).
 
             field_separator:
                 character that separates fields within a message
@@ -61,6 +157,11 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
                 warnings for user
                 Default: True
 
+            crc:
+                add and check a CRC16 field on every message (see
+                CmdMessenger)
+                Default: False
+
             The separators and escape_separator should match what's
             in the arduino code that initializes the CmdMessenger.  The default
             separator values match the default values as of CmdMessenger 4.0.
@@ -69,7 +170,8 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
 #                                                 field_separator, command_separator,
 #                                                 escape_separator, warnings)
         CmdMessenger.__init__(self, board_instance, commands, field_separator,
-                              command_separator, escape_separator, warnings)
+                              command_separator, escape_separator, warnings,
+                              crc)
         threading.Thread.__init__(self)
         
         self.serial = board_instance.comm
@@ -77,7 +179,9 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
         self.alive = True
         self._lock = threading.Lock()
         self._made_connection = threading.Event()
-        self._buffer = []
+        self._queue = None
+        self._writer = None
+        self._command_priorities = {}
         self._num_bytes_check_value = 2
         self._num_bytes = {"c":1,
                            "b":1,
@@ -91,9 +195,24 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
                            "?":1}
         
         
+        # The reader sleeps in select() on the serial port's file descriptor;
+        # stop() wakes it through the pipe
+        try:
+            self._fd = self.serial.fileno()
+        except (AttributeError,OSError,ValueError):
+            self._fd = None
+        self._wake_read, self._wake_write = os.pipe()
+
         # start serial reading thread
         self._byte_field_sep=bytearray(self._byte_field_sep)
-        self.corrupted_cmds=0.00 # percentage of received commands that are corrupted
+
+        # Handlers registered with on(), indexed by command id
+        self._handlers = [None for c in self.commands]
+
+        # Telemetry tables messages go straight into (see record_to), keyed
+        # by the command id as it arrives
+        self._store = None
+        self._tables = {}
 
         # generate class factions for all Arduino commands
         for command in self.commands:
@@ -104,14 +223,28 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
 
     def stop(self):
         self.alive = False
+        if self._queue is not None:
+            self._queue.close()
+        try:
+            os.write(self._wake_write,b"x")
+        except OSError:
+            pass
         if hasattr(self.serial, 'cancel_read'):
             self.serial.cancel_read()
-        self.join(2)
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(2)
 
     def close(self):
+        if self._writer is not None:
+            self._writer.close()
         with self._lock:
             self.stop()
             self.serial.close()
+            for fd in [self._wake_read,self._wake_write]:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
 
     def connect(self):
         if self.alive:
@@ -133,7 +266,7 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
         self.close()
 
     def made_connection(self, transport):
-        print "connection made by PyCmdMessenger"
+        print("connection made by PyCmdMessenger")
 
 
     def lost_connection(self, exc):
@@ -142,10 +275,13 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
 
 
     def run(self, arg_formats=None):
-        num_cmd_rec=0
-        num_corr_cmd=0
-        _buffer = bytearray()
-        prev_command = []
+        """
+        Read messages until stop() is called and pass each one to
+        response_to_command.  The thread sleeps in select() on the serial port
+        (and a wake-up pipe, so stop() takes effect at once) and reads
+        everything that has arrived in one go, so an idle line costs no CPU.
+        """
+
         if not hasattr(self.serial, 'cancel_read'):
             self.serial.timeout = 1
         try:
@@ -155,126 +291,87 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
             self.lost_connection(e)
             self._made_connection.set()
             return
-        
+        self._made_connection.set()
+
         error = None
-        msg = [[]]
-        raw_msg = []
-        escaped = False  
-        command_sep_found = False 
-        
         while self.alive and self.serial.is_open:
-            while self.serial.in_waiting > 0:
+            try:
+                chunk = self._read_chunk()
+            except Exception as e:
+                error = e
+                break
+
+            if len(chunk) > 0:
+                self.board.log_read(chunk)
+                self._handle_chunk(chunk,arg_formats)
 
-                tmp = self.serial.read(1)
-                if tmp != "":    
-                    raw_msg.append(tmp)
-            
-                    if escaped:        
-                        # Either drop the escape character or, if this wasn't really
-                        # an escape, keep previous escape character and new character
-                        if tmp in self._escaped_characters:
-                            msg[-1].append(tmp)
-                            escaped = False
-                        else:
-                            msg[-1].append(self._byte_escape_sep)
-                            msg[-1].append(tmp)
-                            escaped = False
-                    else:
-                        # look for escape character
-                        if tmp == self._byte_escape_sep:
-                            escaped = True        
-                        # or field separator
-                        elif tmp == self._byte_field_sep:
-                            msg.append([])        
-                        # or command separator
-                        elif tmp == self._byte_command_sep:
-                            command_sep_found = True
-                        # okay, must be something
-                        else:
-                            msg[-1].append(tmp)                    
-                
-                if command_sep_found:                        
-                    command_sep_found = False 
-                    raw_command = msg
-                    
-                    # Turn message into fields (excluding crc value at the end)
-#                    rec_crc_value = b''.join(msg[-1])
-#                    fields = [b''.join(m) for m in msg[:-1]]
-                    fields = [b''.join(m) for m in msg]
-                    msg=[[]]
-                            
-                    # Get the command name.
-                    cmd = fields[0].strip().decode()
-                    try:
-                        cmd_name = self._int_to_cmd_name[int(cmd)]
-                    except (ValueError,IndexError):
-                        if self.give_warnings:
-                            cmd_name = "unknown"
-                            w = "Recieved unrecognized command ({}).".format(cmd)
-                            warnings.warn(w,Warning)                            
-                                
-                    # Figure out what formats to use for each argument.  
-                    arg_format_list = []
-                    if arg_formats != None:
-                        # The user specified formats
-                        arg_format_list = list(arg_formats)                        
-                    else:
-                        try:
-                            # See if class was initialized with a format for arguments to this
-                            # command
-                            arg_format_list = self._cmd_name_to_format[cmd_name]
-                        except KeyError:
-                            # if not, guess for all arguments
-                            arg_format_list = ["g" for i in range(len(fields[1:-2]))]
-                            
-                    # Deal with "*" format  
-                    arg_format_list = self._treat_star_format(arg_format_list,fields[1:-2])
-                    
-    #                print "fields:", fields
-    #                print "command name:", cmd_name
-                    
-                    # check correct length of command
-                    if len(fields[1:]) > 0:
-                        if len(arg_format_list) != len(fields[1:]): 
-                            print "fields:", fields
-                            print "previous command:", prev_command
-                            print "Number of argument formats must match the number of received arguments."
-#                            raise ValueError(err)              
-                    
-                    # get a byte value from 1-3 ASCII characters encoding the
-                    # command number to calculate the correct check value
-                    try:
-                        fields[0] = bytearray([np.uint8(str(fields[0]))])
-                    except:
-                        print "problem transforming command number to byte value. command:", fields[0]
-                                              
-                    # calculate CRC check value
-#                    crc = CRC(version='XModem').calculate(self._byte_field_sep.join(fields))
-#                    calc_crc_2bytes = struct.pack("<H", crc)
-                    
-    #                print "calculated crc value: _{}_".format(calc_crc_2bytes)
-    #                print "calculated crc value string: _{}_".format(str(calc_crc_2bytes))
-                            
-                   # compare received and calculated CRC value
-#                    if calc_crc_2bytes != rec_crc_value:
-#                        num_corr_cmd+=1
-#                        print "received corrupted commands", num_corr_cmd
-#                        print "raw command:", raw_command                   
-#                        print "calculated crc as 2 bytes: _{}_".format(calc_crc_2bytes)
-#                        print "calculated crc hex:", hex(crc)
-#                        print "percentage of corrupted commands:",self.corrupted_cmds
-#                    else: 
-                    received = []
-                    for i, f in enumerate(fields[1:]):
-                        received.append(self._recv_methods[arg_format_list[i]](f)) 
-                    # Record the time the message arrived
-                    message_time = time.time()
-                    prev_command = fields
-                    self.response_to_command(cmd_name, received, message_time)
-                        
-                                                
         self.alive = False
-        self.lost_connection(error)
+        if error is not None:
+            self.lost_connection(error)
+
+    def _read_chunk(self):
+        """
+        Wait for data and return all of it.  Returns an empty bytes object if
+        woken up by stop().
+        """
+
+        # No file descriptor to wait on (e.g. a loop:// url): fall back on a
+        # read with a timeout
+        if self._fd is None:
+            return self.serial.read(max(self.serial.in_waiting,1))
+
+        readable = select.select([self._fd,self._wake_read],[],[])[0]
+        if self._wake_read in readable:
+            return b""
+
+        try:
+            chunk = os.read(self._fd,65536)
+        except BlockingIOError:
+            return b""
+
+        if len(chunk) == 0:
+            err = "serial device disconnected"
+            raise EOFError(err)
+
+        return chunk
+
+    def _handle_chunk(self,chunk,arg_formats=None):
+        """
+        Split freshly read bytes into messages and dispatch them.  Messages
+        that cannot be decoded are counted (see corrupted_cmds) and skipped.
+        """
+
+        for fields, message_time in self._frames_from_chunk(chunk):
+
+            # Telemetry is copied into its table without being decoded
+            if self._tables:
+                table = self._tables.get(fields.command)
+                if table is not None and table.append_fields(fields,message_time):
+                    continue
+
+            msg = self._decode_counted(fields,arg_formats)
+            if msg is None:
+                continue
+            cmd_name, received = msg
+
+            if self._store is not None and cmd_name in self._store:
+                try:
+                    self._store.append(cmd_name,received,message_time)
+                except (ValueError,TypeError) as e:
+                    self._count_corrupted("Could not store message {}: {}".format(fields,e))
+                continue
+
+            try:
+                handler = self._handlers[self._cmd_name_to_int[cmd_name]]
+            except KeyError:
+                handler = None
+
+            if handler is not None:
+                handler.handle(cmd_name, received, message_time)
+            elif self._queue is not None:
+                self._queue.put(cmd_name,(cmd_name, received, message_time))
+            else:
+                self.response_to_command(cmd_name, received, message_time)
         
         
     def received_command(self, fields, arg_formats=None):
@@ -327,11 +424,10 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
                         fields[i+1]=self._byte_field_sep.join(fields[i+1:i+2])
 #                        print "binaray argument misinterpreted as field separator"
             elif len(arg_format_list) > len(fields[1:]):  
+                self.metrics.count_error("argument_count")
                 err = "Number of argument formats must match the number of received arguments."
                 err += " Function causing problem: "+cmd_name
-                print err
-                print " message causing probelm: "
-                print fields
+                err += " Message causing problem: {}".format(fields)
                 raise ValueError(err)
             else:
 #                print "fields as string:",fields
@@ -340,17 +436,219 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
                     received.append(self._recv_methods[arg_format_list[i]](str(f)))
              
                 # Record the time the message arrived
-                message_time = time.time()
+                message_time = self.clock()
                 self.response_to_command(cmd_name, received, message_time)
 
 
+    def on(self, cmd_name, callback, executor=None):
+        """
+        Call callback(cmd_name, received, message_time) for every cmd_name
+        message instead of response_to_command.  Pass callback=None to go back
+        to response_to_command.
+
+        By default the callback runs on the reader thread, so it should be
+        quick.  Slow callbacks (database inserts, etc.) should be given an
+        executor (e.g. a concurrent.futures.ThreadPoolExecutor) so serial
+        reading never waits on them.  Messages for one command are still
+        handled one at a time, in the order they arrived; different commands
+        can run in parallel.  See handler_stats for how handlers keep up.
+        """
+
+        try:
+            cmd_id = self._cmd_name_to_int[cmd_name]
+        except KeyError:
+            err = "Command '{}' not recognized.\n".format(cmd_name)
+            raise ValueError(err)
+
+        if callback is None:
+            self._handlers[cmd_id] = None
+        else:
+            self._handlers[cmd_id] = _CommandHandler(cmd_name,callback,executor)
+
+    def record_to(self, store):
+        """
+        Append the messages for the commands in store (a TelemetryStore) to
+        its tables instead of dispatching them.  Binary messages are copied
+        from the receive buffer into the tables without being decoded into
+        python objects.  Pass store=None to go back to dispatching them.
+        """
+
+        if store is None:
+            self._tables = {}
+            self._store = None
+            return
+
+        cmd_name_to_prefix = dict([(cmd_name,prefix) for prefix, cmd_name
+                                   in self._prefix_to_cmd_name.items()])
+
+        tables = {}
+        for cmd_name, table in store.tables.items():
+            tables[cmd_name_to_prefix[cmd_name]] = table
+
+        self._store = store
+        self._tables = tables
+
+    def enable_queue(self, maxsize=1000, policy="block", command_policies=None):
+        """
+        Collect messages in a bounded queue, to be read with get() at the
+        consumer's own pace, instead of passing them to response_to_command.
+        (Replies to queries and commands with an on() handler are not
+        queued.)
+
+        policy says what happens when the queue is full: "block" stops the
+        reader until there is room (nothing is lost, and the serial buffers
+        hold the arduino back), "drop_oldest" or "drop_newest" throw away a
+        message, and "conflate" keeps only the latest message per command.
+        command_policies overrides policy per command, e.g.
+        {"temperature":"conflate","alarm":"block"}.  Drops are counted per
+        command in dropped_messages().
+        """
+
+        self._queue = InboundQueue(maxsize,policy,command_policies)
+
+    def get(self, timeout=None):
+        """
+        Next (cmd_name, received, message_time) from the queue set up by
+        enable_queue, waiting up to timeout seconds (forever if None).
+        Returns None on timeout or once the messenger is stopped and the
+        queue is empty.
+        """
+
+        if self._queue is None:
+            err = "call enable_queue before get"
+            raise RuntimeError(err)
+
+        return self._queue.get(timeout)
+
+    def messages(self, timeout=None, commands=None):
+        """
+        Iterate over messages from the queue set up by enable_queue as they
+        arrive.  Stops once no message has arrived for timeout seconds (never,
+        if None) or the messenger is stopped.  If commands is given, only
+        those commands are yielded and the rest are skipped.
+        """
+
+        if commands is not None:
+            commands = set(commands)
+
+        while True:
+            msg = self.get(timeout)
+            if msg is None:
+                return
+            if commands is None or msg[0] in commands:
+                yield msg
+
+    def receive_many(self, max_count, deadline=None):
+        """
+        Up to max_count messages from the queue set up by enable_queue, as a
+        list.  Returns as soon as max_count messages are in or deadline
+        seconds have passed (None waits for all max_count).
+        """
+
+        if self._queue is None:
+            err = "call enable_queue before receive_many"
+            raise RuntimeError(err)
+
+        return self._queue.get_many(max_count,deadline)
+
+    def dropped_messages(self):
+        """
+        Number of messages the queue has dropped, keyed by command name.
+        """
+
+        if self._queue is None:
+            return {}
+
+        return dict(self._queue.dropped)
+
+    def handler_stats(self):
+        """
+        Counters for every handler registered with on(), keyed by command name:
+        calls, errors, queue_depth (messages waiting on the executor),
+        max_queue_depth, and total_time, mean_time and max_time spent in the
+        callback (seconds).  A growing queue_depth means the handler can't
+        keep up.
+        """
+
+        stats = {}
+        for handler in self._handlers:
+            if handler is not None:
+                stats[handler.cmd_name] = handler.stats()
+
+        return stats
+
     def response_to_command(self, cmd_name, msg, message_time):
         raise NotImplementedError("response_to_command needs to be overwritten by subclass!")
 
 
-    def write(self, data):
+    def enable_writer(self, linger=0.0, max_batch_bytes=4096,
+                      command_priorities=None):
+        """
+        Hand outgoing messages to a writer thread instead of writing them to
+        the serial port in send(), so send() returns without waiting on the
+        port or on other threads sending at the same time.  Messages that
+        arrive within linger seconds of each other (or while the previous
+        write is in progress) are merged into one write of at most
+        max_batch_bytes.  linger=0 adds no delay of its own, for latency
+        sensitive callers.  See writer_stats() for batch sizes and queue
+        latency, and flush() to wait until everything has gone out.
+
+        command_priorities gives commands a priority other than 0, e.g.
+        {"kEmergencyStop":10}; priority can also be passed to send().
+        Queued messages are written highest priority first, so an urgent
+        command jumps ahead of queued bulk traffic at the next write (it
+        still waits for the batch being written, so max_batch_bytes bounds
+        the wait).  Messages with a priority above 0 skip linger.
+        """
+
+        if command_priorities is None:
+            command_priorities = {}
+
+        for cmd_name in command_priorities:
+            if cmd_name not in self._cmd_name_to_int:
+                err = "Command '{}' not recognized.\n".format(cmd_name)
+                raise ValueError(err)
+
+        if self._writer is not None:
+            self._writer.close()
+
+        self._command_priorities = dict(command_priorities)
+        self._writer = OutboundWriter(self._locked_write,linger,max_batch_bytes)
+
+    def flush(self, timeout=None):
+        """
+        Wait up to timeout seconds (forever if None) until the writer thread
+        has written everything sent so far.  Returns True if it has (always,
+        without a writer thread).
+        """
+
+        if self._writer is None:
+            return True
+
+        return self._writer.flush(timeout)
+
+    def writer_stats(self):
+        """
+        Batch and queue latency counters for the writer thread set up by
+        enable_writer (see OutboundWriter.stats).
+        """
+
+        if self._writer is None:
+            return {}
+
+        return self._writer.stats()
+
+    def write(self, data, priority=0):
+        writer = self._writer
+        if writer is not None:
+            writer.put(data,priority)
+            return
+
+        self._locked_write(data)
+
+    def _locked_write(self, data):
         with self._lock:
-            self.serial.write(data)
+            self.board.write(data)
 
 
     def send(self,cmd,*args,**kwargs):
@@ -363,58 +661,146 @@ class CmdMessengerThreaded(CmdMessenger, threading.Thread):
         optional string that specifies the formats to use for each argument
         when passed to the arduino. If specified here, arg_formats supercedes
         formats specified on initialization.
-        """
 
-        # Turn the command into an integer.
-        try:
-            command_as_int = self._cmd_name_to_int[cmd]
-        except KeyError:
-            err = "Command '{}' not recognized.\n".format(cmd)
-            raise ValueError(err)
+        priority can be passed as a keyword argument to override the priority
+        of the command on the writer thread (see enable_writer).
+        """
 
-        # Grab arg_formats from kwargs
+        # Grab arg_formats and priority from kwargs
         arg_formats = kwargs.pop('arg_formats', None)
+        priority = kwargs.pop('priority', None)
+        if priority is None:
+            priority = self._command_priorities.get(cmd,0)
         if kwargs:
             raise TypeError("'send()' got unexpected keyword arguments: {}".format(', '.join(kwargs.keys())))
 
-        # Figure out what formats to use for each argument.
-        arg_format_list = []
-        if arg_formats != None:
+        compiled_bytes = self._encode(cmd,args,arg_formats)
 
-            # The user specified formats
-            arg_format_list = list(arg_formats)
+        # Send the message.
+        # Only part in this function that has changed to use new thread safe write() function
+        self.write(compiled_bytes,priority)
+
+    def send_array(self,cmd,*args,**kwargs):
+        """
+        Send a command with a "*" format whose last argument is a numpy array
+        of the repeated values (see CmdMessenger.send_array).  Like send, it
+        goes through write(), so it takes its turn on the writer thread.
+
+        priority can be passed as a keyword argument, as for send.
+        """
+
+        priority = kwargs.pop('priority', None)
+        if priority is None:
+            priority = self._command_priorities.get(cmd,0)
+        if kwargs:
+            raise TypeError("'send_array()' got unexpected keyword arguments: {}".format(', '.join(kwargs.keys())))
+
+        self.write(self._encode_array(cmd,args),priority)
 
+    def send_many(self,commands,max_chunk_size=None):
+        """
+        Send a batch of commands in as few serial writes as possible.  commands
+        is a list of (cmd, args) pairs.  max_chunk_size optionally limits the
+        number of bytes per write.  Returns a list with the number of bytes sent
+        for each command.
+
+        On the writer thread, the batch goes out at the highest priority of
+        its commands.  With max_chunk_size, the chunks are written one write
+        each, as a unit: they are not merged with other messages and nothing
+        else is written between them.
+        """
+
+        chunks, num_bytes = self._compile_batch(commands,max_chunk_size)
+
+        writer = self._writer
+        if writer is None:
+            for chunk in chunks:
+                self._locked_write(chunk)
+            return num_bytes
+
+        priority = max([self._command_priorities.get(cmd,0)
+                        for cmd, args in commands],default=0)
+        if max_chunk_size is None:
+            for chunk in chunks:
+                writer.put(chunk,priority)
         else:
-            try:
-                # See if class was initialized with a format for arguments to this
-                # command
-                arg_format_list = self._cmd_name_to_format[cmd]
-            except KeyError:
-                # if not, guess for all arguments
-                arg_format_list = ["g" for i in range(len(args))]
+            writer.put_chunks(chunks,priority)
 
-        # Deal with "*" format
-        arg_format_list = self._treat_star_format(arg_format_list,args)
+        return num_bytes
 
-        if len(args) > 0:
-            if len(arg_format_list) != len(args):
-                err = "Number of argument formats must match the number of arguments."
-                raise ValueError(err)
+    def query_async(self,cmd,*args,**kwargs):
+        """
+        Send a command and return a concurrent.futures.Future that completes
+        with the reply (cmd_name, received, message_time).  Any number of
+        queries can be in flight at once; replies are matched to queries by
+        the reply command declared in the command table, first in, first out.
+        The reply is not passed to response_to_command.
+
+        callback can be passed as a keyword argument and is called with the
+        reply when it arrives (on the reading thread, so keep it short).
+        """
 
-        # Go through each argument and create a bytes representation in the
-        # proper format to send.  Escape appropriate characters.
-        fields = ["{}".format(command_as_int).encode("ascii")]
-        for i, a in enumerate(args):
-            fields.append(self._send_methods[arg_format_list[i]](a))
-            fields[-1] = self._escape_re.sub(self._byte_escape_sep + r"\1".encode("ascii"),fields[-1])
+        callback = kwargs.pop("callback",None)
 
-        # Make something that looks like cmd,field1,field2,field3;
-        compiled_bytes = self._byte_field_sep.join(fields) + self._byte_command_sep
+        future = self._expect_reply(cmd)
+        if callback is not None:
+            def on_done(f):
+                if not f.cancelled() and f.exception() is None:
+                    callback(f.result())
+            future.add_done_callback(on_done)
 
-        # Send the message.
-        # Only part in this function that has changed to use new thread safe write() function
-        self.write(compiled_bytes)
+        try:
+            self.send(cmd,*args,**kwargs)
+        except Exception:
+            self._correlator.discard([future])
+            raise
+
+        return future
+
+    def query(self,cmd,*args,**kwargs):
+        """
+        Send a command and wait for its reply.  timeout (seconds) can be passed
+        as a keyword argument and defaults to the board timeout; None is
+        returned if it passes first.
+        """
+
+        timeout = kwargs.pop("timeout",self.board.timeout)
+        future = self.query_async(cmd,*args,**kwargs)
+
+        return self._wait_replies([future],timeout)[0]
+
+    def query_many(self,queries,max_chunk_size=None,timeout=None):
+        """
+        Send a batch of queries (a list of (cmd, args) pairs) in one write and
+        wait for the replies.  Returns the replies in the same order as
+        queries, with None for any that did not arrive within timeout
+        (default: the board timeout).
+        """
+
+        if timeout is None:
+            timeout = self.board.timeout
+
+        futures = [self._expect_reply(cmd) for cmd, args in queries]
+        try:
+            self.send_many(queries,max_chunk_size)
+        except Exception:
+            self._correlator.discard(futures)
+            raise
+
+        return self._wait_replies(futures,timeout)
+
+    def _wait_replies(self,futures,timeout):
+        """
+        Wait up to timeout seconds for the futures, then stop waiting on any
+        that are left.
+        """
+
+        try:
+            concurrent.futures.wait(futures,timeout)
+        finally:
+            self._correlator.discard(futures)
 
+        return [f.result() if f.done() else None for f in futures]
 
     
     # generates class functions for Arduino commands
@@ -5,10 +5,21 @@ library.
 """
 __author__ = "Michael J. Harms"
 __date__ = "2016-05-23"
-__all__ = ["PyCmdMessenger","PyCmdMessenger_threaded","arduino","arduino_due"]
+__all__ = ["PyCmdMessenger","PyCmdMessenger_threaded","PyCmdMessenger_async","arduino",
+           "arduino_due","emulator","clock","capture","replay",
+           "telemetry","hub","ingest","discovery"]
 
 from .PyCmdMessenger import CmdMessenger
 from .PyCmdMessenger_threaded import CmdMessengerThreaded
-from .arduino import ArduinoBoard
+from .PyCmdMessenger_async import AsyncCmdMessenger
+from .arduino import ArduinoBoard, open_boards
 from .arduino_due import ArduinoDueBoard
+from .emulator import ArduinoEmulator
+from .clock import ClockSync
+from .capture import CaptureWriter, read_capture
+from .replay import ReplayBoard
+from .telemetry import TelemetryStore, read_store
+from .hub import MessengerHub
+from .ingest import IngestPool
+from .discovery import discover
 
@@ -6,7 +6,8 @@ via USB.
 __author__ = "Michael J. Harms"
 __date__ = "2016-05-30"
 
-import serial, time
+import concurrent.futures, select, serial, time
+from .capture import CaptureWriter, READ, WRITE
 #from __future__ import print_function
 
 class ArduinoBoard(object):
@@ -26,12 +27,17 @@ class ArduinoBoard(object):
                  int_bytes=2,
                  long_bytes=4,
                  float_bytes=4,
-                 double_bytes=4):
+                 double_bytes=4,
+                 capture=None,
+                 ready_probe=None,
+                 ready_reply=None,
+                 ready_timeout=10.0,
+                 probe_interval=0.1):
 
         """
         Serial connection parameters:
             
-            device: serial device (e.g. /dev/ttyACM0)
+            device: serial device (e.g. /dev/ttyACM0) or pyserial url (e.g. loop://)
             baud_rate: baud rate set in the compiled sketch
             timeout: timeout for serial reading and writing
             settle_time: how long to wait before trying to access serial port
@@ -46,6 +52,19 @@ class ArduinoBoard(object):
         These can be looked up here:
             https://www.arduino.cc/en/Reference/HomePage (under data types)
 
+        Readiness (instead of sleeping settle_time):
+            ready_probe: bytes to send (e.g. b"0;", a command the sketch
+                         answers) every probe_interval seconds after opening
+                         until the sketch replies.  None to sleep settle_time.
+            ready_reply: bytes (e.g. b"1,") that must appear in what the sketch
+                         sends back.  None means any reply will do.
+            ready_timeout: seconds to wait for the reply before giving up
+            probe_interval: seconds between probes
+
+        Debugging:
+            capture: file to record every raw chunk read and written to, with
+                     timestamps (see start_capture).  None for no capture.
+
         The default parameters work for ATMega328p boards.
         Note that binary strings are passed as little-endian (which should
         work for all arduinos)
@@ -57,16 +76,27 @@ class ArduinoBoard(object):
         self.settle_time = settle_time
         self.enable_dtr = enable_dtr
 
+        self.ready_probe = ready_probe
+        self.ready_reply = ready_reply
+        self.ready_timeout = ready_timeout
+        self.probe_interval = probe_interval
+
         self.int_bytes = int_bytes
         self.long_bytes = long_bytes
         self.float_bytes = float_bytes
         self.double_bytes = double_bytes
         self.baud_rate = baud_rate
 
+        self.capture = None
+
         # Open up the serial port
         self._is_connected = False
+        self._fd = None
         self.open()
 
+        if capture is not None:
+            self.start_capture(capture)
+
 
         #----------------------------------------------------------------------
         # Figure out proper type limits given the board specifications
@@ -155,31 +185,207 @@ class ArduinoBoard(object):
 #            print("Connecting to arduino on {}... ".format(self.device),end="")
             print("Connecting to arduino on {}... ".format(self.device))
 
-            self.comm = serial.Serial()
-            self.comm.port = self.device
+            # serial_for_url handles plain device names as well as pyserial
+            # urls like loop:// or socket://host:port
+            self.comm = serial.serial_for_url(self.device,do_not_open=True)
             self.comm.baudrate = self.baud_rate
             self.comm.timeout = self.timeout
             self.dtr = self.enable_dtr
             self.comm.open()
 
-            time.sleep(self.settle_time)
+            # read_available waits for data in select() on this, so it never
+            # has to change comm.timeout.  Some urls (e.g. loop://) have none.
+            try:
+                self._fd = self.comm.fileno()
+            except (AttributeError,OSError,ValueError):
+                self._fd = None
+
+            if self.ready_probe is None:
+                time.sleep(self.settle_time)
+            else:
+                try:
+                    self.wait_ready()
+                except Exception:
+                    self.comm.close()
+                    raise
             self._is_connected = True
 
             print("done.")
 
+    def wait_ready(self,timeout=None):
+        """
+        Send ready_probe every probe_interval seconds until the sketch answers
+        (with ready_reply, if set), rather than sleeping a fixed settle_time
+        while the bootloader runs.  Once it has answered, replies to earlier
+        probes are read and thrown away so they do not reach the messenger.
+        Returns the number of seconds it took.  Raises RuntimeError if timeout
+        seconds (default ready_timeout) pass without an answer.
+        """
+
+        if self.ready_probe is None:
+            err = "wait_ready needs a ready_probe"
+            raise ValueError(err)
+
+        if timeout is None:
+            timeout = self.ready_timeout
+
+        start = time.perf_counter()
+        deadline = start + timeout
+        received = b""
+        while True:
+
+            now = time.perf_counter()
+            if now >= deadline:
+                err = "no answer to the ready probe from {} after {} s".format(self.device,timeout)
+                raise RuntimeError(err)
+
+            self.write(self.ready_probe)
+
+            next_probe = min(now + self.probe_interval,deadline)
+            while True:
+                remaining = next_probe - time.perf_counter()
+                if remaining <= 0:
+                    break
+
+                chunk = self.read_available(remaining)
+                if len(chunk) == 0:
+                    break
+
+                # Keep enough to find a reply split across reads
+                received = received[-256:] + chunk
+                if self.ready_reply is None or self.ready_reply in received:
+                    elapsed = time.perf_counter() - start
+                    self._drain_probe_replies()
+                    return elapsed
+
+    def _drain_probe_replies(self):
+        """
+        Throw away input until the port has been quiet for probe_interval, or
+        for at most three probe_intervals: replies to the last probes are in
+        by then, and a sketch that streams as soon as it boots never goes
+        quiet.
+        """
+
+        deadline = time.perf_counter() + 3*self.probe_interval
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            if len(self.read_available(min(self.probe_interval,remaining))) == 0:
+                break
+
+    def start_capture(self,path):
+        """
+        Record every raw chunk read from and written to the board, with
+        timestamps, to path (see capture.py).  The file is written by a
+        background thread so capturing does not slow down the serial I/O.  The
+        capture can be fed back into the decoder with ReplayBoard.
+        """
+
+        self.stop_capture()
+        self.capture = CaptureWriter(path,self)
+
+        return self.capture
+
+    def stop_capture(self):
+        """
+        Stop capturing and finish writing the capture file.
+        """
+
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+
+    def log_read(self,chunk):
+        """
+        Add a chunk read from the board outside of the board's read methods
+        (e.g. straight from the file descriptor) to the capture, if one is
+        running.
+        """
+
+        if self.capture is not None and len(chunk) > 0:
+            self.capture.record(READ,chunk)
+
+    def log_write(self,data):
+        """
+        Add data written to the board outside of write to the capture, if one
+        is running.
+        """
+
+        if self.capture is not None and len(data) > 0:
+            self.capture.record(WRITE,data)
+
     def read(self):
         """
         Wrap serial read method.
         """
 
-        return self.comm.read()
+        chunk = self.comm.read()
+        if self.capture is not None:
+            self.log_read(chunk)
+
+        return chunk
+
+    def read_available(self,timeout=None):
+        """
+        Read everything currently waiting on the serial port in a single call.
+        If nothing is waiting, wait (up to timeout) for the first byte and
+        then pick up whatever arrived with it.  Returns b'' on timeout.
+
+        timeout (seconds) overrides the board timeout for this call.  The
+        wait happens in select() (or by polling in_waiting if the port has no
+        file descriptor), so comm.timeout is never changed and reads from
+        other threads are not affected.
+        """
+
+        if timeout is None:
+            timeout = self.timeout
+
+        num_waiting = self.comm.in_waiting
+        if num_waiting == 0:
+            if not self._wait_readable(timeout):
+                return b""
+            num_waiting = max(self.comm.in_waiting,1)
+
+        chunk = self.comm.read(num_waiting)
+        if self.capture is not None:
+            self.log_read(chunk)
+
+        return chunk
+
+    def _wait_readable(self,timeout):
+        """
+        Wait up to timeout seconds (forever if None) for bytes to arrive.
+        Returns whether any did.
+        """
+
+        if self._fd is not None:
+            return len(select.select([self._fd],[],[],timeout)[0]) > 0
+
+        # No file descriptor to wait on: poll
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        while self.comm.in_waiting == 0:
+            if timeout is None:
+                time.sleep(0.001)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(remaining,0.001))
+
+        return True
 
     def readline(self):
         """
         Wrap serial readline method.
         """
         
-        return self.comm.readline()
+        line = self.comm.readline()
+        if self.capture is not None:
+            self.log_read(line)
+
+        return line
 
     def write(self,msg):
         """
@@ -187,6 +393,8 @@ class ArduinoBoard(object):
         """
         
         self.comm.write(msg)
+        if self.capture is not None:
+            self.log_write(msg)
 
     def close(self):
         """
@@ -197,6 +405,8 @@ class ArduinoBoard(object):
             self.comm.close()
         self._is_connected = False
 
+        self.stop_capture()
+
     @property
     def connected(self):
         """
@@ -204,3 +414,68 @@ class ArduinoBoard(object):
         """
     
         return self._is_connected
+
+def open_boards(boards,board_class=ArduinoBoard,max_workers=None):
+    """
+    Open many boards at once, so the rig is ready after about the time the
+    slowest board takes rather than the sum of all of them.
+
+    Input:
+        boards:
+            list of keyword argument dicts for board_class (e.g.
+            {"device":"/dev/ttyACM0","baud_rate":115200,"ready_probe":b"0;"}).
+            device is passed as the first argument, so it works for board
+            classes that call it something else (ArduinoDueBoard's port).
+
+        board_class:
+            ArduinoBoard or a subclass (e.g. ArduinoDueBoard)
+            Default: ArduinoBoard
+
+        max_workers:
+            number of boards opened at the same time.  None opens them all at
+            once.
+            Default: None
+
+    Returns the boards, in the same order.  If any board fails to open, the
+    others are closed and the first error is raised.
+    """
+
+    boards = list(boards)
+    if len(boards) == 0:
+        return []
+
+    if max_workers is None:
+        max_workers = len(boards)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = [executor.submit(_open_board,board_class,kwargs) for kwargs in boards]
+        concurrent.futures.wait(futures)
+
+    opened = []
+    error = None
+    for f in futures:
+        if f.exception() is None:
+            opened.append(f.result())
+        elif error is None:
+            error = f.exception()
+
+    if error is not None:
+        for board in opened:
+            board.close()
+        raise error
+
+    return opened
+
+def _open_board(board_class,kwargs):
+    """
+    board_class(device,**other_kwargs) from one of open_boards' dicts.
+    """
+
+    kwargs = dict(kwargs)
+    try:
+        device = kwargs.pop("device")
+    except KeyError:
+        err = "every board needs a device ({})".format(kwargs)
+        raise ValueError(err)
+
+    return board_class(device,**kwargs)
@@ -6,14 +6,14 @@ based boards. Here integers and doubles are stored as 32-bit (4-byte and) and
 ATMega based boards.
 """
 
-from arduino import ArduinoBoard
+from .arduino import ArduinoBoard
 
 class ArduinoDueBoard(ArduinoBoard):
 
     def __init__(self, port, baud_rate=9600, timeout=1.0, settle_time=2.0,
                  enable_dtr=False, int_bytes=4, long_bytes=4, float_bytes=4,
-                 double_bytes=8):
+                 double_bytes=8, capture=None, **kwargs):
         super(ArduinoDueBoard, self).__init__(port, baud_rate, timeout,
                                              settle_time, enable_dtr,
                                              int_bytes, long_bytes, float_bytes,
-                                             double_bytes)
\ No newline at end of file
+                                             double_bytes, capture, **kwargs)
\ No newline at end of file
@@ -0,0 +1,626 @@
+__description__ = \
+"""
+Benchmark suite for PyCmdMessenger.  Measures, against a pyserial loop:// port
+or a pty:
+
+    encode:           send throughput for each format type
+    decode:           receive throughput for each format type
+    query:            round trip latency percentiles against the emulated
+                      rapid-float sketch
+    threaded_ingest:  messages/s CmdMessengerThreaded dispatches to
+                      response_to_command
+    codec:            compiled per-command codecs vs the original per-field
+                      dispatch (format lookup, "*" expansion and one
+                      _send_*/_recv_* call per argument).  Encoding is timed up
+                      to, but not including, escaping.
+    crc:              cost of checking the CRC16 field on received messages
+    hub_ingest:       messages/s from several ptys at once, read by one
+                      CmdMessengerThreaded per port vs a single MessengerHub
+    capture:          cost of capturing raw traffic on send, and receive
+                      throughput when replaying the capture as fast as possible
+    writer:           messages/s several threads get out through one
+                      CmdMessengerThreaded, writing in send() vs merging on
+                      the writer thread, with its batch and queue stats
+
+Results are written to standard output as JSON, so runs can be compared between
+releases.  Connection chatter goes to standard error.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "python -m PyCmdMessenger.bench [number_of_messages] [loop|pty]"
+
+import contextlib, json, os, platform, select, sys, tempfile, threading, time
+import timeit, tty
+
+from .arduino import ArduinoBoard
+from .PyCmdMessenger import CmdMessenger
+from .PyCmdMessenger_threaded import CmdMessengerThreaded
+from .replay import ReplayBoard
+from .hub import MessengerHub
+from . import emulator
+
+COMMANDS = [["kMultiValuePing","ild"],
+            ["double_ping","d"],
+            ["multi_ping","f*"],
+            ["kAcknowledge","s"]]
+
+CASES = [("kMultiValuePing",(-1234,123456789,3.14159)),
+         ("double_ping",(0.123456,)),
+         ("multi_ping",tuple([0.5*i for i in range(100)])),
+         ("kAcknowledge",("Arduino ready",))]
+
+# One command per format type: (name, format, arguments)
+TYPE_CASES = [("bool","?",(True,)),
+              ("byte","b",(200,)),
+              ("char","c",("x",)),
+              ("int","i",(-1234,)),
+              ("unsigned_int","I",(1234,)),
+              ("long","l",(-123456789,)),
+              ("unsigned_long","L",(123456789,)),
+              ("float","f",(3.14159,)),
+              ("double","d",(2.71828,)),
+              ("string","s",("Arduino ready",)),
+              ("float_array","f*",tuple([0.25*i for i in range(32)]))]
+
+TRANSPORTS = ["loop","pty"]
+
+def per_field_encode(messenger,cmd,args):
+    """
+    Convert a command and its arguments into unescaped fields the way
+    CmdMessenger.send did before codecs were compiled.
+    """
+
+    command_as_int = messenger._cmd_name_to_int[cmd]
+    arg_format_list = messenger._cmd_name_to_format[cmd]
+    arg_format_list = messenger._treat_star_format(arg_format_list,args)
+
+    fields = ["{}".format(command_as_int).encode("ascii")]
+    for i, a in enumerate(args):
+        fields.append(messenger._send_methods[arg_format_list[i]](a))
+
+    return fields
+
+def compiled_encode(messenger,cmd,args):
+    """
+    Convert a command and its arguments into unescaped fields using the
+    command's compiled codec.
+    """
+
+    codec = messenger._get_codec(cmd)
+
+    return [codec.prefix] + codec.encode(args)
+
+def per_field_decode(messenger,fields):
+    """
+    Decode message fields the way CmdMessenger.receive did before codecs were
+    compiled.
+    """
+
+    cmd_name = messenger._int_to_cmd_name[int(fields[0].strip().decode())]
+    arg_format_list = messenger._cmd_name_to_format[cmd_name]
+    arg_format_list = messenger._treat_star_format(arg_format_list,fields[1:])
+
+    received = []
+    for i, f in enumerate(fields[1:]):
+        received.append(messenger._recv_methods[arg_format_list[i]](f))
+
+    return cmd_name, received
+
+def time_per_call(function,number):
+    """
+    Best of three timings of function, in microseconds per call.
+    """
+
+    return min(timeit.repeat(function,number=number,repeat=3))/number*1e6
+
+def percentile(values,fraction):
+    """
+    Value below which fraction of the (sorted) values fall.
+    """
+
+    index = int(round(fraction*(len(values) - 1)))
+
+    return values[index]
+
+def rate(number,num_bytes,seconds):
+    """
+    Throughput record for number messages of num_bytes bytes in seconds.
+    """
+
+    return {"messages_per_s":number/seconds,
+            "bytes_per_s":num_bytes/seconds,
+            "us_per_message":seconds/number*1e6}
+
+def open_transport(transport):
+    """
+    Return an ArduinoBoard and, for a pty, the file descriptor of the other
+    end (None for loop://).
+    """
+
+    if transport == "loop":
+        return ArduinoBoard("loop://",timeout=0.1,settle_time=0), None
+
+    if transport == "pty":
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        board = ArduinoBoard(os.ttyname(slave),baud_rate=115200,settle_time=0)
+        os.close(slave)
+        return board, master
+
+    err = "transport should be one of {}, not '{}'".format(TRANSPORTS,transport)
+    raise ValueError(err)
+
+def drain(board,other_end,done):
+    """
+    Read and throw away everything that arrives from the messenger until done
+    is set.
+    """
+
+    while not done.is_set():
+        if other_end is None:
+            board.comm.read(max(board.comm.in_waiting,1))
+        elif len(select.select([other_end],[],[],0.1)[0]) > 0:
+            os.read(other_end,65536)
+
+def feed(board,other_end,data):
+    """
+    Write data for the messenger to read (in a thread while it reads).
+    """
+
+    if other_end is None:
+        board.comm.write(data)
+        return
+
+    data = memoryview(data)
+    while len(data) > 0:
+        data = data[os.write(other_end,data):]
+
+def in_background(function,*args):
+    """
+    Run function(*args) on a daemon thread.
+    """
+
+    thread = threading.Thread(target=function,args=args)
+    thread.daemon = True
+    thread.start()
+
+    return thread
+
+def bench_encode(number,transport):
+    """
+    send throughput for each format type.
+    """
+
+    results = {}
+    commands = [[name,fmt] for name, fmt, args in TYPE_CASES]
+    for name, fmt, args in TYPE_CASES:
+
+        board, other_end = open_transport(transport)
+        c = CmdMessenger(board,commands)
+
+        # Keep reading the other end so writes never stall on a full buffer
+        done = threading.Event()
+        reader = in_background(drain,board,other_end,done)
+
+        num_bytes = number*len(c._encode(name,args))
+
+        start = time.perf_counter()
+        for i in range(number):
+            c.send(name,*args)
+        seconds = time.perf_counter() - start
+
+        results[name] = rate(number,num_bytes,seconds)
+
+        done.set()
+        reader.join()
+        board.close()
+        if other_end is not None:
+            os.close(other_end)
+
+    return results
+
+def bench_decode(number,transport):
+    """
+    receive throughput for each format type.
+    """
+
+    results = {}
+    commands = [[name,fmt] for name, fmt, args in TYPE_CASES]
+    for name, fmt, args in TYPE_CASES:
+
+        board, other_end = open_transport(transport)
+        c = CmdMessenger(board,commands)
+
+        data = c._encode(name,args)*number
+
+        start = time.perf_counter()
+        writer = in_background(feed,board,other_end,data)
+        for i in range(number):
+            if c.receive() is None:
+                err = "timed out receiving {} messages".format(name)
+                raise RuntimeError(err)
+        seconds = time.perf_counter() - start
+
+        results[name] = rate(number,len(data),seconds)
+
+        writer.join()
+        board.close()
+        if other_end is not None:
+            os.close(other_end)
+
+    return results
+
+def bench_query(number):
+    """
+    query round trip latency against the emulated rapid-float sketch.
+    """
+
+    arduino = emulator.rapid_float_sketch()
+    board = ArduinoBoard(arduino.device,baud_rate=115200,settle_time=0)
+    arduino.start()
+
+    c = CmdMessenger(board,[["double_ping","d","double_pong"],
+                            ["double_pong","d"]])
+
+    latencies = []
+    for i in range(number):
+        start = time.perf_counter()
+        if c.query("double_ping",i*0.5) is None:
+            err = "query timed out"
+            raise RuntimeError(err)
+        latencies.append((time.perf_counter() - start)*1e6)
+
+    board.close()
+    arduino.close()
+
+    latencies.sort()
+
+    return {"number":number,
+            "mean_us":sum(latencies)/number,
+            "p50_us":percentile(latencies,0.50),
+            "p90_us":percentile(latencies,0.90),
+            "p99_us":percentile(latencies,0.99),
+            "max_us":latencies[-1]}
+
+class _CountingMessenger(CmdMessengerThreaded):
+    """
+    Threaded messenger that counts messages and flags when it has seen enough.
+    """
+
+    def __init__(self,board,commands,expected):
+
+        self.count = 0
+        self.expected = expected
+        self.done = threading.Event()
+
+        CmdMessengerThreaded.__init__(self,board,commands,warnings=False)
+
+    def response_to_command(self,cmd_name,msg,message_time):
+
+        self.count += 1
+        if self.count >= self.expected:
+            self.done.set()
+
+def bench_threaded_ingest(number):
+    """
+    How fast CmdMessengerThreaded reads messages off a pty and dispatches them.
+    """
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    board = ArduinoBoard(os.ttyname(slave),baud_rate=115200,timeout=0.1,
+                         settle_time=0)
+    os.close(slave)
+
+    c = _CountingMessenger(board,[["double_pong","d"]],number)
+    data = c._encode("double_pong",(1.5,))*number
+
+    start = time.perf_counter()
+    in_background(feed,board,master,data)
+    finished = c.done.wait(60)
+    seconds = time.perf_counter() - start
+
+    c.stop()
+    board.close()
+    os.close(master)
+
+    if not finished:
+        err = "threaded reader only saw {} of {} messages".format(c.count,number)
+        raise RuntimeError(err)
+
+    return rate(number,len(data),seconds)
+
+def bench_hub_ingest(number,num_boards=8):
+    """
+    Messages/s read from num_boards ptys at once (number messages each), with
+    a reader thread per port and with one MessengerHub.
+    """
+
+    results = {}
+    for mode in ["threaded","hub"]:
+
+        boards, masters = [], []
+        for i in range(num_boards):
+            master, slave = os.openpty()
+            tty.setraw(slave)
+            boards.append(ArduinoBoard(os.ttyname(slave),baud_rate=115200,
+                                       timeout=0.1,settle_time=0))
+            masters.append(master)
+            os.close(slave)
+
+        total = number*num_boards
+        if mode == "threaded":
+            messengers = [_CountingMessenger(b,[["double_pong","d"]],number)
+                          for b in boards]
+            events = [m.done for m in messengers]
+        else:
+            done = threading.Event()
+            count = [0]
+            def on_message(*msg):
+                count[0] += 1
+                if count[0] >= total:
+                    done.set()
+            hub = MessengerHub(callback=on_message)
+            for i, b in enumerate(boards):
+                hub.add(str(i),CmdMessenger(b,[["double_pong","d"]]))
+            hub.start()
+            events = [done]
+
+        data = CmdMessenger(boards[0],[["double_pong","d"]])._encode("double_pong",(1.5,))*number
+
+        start = time.perf_counter()
+        writers = [in_background(feed,b,m,data) for b, m in zip(boards,masters)]
+        finished = all([e.wait(60) for e in events])
+        seconds = time.perf_counter() - start
+
+        if mode == "threaded":
+            for m in messengers:
+                m.stop()
+        else:
+            hub.stop()
+        for b in boards:
+            b.close()
+        for w in writers:
+            w.join()
+        for m in masters:
+            os.close(m)
+
+        if not finished:
+            err = "{} ingest did not see every message".format(mode)
+            raise RuntimeError(err)
+
+        results[mode] = rate(total,len(data)*num_boards,seconds)
+
+    results["num_boards"] = num_boards
+
+    return results
+
+def bench_codec(number):
+    """
+    Compiled codecs vs per-field dispatch, in microseconds per call.
+    """
+
+    board = ArduinoBoard("loop://",settle_time=0)
+    c = CmdMessenger(board,COMMANDS)
+
+    results = {}
+    for cmd, args in CASES:
+
+        fields = compiled_encode(c,cmd,args)
+        if fields != per_field_encode(c,cmd,args):
+            err = "compiled and per-field encoding of {} differ".format(cmd)
+            raise RuntimeError(err)
+
+        results[cmd] = {}
+
+        slow = time_per_call(lambda: per_field_encode(c,cmd,args),number)
+        fast = time_per_call(lambda: compiled_encode(c,cmd,args),number)
+        results[cmd]["encode"] = {"per_field_us":slow,"compiled_us":fast,
+                                  "speedup":slow/fast}
+
+        slow = time_per_call(lambda: per_field_decode(c,fields),number)
+        fast = time_per_call(lambda: c._decode(fields),number)
+        results[cmd]["decode"] = {"per_field_us":slow,"compiled_us":fast,
+                                  "speedup":slow/fast}
+
+    board.close()
+
+    return results
+
+def bench_crc(number):
+    """
+    Checking and decoding received messages with and without a CRC16 field,
+    in microseconds per message.
+    """
+
+    messengers = {}
+    for crc in [False,True]:
+        board = ArduinoBoard("loop://",settle_time=0)
+        messengers[crc] = CmdMessenger(board,COMMANDS,warnings=False,crc=crc)
+
+    results = {}
+    for cmd, args in CASES:
+
+        times = {}
+        for crc, c in messengers.items():
+
+            # Message as it comes off the wire, without the command separator
+            frame = c._encode(cmd,args)[:-1]
+            times[crc] = time_per_call(lambda: c._decode(c._frame_fields(frame)),
+                                       number)
+
+        results[cmd] = {"plain_us":times[False],"crc_us":times[True],
+                        "overhead":times[True]/times[False]}
+
+    for c in messengers.values():
+        c.board.close()
+
+    return results
+
+def bench_capture(number):
+    """
+    Microseconds per send with and without a capture running, then the
+    receive rate replaying captured incoming traffic as fast as possible.
+    """
+
+    f = tempfile.NamedTemporaryFile(suffix=".cap",delete=False)
+    f.close()
+
+    num_rounds = max(number//len(CASES),1)
+
+    results = {}
+    try:
+        board, other_end = open_transport("pty")
+        c = CmdMessenger(board,COMMANDS)
+
+        done = threading.Event()
+        reader = in_background(drain,board,other_end,done)
+
+        def send_all():
+            for cmd, args in CASES:
+                c.send(cmd,*args)
+
+        plain = time_per_call(send_all,num_rounds)
+        board.start_capture(f.name)
+        captured = time_per_call(send_all,num_rounds)
+        board.stop_capture()
+
+        done.set()
+        reader.join()
+
+        results["send_us"] = plain/len(CASES)
+        results["send_captured_us"] = captured/len(CASES)
+        results["overhead"] = captured/plain
+
+        # Capture the same messages coming the other way
+        data = b"".join([c._encode(cmd,args) for cmd, args in CASES])*num_rounds
+        board.start_capture(f.name)
+        writer = in_background(feed,board,other_end,data)
+        for i in range(num_rounds*len(CASES)):
+            if c.receive() is None:
+                err = "timed out receiving messages to capture"
+                raise RuntimeError(err)
+        writer.join()
+        board.close()
+        os.close(other_end)
+
+        board = ReplayBoard(f.name,timeout=0.1)
+        c = CmdMessenger(board,COMMANDS)
+        start = time.perf_counter()
+        count = 0
+        for msg in iter(c.receive,None):
+            count += 1
+        seconds = time.perf_counter() - start - board.timeout
+
+        results["replay"] = rate(count,len(data),seconds)
+        board.close()
+    finally:
+        os.remove(f.name)
+
+    return results
+
+def bench_writer(number,num_threads=4,linger=0.0005):
+    """
+    Messages/s from num_threads threads each sending number messages through
+    one CmdMessengerThreaded on a pty: writing in send() under the lock, and
+    through the writer thread (with no linger and with linger seconds).
+    """
+
+    cmd, args = CASES[1]
+
+    results = {}
+    for mode in ["direct","writer","writer_linger"]:
+
+        board, other_end = open_transport("pty")
+        c = _CountingMessenger(board,COMMANDS,number)
+        if mode == "writer":
+            c.enable_writer()
+        elif mode == "writer_linger":
+            c.enable_writer(linger=linger)
+
+        done = threading.Event()
+        reader = in_background(drain,board,other_end,done)
+
+        def send_all():
+            for i in range(number):
+                c.send(cmd,*args)
+
+        start = time.perf_counter()
+        senders = [in_background(send_all) for i in range(num_threads)]
+        for t in senders:
+            t.join()
+        sent = time.perf_counter() - start
+        c.flush()
+        seconds = time.perf_counter() - start
+
+        total = number*num_threads
+        results[mode] = rate(total,total*len(c._encode(cmd,args)),seconds)
+        results[mode]["send_us"] = sent/number*1e6
+        if mode != "direct":
+            results[mode]["stats"] = c.writer_stats()
+
+        done.set()
+        reader.join()
+        c.close()
+        os.close(other_end)
+
+    results["num_threads"] = num_threads
+
+    return results
+
+def run(number=20000,transport="loop"):
+    """
+    Run every benchmark and return the results as a dictionary.  Queries and
+    threaded ingest use a tenth of number (their messages take a round trip
+    or a trip through the reader thread).
+    """
+
+    small = max(number//10,1)
+
+    results = {"python":platform.python_version(),
+               "platform":platform.platform(),
+               "number":number,
+               "transport":transport}
+
+    results["encode"] = bench_encode(number,transport)
+    results["decode"] = bench_decode(number,transport)
+    results["query"] = bench_query(small)
+    results["threaded_ingest"] = bench_threaded_ingest(small)
+    results["hub_ingest"] = bench_hub_ingest(small)
+    results["codec"] = bench_codec(number)
+    results["crc"] = bench_crc(number)
+    results["capture"] = bench_capture(number)
+    results["writer"] = bench_writer(small)
+
+    return results
+
+def main(argv=None):
+
+    if argv == None:
+        argv = sys.argv[1:]
+
+    try:
+        number = int(argv[0])
+    except IndexError:
+        number = 20000
+    except ValueError:
+        err = "Incorrect arguments. Usage:\n\n{}\n\n".format(__usage__)
+        raise ValueError(err)
+
+    try:
+        transport = argv[1]
+    except IndexError:
+        transport = "loop"
+
+    if transport not in TRANSPORTS:
+        err = "Incorrect arguments. Usage:\n\n{}\n\n".format(__usage__)
+        raise ValueError(err)
+
+    # ArduinoBoard prints as it connects; keep standard out clean for the JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run(number,transport)
+
+    print(json.dumps(results,indent=2,sort_keys=True))
+
+if __name__ == "__main__":
+    main()
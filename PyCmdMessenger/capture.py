@@ -0,0 +1,176 @@
+__description__ = \
+"""
+Capture of the raw bytes going over a serial connection, for debugging and
+for replaying real traffic into the decoder (see replay.py).
+
+A capture file starts with a header:
+
+    8 bytes   b"PCMDCAP1"
+    double    time.time() when the capture started
+    uint32    length of the JSON board description that follows
+    JSON      board parameters (device, baud_rate, int_bytes, ...)
+
+followed by one record per chunk read or written:
+
+    uint64    nanoseconds since the capture started (time.perf_counter_ns)
+    uint8     direction (0 read from the arduino, 1 written to it)
+    uint32    number of bytes
+    bytes     the chunk
+
+All numbers are little-endian.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import collections, json, struct, threading, time
+
+MAGIC = b"PCMDCAP1"
+READ = 0
+WRITE = 1
+
+_HEADER = struct.Struct("<8sdI")
+_RECORD = struct.Struct("<QBI")
+
+# Board attributes stored in the header
+BOARD_PARAMETERS = ["device","baud_rate","timeout","int_bytes","long_bytes",
+                    "float_bytes","double_bytes"]
+
+class CaptureWriter:
+    """
+    Writes chunks to a capture file from a background thread.  record only
+    appends to a queue (no locks, no I/O), so capturing adds next to nothing
+    to the serial read and write paths; the writer thread packs and writes
+    whatever has queued up every flush_interval seconds.
+    """
+
+    def __init__(self,path,board=None,flush_interval=0.05):
+        """
+        Input:
+            path:
+                file to write the capture to (overwritten)
+
+            board:
+                ArduinoBoard whose parameters are stored in the header, so a
+                replay decodes with the same type sizes
+                Default: None
+
+            flush_interval:
+                seconds between writes to the file
+                Default: 0.05
+        """
+
+        self.path = path
+        self.flush_interval = flush_interval
+
+        parameters = {}
+        if board is not None:
+            for p in BOARD_PARAMETERS:
+                parameters[p] = getattr(board,p,None)
+        parameters = json.dumps(parameters).encode("utf-8")
+
+        self._file = open(path,"wb")
+        self._file.write(_HEADER.pack(MAGIC,time.time(),len(parameters)))
+        self._file.write(parameters)
+
+        self._start = time.perf_counter_ns()
+        self._pending = collections.deque()
+
+        self.num_chunks = 0
+        self.num_bytes = 0
+
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def record(self,direction,chunk):
+        """
+        Queue a chunk (bytes) that was just read (READ) or written (WRITE).
+        """
+
+        self._pending.append((time.perf_counter_ns(),direction,bytes(chunk)))
+
+    def _run(self):
+
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._write_pending()
+
+        self._write_pending()
+
+    def _write_pending(self):
+        """
+        Pack and write everything queued so far.
+        """
+
+        out = bytearray()
+        pending = self._pending
+        while pending:
+            t, direction, chunk = pending.popleft()
+            out += _RECORD.pack(t - self._start,direction,len(chunk))
+            out += chunk
+            self.num_chunks += 1
+            self.num_bytes += len(chunk)
+
+        if len(out) > 0:
+            self._file.write(out)
+            self._file.flush()
+
+    def close(self):
+        """
+        Write out everything still queued and close the file.
+        """
+
+        if self._closed:
+            return
+
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_val,exc_tb):
+        self.close()
+
+def read_header(f):
+    """
+    Read the header of an open capture file.  Returns the time.time() the
+    capture started and the board parameters.
+    """
+
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size or header[:len(MAGIC)] != MAGIC:
+        err = "not a PyCmdMessenger capture file"
+        raise ValueError(err)
+
+    magic, start_time, length = _HEADER.unpack(header)
+    parameters = json.loads(f.read(length).decode("utf-8"))
+
+    return start_time, parameters
+
+def read_capture(path):
+    """
+    Iterate over the records in a capture file as (seconds since the capture
+    started, direction, chunk).  A record cut short (e.g. by a crash while
+    capturing) ends the iteration.
+    """
+
+    with open(path,"rb") as f:
+
+        read_header(f)
+
+        while True:
+            record = f.read(_RECORD.size)
+            if len(record) < _RECORD.size:
+                return
+
+            t, direction, length = _RECORD.unpack(record)
+            chunk = f.read(length)
+            if len(chunk) < length:
+                return
+
+            yield t*1e-9, direction, chunk
@@ -0,0 +1,242 @@
+__description__ = \
+"""
+Estimate the offset and drift between the arduino's clock (micros() or
+millis()) and the host clock, so board timestamps sent in messages can be put
+on the host's time scale (the message_time scale, see CmdMessenger.clock).
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+class ClockSync:
+    """
+    Ping-based board to host clock estimator.  Each ping is a query whose
+    reply carries a reading of the board's clock.  Assuming the trip there
+    and back take about the same time, the board read its clock halfway
+    between the host sending the query and the first byte of the reply
+    arriving.  A straight line (host = offset + rate*board) is fit through the
+    pings with the shortest round trips in a sliding window, which gives both
+    the offset and the drift of the board's clock.
+
+    On the arduino this only needs a command that replies with micros():
+
+        void on_get_micros(void){
+            c.sendBinCmd(kMicros,micros());
+        }
+
+    and on the host:
+
+        c = CmdMessenger(board,[["kGetMicros","","kMicros"],["kMicros","L"],...])
+        sync = ClockSync(c,"kGetMicros")
+        sync.sync()
+        host_time = sync.to_host(board_micros)
+
+    Pings can also come from elsewhere (e.g. AsyncCmdMessenger queries)
+    through add_sample.
+    """
+
+    def __init__(self,messenger,cmd=None,field=0,tick=1e-6,wrap=2**32,window=32):
+        """
+        Input:
+            messenger:
+                CmdMessenger (or CmdMessengerThreaded) used to ping the board.
+                Its clock() is the host time scale.
+
+            cmd:
+                command that asks the board for its clock.  It must be declared
+                with the reply command that carries the reading.  If None,
+                samples can only be added with add_sample.
+
+            field:
+                index of the clock reading among the reply's arguments
+                Default: 0
+
+            tick:
+                seconds per tick of the board clock (1e-6 for micros(), 1e-3
+                for millis())
+                Default: 1e-6
+
+            wrap:
+                number of ticks after which the board clock wraps around to 0
+                (2**32 for an unsigned long), or None if it does not wrap
+                Default: 2**32
+
+            window:
+                number of most recent pings to fit
+                Default: 32
+        """
+
+        if window < 1:
+            err = "window must be at least 1"
+            raise ValueError(err)
+
+        if cmd is not None and cmd not in messenger._cmd_name_to_response:
+            err = "Command '{}' must be declared with a reply command.\n".format(cmd)
+            raise ValueError(err)
+
+        self.messenger = messenger
+        self.cmd = cmd
+        self.field = field
+        self.tick = tick
+        self.wrap = wrap
+        self.window = window
+
+        self.reset()
+
+    def reset(self):
+        """
+        Forget every sample (e.g. after the board resets).
+        """
+
+        # (board seconds, host seconds, round trip seconds)
+        self._samples = []
+        self._last_ticks = None
+
+        self._board_mean = None
+        self._host_mean = None
+        self._rate = 1.0
+        self.round_trip = None
+
+    def ping(self,*args):
+        """
+        Query the board's clock once and add the sample.  args are passed
+        along with the query.  Returns the round trip time in seconds, or None
+        if no reply arrived.
+        """
+
+        if self.cmd is None:
+            err = "ClockSync needs a cmd to ping the board"
+            raise ValueError(err)
+
+        sent = self.messenger.clock()
+        reply = self.messenger.query(self.cmd,*args)
+        if reply is None:
+            return None
+
+        cmd_name, received, message_time = reply
+
+        return self.add_sample(received[self.field],sent,message_time)
+
+    def sync(self,num_pings=8):
+        """
+        Ping the board num_pings times.  Returns the number of replies.
+        """
+
+        num_replies = 0
+        for i in range(num_pings):
+            if self.ping() is not None:
+                num_replies += 1
+
+        return num_replies
+
+    def add_sample(self,ticks,sent,received):
+        """
+        Add a ping: the board's clock read ticks some time between the host
+        times sent and received (on the messenger's clock scale).  Returns the
+        round trip time.
+        """
+
+        round_trip = received - sent
+        if round_trip < 0:
+            err = "reply received before the query was sent"
+            raise ValueError(err)
+
+        ticks = self._unwrap(ticks)
+        self._last_ticks = ticks
+
+        self._samples.append((ticks*self.tick,sent + round_trip/2,round_trip))
+        if len(self._samples) > self.window:
+            self._samples.pop(0)
+
+        self._fit()
+
+        return round_trip
+
+    def _fit(self):
+        """
+        Fit host = host_mean + rate*(board - board_mean) through the better
+        half (shortest round trips) of the samples.
+        """
+
+        best = sorted(self._samples,key=lambda s: s[2])
+        best = best[:max(2,len(best)//2)]
+
+        n = len(best)
+        board_mean = sum([s[0] for s in best])/n
+        host_mean = sum([s[1] for s in best])/n
+
+        spread = sum([(s[0] - board_mean)**2 for s in best])
+        if spread > 0:
+            self._rate = sum([(s[0] - board_mean)*(s[1] - host_mean) for s in best])/spread
+        else:
+            self._rate = 1.0
+
+        self._board_mean = board_mean
+        self._host_mean = host_mean
+        self.round_trip = best[0][2]
+
+    def _unwrap(self,ticks):
+        """
+        Place a raw clock reading in the wrap period closest to the last
+        sample.
+        """
+
+        if self.wrap is None or self._last_ticks is None:
+            return ticks
+
+        base = self._last_ticks - self._last_ticks % self.wrap
+        candidates = [base + ticks - self.wrap,base + ticks,base + ticks + self.wrap]
+
+        return min(candidates,key=lambda c: abs(c - self._last_ticks))
+
+    def to_host(self,ticks):
+        """
+        Host time (messenger clock scale) at which the board's clock read
+        ticks.  Readings are assumed to be within half a wrap period of the
+        last ping.
+        """
+
+        if self._board_mean is None:
+            err = "no clock samples yet; call sync() first"
+            raise RuntimeError(err)
+
+        board = self._unwrap(ticks)*self.tick
+
+        return self._host_mean + self._rate*(board - self._board_mean)
+
+    @property
+    def drift(self):
+        """
+        How much faster the host clock runs than the board's, as a fraction
+        (e.g. 2e-5 is 20 ppm).  0 until there are two samples.
+        """
+
+        return self._rate - 1.0
+
+    @property
+    def offset(self):
+        """
+        Host time minus board time (seconds) at the last sample.
+        """
+
+        if self._board_mean is None:
+            return None
+
+        board = self._last_ticks*self.tick
+
+        return self._host_mean + self._rate*(board - self._board_mean) - board
+
+    @property
+    def uncertainty(self):
+        """
+        Half of the shortest round trip used in the fit: how far off a mapped
+        time can be if the trips there and back are not the same length.
+        """
+
+        if self.round_trip is None:
+            return None
+
+        return self.round_trip/2
+
+    @property
+    def num_samples(self):
+        return len(self._samples)
@@ -0,0 +1,383 @@
+__description__ = \
+"""
+Per-command argument codecs for CmdMessenger.  A codec is compiled once from a
+command's format string and the board's type sizes, so sending and receiving
+do not have to look up formats, expand "*" formats or dispatch one field at a
+time on every call.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import struct
+import numpy as np
+
+# Formats that have a fixed binary size and can be packed by a single
+# struct.Struct.  "b" is sent as an unsigned char; the other sized types come
+# from the board.
+_BOARD_TYPES = {"i":"int_type",
+                "I":"unsigned_int_type",
+                "l":"long_type",
+                "L":"unsigned_long_type",
+                "f":"float_type",
+                "d":"double_type"}
+
+_FIXED_TYPES = {"b":"B",
+                "?":"?"}
+
+# Python type an argument must already have to skip the coercion/validation
+# done by the per-field _send_* methods.
+_PYTHON_TYPES = {"b":int,
+                 "i":int,
+                 "I":int,
+                 "l":int,
+                 "L":int,
+                 "f":float,
+                 "d":float,
+                 "?":bool}
+
+def numpy_dtype(board,arg_format):
+    """
+    Return the (little-endian) numpy dtype matching a single binary format
+    character on this board.  Raises ValueError for formats without a fixed
+    binary size (s, c, g).
+    """
+
+    if arg_format in _FIXED_TYPES:
+        return np.dtype(_FIXED_TYPES[arg_format])
+
+    try:
+        type_name = _BOARD_TYPES[arg_format]
+    except KeyError:
+        err = "format '{}' does not have a fixed-size numpy equivalent".format(arg_format)
+        raise ValueError(err)
+
+    return np.dtype(getattr(board,type_name))
+
+class FrameFields:
+    """
+    Fields of a received message, kept as the unescaped message in a single
+    buffer rather than one bytes object per field.  Indexing and iterating
+    give unescaped bytes fields (field 0 is the command id), like a list of
+    bytes, but codecs unpack binary fields straight out of the buffer.
+
+    layout is a copy of the buffer in which only the real field separators
+    are separators (escaped ones are replaced by another byte), so fields are
+    found by searching it.  For a message without escapes it is the buffer
+    itself.  The command id (command) and where the arguments start
+    (args_start, 0 if there are none) are found up front; the other field
+    offsets are only worked out if something asks for them.
+    """
+
+    __slots__ = ["buffer","layout","separator","command","args_start",
+                 "_starts","_lengths"]
+
+    def __init__(self,buffer,separator,layout=None):
+
+        if layout is None:
+            layout = buffer
+
+        self.buffer = buffer
+        self.layout = layout
+        self.separator = separator
+        self._starts = None
+        self._lengths = None
+
+        end = layout.find(separator)
+        if end < 0:
+            self.command = buffer
+            self.args_start = 0
+        else:
+            self.command = buffer[:end]
+            self.args_start = end + 1
+
+    @property
+    def starts(self):
+        if self._starts is None:
+            self._find_fields()
+        return self._starts
+
+    @property
+    def lengths(self):
+        if self._lengths is None:
+            self._find_fields()
+        return self._lengths
+
+    def _find_fields(self):
+
+        layout = self.layout
+        sep = self.separator
+
+        starts = [0]
+        lengths = []
+        pos = layout.find(sep)
+        while pos >= 0:
+            lengths.append(pos - starts[-1])
+            starts.append(pos + 1)
+            pos = layout.find(sep,pos + 1)
+        lengths.append(len(layout) - starts[-1])
+
+        self._starts = starts
+        self._lengths = lengths
+
+    def __len__(self):
+        return self.layout.count(self.separator) + 1
+
+    def __getitem__(self,i):
+
+        if i == 0:
+            return self.command
+
+        if type(i) is slice:
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        start = self.starts[i]
+
+        return bytes(self.buffer[start:start + self.lengths[i]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __eq__(self,other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+class CommandCodec:
+    """
+    Encode and decode the arguments of a single command.
+
+    Formats made up entirely of fixed-size binary types (b, i, I, l, L, f, d
+    and ?) are packed and unpacked by one precompiled struct.Struct.  Anything
+    else (strings, chars, guesses) uses the messenger's per-field methods,
+    looked up once here rather than on every call.  "*" formats keep a cache
+    of expanded codecs, one per argument count.
+    """
+
+    def __init__(self,messenger,command_as_int,arg_formats):
+        """
+        Input:
+            messenger:
+                CmdMessenger instance whose board and _send_*/_recv_* methods
+                define the wire format.
+
+            command_as_int:
+                integer id of the command (its position in the command list).
+
+            arg_formats:
+                format string for the command's arguments.  May end in "*".  If
+                None, every argument is guessed ("g").
+        """
+
+        self.messenger = messenger
+        self.command_as_int = command_as_int
+        self.arg_formats = arg_formats
+
+        # Ready-made "cmd" prefix for the message
+        self.prefix = "{}".format(command_as_int).encode("ascii")
+
+        self._expanded = {}
+        self._struct = None
+        self._wire_struct = None
+        self._separator = bytes(messenger._byte_field_sep)
+
+        if arg_formats is None or "*" in arg_formats:
+            self.is_fixed = False
+            self.num_args = None
+
+            # Make sure the "*" format is sane now, rather than on first use.
+            if arg_formats is not None:
+                messenger._treat_star_format(arg_formats,())
+
+            return
+
+        self.is_fixed = True
+        self.num_args = len(arg_formats)
+
+        self._send_methods = [messenger._send_methods[f] for f in arg_formats]
+        self._recv_methods = [messenger._recv_methods[f] for f in arg_formats]
+
+        # One struct.Struct per binary field (None for strings and the like)
+        # for unpacking single fields out of a message buffer
+        codes = []
+        self._field_structs = []
+        for f in arg_formats:
+            if f in _FIXED_TYPES:
+                codes.append(_FIXED_TYPES[f])
+            elif f in _BOARD_TYPES:
+                codes.append(getattr(messenger.board,_BOARD_TYPES[f])[1:])
+            else:
+                codes.append(None)
+                self._field_structs.append(None)
+                continue
+            self._field_structs.append(struct.Struct("<" + codes[-1]))
+
+        # See if the whole argument list can be handled by one struct.Struct
+        if None in codes:
+            return
+
+        if self.num_args == 0:
+            return
+
+        self._struct = struct.Struct("<" + "".join(codes))
+        self._python_types = tuple([_PYTHON_TYPES[f] for f in arg_formats])
+        self._field_sizes = tuple([struct.calcsize("<" + c) for c in codes])
+
+        self._slices = []
+        offset = 0
+        for size in self._field_sizes:
+            self._slices.append((offset,offset + size))
+            offset += size
+
+        # The same, but skipping the separator between fields, so a whole
+        # unescaped message can be unpacked in place.  _separator_offsets
+        # are where the separators sit, counting from the first argument.
+        self._wire_struct = struct.Struct("<" + "x".join(codes))
+        self._separator_offsets = tuple([end + i for i, (start, end)
+                                         in enumerate(self._slices[:-1])])
+
+        # struct does the range checking for integers, but the board's float
+        # limits are checked by hand (this mirrors _send_float/_send_double).
+        board = messenger.board
+        self._float_checks = [(i,board.float_min,board.float_max)
+                              for i, f in enumerate(arg_formats) if f in "fd"]
+
+    def expand(self,num_args):
+        """
+        Return a fixed-format codec for num_args arguments, expanding "*" or
+        guess formats as needed.  Expansions are cached by argument count.
+        """
+
+        if self.is_fixed:
+            return self
+
+        try:
+            return self._expanded[num_args]
+        except KeyError:
+            pass
+
+        if self.arg_formats is None:
+            arg_format_list = "g"*num_args
+        else:
+            arg_format_list = self.messenger._treat_star_format(self.arg_formats,
+                                                                 [None]*num_args)
+
+        codec = CommandCodec(self.messenger,self.command_as_int,
+                             "".join(arg_format_list))
+        self._expanded[num_args] = codec
+
+        return codec
+
+    def encode(self,args):
+        """
+        Convert a sequence of python values into a list of (unescaped) bytes
+        fields.
+        """
+
+        if not self.is_fixed:
+            return self.expand(len(args)).encode(args)
+
+        if len(args) == 0:
+            return []
+
+        if len(args) != self.num_args:
+            err = "Number of argument formats must match the number of arguments."
+            raise ValueError(err)
+
+        if self._struct is not None and tuple(map(type,args)) == self._python_types:
+
+            for i, value_min, value_max in self._float_checks:
+                if args[i] > value_max or args[i] < value_min:
+                    break
+            else:
+                try:
+                    packed = self._struct.pack(*args)
+                except struct.error:
+                    pass
+                else:
+                    if self.num_args == 1:
+                        return [packed]
+                    return [packed[a:b] for a, b in self._slices]
+
+        # Coerce, range check and raise informative errors one field at a time
+        return [m(a) for m, a in zip(self._send_methods,args)]
+
+    def decode(self,fields):
+        """
+        Convert a list of (unescaped) bytes fields into a list of python values.
+        """
+
+        if not self.is_fixed:
+            return self.expand(len(fields)).decode(fields)
+
+        if len(fields) == 0:
+            return []
+
+        if len(fields) != self.num_args:
+            self.messenger.metrics.count_error("argument_count")
+            err = "Number of argument formats must match the number of received arguments."
+            raise ValueError(err)
+
+        if self._struct is not None and tuple(map(len,fields)) == self._field_sizes:
+            if self.num_args == 1:
+                return list(self._struct.unpack(fields[0]))
+            return list(self._struct.unpack(b"".join(fields)))
+
+        return [m(f) for m, f in zip(self._recv_methods,fields)]
+
+    def decode_frame(self,fields):
+        """
+        Like decode, but takes the FrameFields of a whole message (command id
+        first) and unpacks binary fields from the message buffer in place.
+        """
+
+        buffer = fields.buffer
+
+        # If the message is exactly as long as expected and its separators
+        # are all where they should be, unpack it in place without splitting
+        if self._wire_struct is not None:
+
+            layout = fields.layout
+            sep = self._separator
+            start = fields.args_start
+            if start > 0 and len(layout) - start == self._wire_struct.size and \
+               layout.count(sep,start) == self.num_args - 1:
+                for offset in self._separator_offsets:
+                    if layout[start + offset] != sep[0]:
+                        break
+                else:
+                    return list(self._wire_struct.unpack_from(buffer,start))
+
+        # Strings and the like have to be copied out anyway.  Without escapes
+        # that is a plain split.
+        if fields.layout is buffer:
+            return self.decode(buffer.split(self._separator)[1:])
+
+        num_fields = len(fields) - 1
+
+        if not self.is_fixed:
+            return self.expand(num_fields).decode_frame(fields)
+
+        if num_fields == 0:
+            return []
+
+        if num_fields != self.num_args:
+            self.messenger.metrics.count_error("argument_count")
+            err = "Number of argument formats must match the number of received arguments."
+            raise ValueError(err)
+
+        starts = fields.starts
+        lengths = fields.lengths
+
+        received = []
+        for i in range(num_fields):
+            start = starts[i+1]
+            length = lengths[i+1]
+            field_struct = self._field_structs[i]
+            if field_struct is not None and length == field_struct.size:
+                received.append(field_struct.unpack_from(buffer,start)[0])
+            else:
+                received.append(self._recv_methods[i](bytes(buffer[start:start+length])))
+
+        return received
@@ -0,0 +1,135 @@
+__description__ = \
+"""
+Match replies coming back from the arduino to the queries that asked for them.
+CmdMessenger has no request ids on the wire, so each query waits on the
+command its reply will arrive as (e.g. kValuePing -> kValuePong) and replies
+are handed out first-in, first-out per reply command.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import collections, threading, time
+
+class QueryCorrelator:
+    """
+    Book-keeping for queries that are in flight.  Waiters are futures (either
+    concurrent.futures.Future or asyncio.Future); anything with done() and
+    set_result() works.
+
+    If metrics (a LinkMetrics) is given, the round trip time of every answered
+    query and every query that is discarded unanswered is recorded there.
+    """
+
+    def __init__(self,metrics=None):
+
+        self._lock = threading.Lock()
+        self._metrics = metrics
+
+        # reply command name (or None for "whatever arrives next") -> futures
+        self._pending = {}
+
+        # future -> time.perf_counter() when it started waiting
+        self._started = {}
+
+    def expect(self,response_cmd,future):
+        """
+        Register future to receive the next unclaimed response_cmd message.  If
+        response_cmd is None, the future takes the next message of any kind
+        that no other query is waiting for.
+        """
+
+        with self._lock:
+            try:
+                self._pending[response_cmd].append(future)
+            except KeyError:
+                self._pending[response_cmd] = collections.deque([future])
+            self._started[future] = time.perf_counter()
+
+        return future
+
+    def has_pending(self):
+        """
+        Whether any query is waiting on a reply.
+        """
+
+        return len(self._pending) > 0
+
+    def expects(self,cmd_name):
+        """
+        Whether any query is waiting on a cmd_name message.
+        """
+
+        return cmd_name in self._pending or None in self._pending
+
+    def resolve(self,cmd_name,msg):
+        """
+        Hand msg (a cmd_name message) to the oldest query waiting for it.
+        Returns True if a query took the message.
+        """
+
+        with self._lock:
+            for key in (cmd_name,None):
+
+                waiting = self._pending.get(key)
+                while waiting:
+
+                    future = waiting.popleft()
+                    if len(waiting) == 0:
+                        del self._pending[key]
+
+                    start = self._started.pop(future,None)
+                    if not future.done():
+                        if self._metrics is not None and start is not None:
+                            self._metrics.observe_query(cmd_name,time.perf_counter() - start)
+                        future.set_result(msg)
+                        return True
+
+                    waiting = self._pending.get(key)
+
+        return False
+
+    def discard(self,futures):
+        """
+        Stop waiting on futures (e.g. because they timed out).  A reply that
+        shows up later is treated like any other unsolicited message.
+        """
+
+        futures = set(futures)
+        with self._lock:
+
+            # Still waiting means the reply never came
+            for future in futures:
+                if self._started.pop(future,None) is not None and \
+                   self._metrics is not None:
+                    self._metrics.count_timeout("query")
+
+            for key in list(self._pending.keys()):
+                waiting = collections.deque([f for f in self._pending[key]
+                                             if f not in futures])
+                if len(waiting) == 0:
+                    del self._pending[key]
+                else:
+                    self._pending[key] = waiting
+
+    def fail_all(self,exc):
+        """
+        Fail every query still in flight with exc (e.g. on disconnect).
+        """
+
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._started = {}
+
+        for waiting in pending.values():
+            for future in waiting:
+                if not future.done():
+                    future.set_exception(exc)
+
+    @property
+    def num_pending(self):
+        """
+        Number of queries waiting on a reply.
+        """
+
+        return sum([len(w) for w in self._pending.values()])
@@ -0,0 +1,248 @@
+__description__ = \
+"""
+Find boards by asking them who they are, rather than hard-coding device paths
+that move around between reboots.  Every candidate port is probed at once, on
+its own thread, and the answers can be cached in a JSON file between runs.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import concurrent.futures, glob, json, os, struct, time
+
+import serial
+from serial.tools import list_ports
+
+from .arduino import ArduinoBoard
+from .PyCmdMessenger import CmdMessenger
+
+def candidate_ports(patterns=None):
+    """
+    Serial devices that could be boards.  With no patterns, every USB serial
+    port pyserial can see; otherwise the devices matching the glob patterns
+    (e.g. ["/dev/ttyACM*","/dev/ttyUSB*"]).  Returns a sorted list of paths.
+    """
+
+    if patterns is None:
+        return sorted([p.device for p in list_ports.comports() if p.vid is not None])
+
+    if type(patterns) == str:
+        patterns = [patterns]
+
+    devices = set()
+    for pattern in patterns:
+        devices.update(glob.glob(pattern))
+
+    return sorted(devices)
+
+def identify(device,commands,query="who_are_you",reply=None,timeout=3.0,
+             probe_interval=0.2,board_class=ArduinoBoard,**board_kwargs):
+    """
+    Ask the board on device who it is.  The query command is sent every
+    probe_interval seconds (the board may still be in its bootloader after
+    the port opens) until the reply command comes back or timeout seconds
+    pass.
+
+    Input:
+        device:
+            serial device to probe
+
+        commands:
+            command list for the sketch (see CmdMessenger)
+
+        query:
+            command to send
+            Default: "who_are_you"
+
+        reply:
+            command the board answers with.  None uses the reply declared for
+            query in commands (e.g. ["who_are_you","","my_name_is"]).
+            Default: None
+
+        timeout, probe_interval:
+            seconds to wait for an answer in all, and between queries
+            Default: 3.0, 0.2
+
+        board_class, board_kwargs:
+            used to open the port (e.g. baud_rate=115200)
+
+    Returns the first field of the reply as a string, or None if the port
+    could not be opened or never answered.
+    """
+
+    reply = _reply_name(commands,query,reply)
+
+    board_kwargs = dict(board_kwargs)
+    board_kwargs["settle_time"] = 0
+    board_kwargs["timeout"] = probe_interval
+
+    try:
+        board = board_class(device,**board_kwargs)
+    except (serial.SerialException,OSError,ValueError):
+        return None
+
+    try:
+        c = CmdMessenger(board,commands,warnings=False)
+
+        # Read against the probe deadline with receive_many, which keeps a
+        # partial message buffered rather than blocking until the port goes
+        # quiet: a port that streams something else (a GPS, a modem) never
+        # does.  Whatever cannot be framed or decoded is not an answer.
+        deadline = time.monotonic() + timeout
+        next_probe = 0
+        while True:
+
+            now = time.monotonic()
+            if now >= deadline:
+                break
+
+            if now >= next_probe:
+                c.send(query)
+                next_probe = now + probe_interval
+
+            wait = min(next_probe,deadline) - time.monotonic()
+            try:
+                batch = c.receive_many(1,deadline=max(wait,0))
+            except (ValueError,KeyError,IndexError,struct.error,EOFError):
+                continue
+
+            for cmd_name, received, message_time in batch:
+                if cmd_name == reply and len(received) > 0:
+                    return str(received[0])
+
+    except (serial.SerialException,OSError):
+        pass
+    finally:
+        board.close()
+
+    return None
+
+def discover(commands,devices=None,query="who_are_you",reply=None,cache=None,
+             expected=None,timeout=3.0,probe_interval=0.2,max_workers=None,
+             board_class=ArduinoBoard,**board_kwargs):
+    """
+    Probe every candidate port at the same time with identify() and map the
+    answers to their devices, so finding a rig of boards takes about as long
+    as the slowest one takes to answer.
+
+    Input:
+        commands, query, reply, timeout, probe_interval, board_class,
+        board_kwargs:
+            see identify
+
+        devices:
+            devices to probe, or glob patterns for them.  None probes every USB
+            serial port (see candidate_ports).
+            Default: None
+
+        cache:
+            JSON file holding the map from the last run.  If given, the cached
+            devices are checked first, and the full search is only done if a
+            board has moved (or one of expected is missing).  The map found
+            is written back to it.
+            Default: None
+
+        expected:
+            identities that should be found.  With a cache, the search stops
+            at the cached devices once all of these have answered.
+            Default: None
+
+        max_workers:
+            ports probed at the same time.  None probes them all at once.
+            Default: None
+
+    Returns a dict of {identity: device}.  Raises ValueError if two devices
+    give the same identity.
+    """
+
+    _reply_name(commands,query,reply)
+
+    probe_kwargs = dict(board_kwargs)
+    probe_kwargs.update({"query":query,"reply":reply,"timeout":timeout,
+                         "probe_interval":probe_interval,
+                         "board_class":board_class})
+
+    if cache is not None and os.path.exists(cache):
+        cached = load_cache(cache)
+        found = _probe_all(list(cached.values()),commands,max_workers,probe_kwargs)
+
+        # Every cached board is where it was (and nothing is missing)
+        if all([found.get(d) == i for i, d in cached.items()]):
+            if expected is None or set(expected) <= set(cached.keys()):
+                return cached
+
+    if devices is None or type(devices) == str or \
+       any([glob.has_magic(d) for d in devices]):
+        devices = candidate_ports(devices)
+
+    found = _probe_all(devices,commands,max_workers,probe_kwargs)
+
+    ports = {}
+    for device, identity in found.items():
+        if identity is None:
+            continue
+        if identity in ports:
+            err = "boards on {} and {} both answered '{}'".format(ports[identity],device,identity)
+            raise ValueError(err)
+        ports[identity] = device
+
+    if cache is not None:
+        save_cache(cache,ports)
+
+    return ports
+
+def _probe_all(devices,commands,max_workers,probe_kwargs):
+    """
+    Run identify on every device at once.  Returns {device: identity}.
+    """
+
+    devices = list(devices)
+    if len(devices) == 0:
+        return {}
+
+    if max_workers is None:
+        max_workers = len(devices)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = [executor.submit(identify,d,commands,**probe_kwargs)
+                   for d in devices]
+
+    return dict(zip(devices,[f.result() for f in futures]))
+
+def _reply_name(commands,query,reply):
+    """
+    Name of the command answering query.
+    """
+
+    if reply is not None:
+        return reply
+
+    for c in commands:
+        if c[0] == query:
+            if len(c) > 2 and c[2] is not None:
+                return c[2]
+            break
+    else:
+        err = "query command '{}' is not in commands".format(query)
+        raise ValueError(err)
+
+    err = "no reply command given or declared for '{}'".format(query)
+    raise ValueError(err)
+
+def load_cache(path):
+    """
+    Read a {identity: device} map written by save_cache.
+    """
+
+    with open(path) as f:
+        return dict(json.load(f))
+
+def save_cache(path,ports):
+    """
+    Write a {identity: device} map to path as JSON.  The file is replaced in
+    one step, so a reader never sees half of it.
+    """
+
+    tmp = "{}.tmp".format(path)
+    with open(tmp,"w") as f:
+        json.dump(ports,f,indent=2,sort_keys=True)
+    os.replace(tmp,path)
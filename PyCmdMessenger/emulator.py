@@ -0,0 +1,1085 @@
+__description__ = \
+"""
+Arduino running the CmdMessenger library, emulated in python on one end of a
+pty.  ArduinoBoard can be pointed at the other end (emulator.device) unchanged,
+so PyCmdMessenger can be tested and benchmarked without hardware.
+
+The emulator follows the bundled CmdMessenger.cpp (4.0 wire format): messages
+are collected in a 64 byte command buffer, separators are escaped with the
+escape character, text arguments are parsed with atoi/atol/strtod semantics and
+binary arguments are unescaped and copied byte for byte with the sizes of the
+emulated board.  Callbacks are python functions attached per command, written
+like the sketch callbacks:
+
+    def on_double_ping(arduino):
+        value = arduino.read_bin_arg("double")
+        arduino.send_bin_cmd("double_pong",value,"double")
+
+    arduino = ArduinoEmulator(["double_ping","double_pong"])
+    arduino.attach("double_ping",on_double_ping)
+    arduino.start()
+
+    board = ArduinoBoard(arduino.device,baud_rate=115200,settle_time=0)
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import binascii, math, os, select, struct, threading, time, tty
+
+# Values from CmdMessenger.h
+MAXCALLBACKS = 50
+MESSENGERBUFFERSIZE = 64
+MAXSTREAMBUFFERSIZE = 512
+DEFAULT_TIMEOUT = 5.0
+
+# Bytes in each type on each board (see ArduinoBoard and ArduinoDueBoard)
+BOARDS = {"uno":{"int":2,"long":4,"float":4,"double":4},
+          "due":{"int":4,"long":4,"float":4,"double":8}}
+
+_INT_FORMATS = {1:"b",2:"h",4:"i",8:"q"}
+_FLOAT_FORMATS = {4:"f",8:"d"}
+
+class ArduinoEmulator:
+    """
+    CmdMessenger sketch emulated on a pty.  The emulator reads from the pty on
+    its own thread and calls the attached callbacks there, one message at a
+    time, just like feedinSerialData() in loop().
+    """
+
+    def __init__(self,
+                 commands,
+                 board="uno",
+                 field_separator=",",
+                 command_separator=";",
+                 escape_separator="/",
+                 buffer_size=MESSENGERBUFFERSIZE,
+                 setup=None,
+                 loop=None,
+                 loop_interval=0.01):
+        """
+        Input:
+            commands:
+                command names, *in the same order* as the sketch's enum.  The
+                command lists given to CmdMessenger work too (only the names
+                are used).
+
+            board:
+                "uno" or "due", or a dict of the number of bytes in an int,
+                long, float and double (e.g. {"int":2,"long":4,"float":4,
+                "double":4}).
+                Default: "uno"
+
+            field_separator, command_separator, escape_separator:
+                separators passed to the CmdMessenger constructor in the sketch
+                Default: ",", ";", "/"
+
+            buffer_size:
+                MESSENGERBUFFERSIZE from CmdMessenger.h.  Longer messages are
+                dropped, as on the arduino.
+                Default: 64
+
+            setup:
+                function called with the emulator when it starts, like setup()
+                in a sketch (e.g. to send a welcome message).
+
+            loop, loop_interval:
+                function called with the emulator on every pass through
+                loop(), between reads of serial data (e.g. to stream
+                readings).  Without incoming data, passes happen every
+                loop_interval seconds.
+                Default: None, 0.01
+        """
+
+        self.names = []
+        for c in commands:
+            if type(c) == str:
+                self.names.append(c)
+            else:
+                self.names.append(c[0])
+        self._name_to_id = dict([(n,i) for i, n in enumerate(self.names)])
+
+        try:
+            self.board = BOARDS[board]
+        except (KeyError,TypeError):
+            self.board = dict(board)
+
+        for k in ["int","long","float","double"]:
+            if k not in self.board:
+                err = "board must give the number of bytes for '{}'".format(k)
+                raise ValueError(err)
+
+        self.field_separator = field_separator.encode("ascii")
+        self.command_separator = command_separator.encode("ascii")
+        self.escape_separator = escape_separator.encode("ascii")
+        self._special = [self.field_separator,self.command_separator,
+                         self.escape_separator,b"\0"]
+
+        self.buffer_size = buffer_size
+        self.setup = setup
+        self.loop = loop
+        self.loop_interval = loop_interval
+
+        self._callbacks = [None for i in range(MAXCALLBACKS)]
+        self._default_callback = None
+        self._print_newlines = False
+        self._use_crc = False
+        self.crc_errors = 0
+
+        # Board clock for micros() and millis().  clock_rate > 1 makes the
+        # board's crystal run fast compared to the host.
+        self.clock_rate = 1.0
+        self._clock_start = time.perf_counter()
+
+        # Struct formats for the C types callbacks can read and write in binary
+        self._ctypes = {"bool":"?",
+                        "byte":"B",
+                        "char":"c",
+                        "int8_t":"b",
+                        "uint8_t":"B",
+                        "int16_t":"h",
+                        "uint16_t":"H",
+                        "int32_t":"i",
+                        "uint32_t":"I",
+                        "int":_INT_FORMATS[self.board["int"]],
+                        "unsigned int":_INT_FORMATS[self.board["int"]].upper(),
+                        "long":_INT_FORMATS[self.board["long"]],
+                        "unsigned long":_INT_FORMATS[self.board["long"]].upper(),
+                        "float":_FLOAT_FORMATS[self.board["float"]],
+                        "double":_FLOAT_FORMATS[self.board["double"]]}
+
+        # Receiving state (processLine)
+        self._buffer = bytearray()
+        self._last_char = b""
+        self._input = bytearray()
+
+        # Arguments of the message being handled
+        self._args = []
+        self._arg_index = 0
+        self.arg_ok = False
+        self.command_id = 0
+
+        # Sending state
+        self._output = bytearray()
+        self._start_command = False
+
+        # The emulator keeps the slave end open so reads from the master never
+        # fail when nothing is connected.  Raw mode so nothing is echoed back.
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.device = os.ttyname(self._slave)
+
+        self._wake_read, self._wake_write = os.pipe()
+        self._thread = None
+        self._alive = False
+
+    def attach(self,cmd,callback):
+        """
+        Call callback(emulator) whenever cmd (name or id) arrives.
+        """
+
+        cmd_id = self._command_id(cmd)
+        if cmd_id >= 0 and cmd_id < MAXCALLBACKS:
+            self._callbacks[cmd_id] = callback
+
+    def attach_default(self,callback):
+        """
+        Call callback(emulator) for commands without an attached callback.
+        """
+
+        self._default_callback = callback
+
+    def print_lf_cr(self,add_new_line=True):
+        """
+        Send a newline after every command.
+        """
+
+        self._print_newlines = add_new_line
+
+    def use_crc16(self,enable=True):
+        """
+        Add a CRC16 field to every message sent and drop (and count in
+        crc_errors) messages received without a valid one.  Matches
+        CmdMessenger(...,crc=True) on the python side.
+        """
+
+        self._use_crc = enable
+
+    def micros(self):
+        """
+        Microseconds since the emulator was created, wrapping around like the
+        arduino's unsigned long micros().
+        """
+
+        elapsed = (time.perf_counter() - self._clock_start)*self.clock_rate
+
+        return int(elapsed*1e6) % 2**32
+
+    def millis(self):
+        """
+        Milliseconds since the emulator was created (see micros).
+        """
+
+        elapsed = (time.perf_counter() - self._clock_start)*self.clock_rate
+
+        return int(elapsed*1e3) % 2**32
+
+    # ------------------------------------------------------------------------
+    # Running
+
+    def start(self):
+        """
+        Run setup and start processing serial data.  Returns self.
+
+        pyserial flushes the input buffer when it opens a port, so anything
+        setup sends before ArduinoBoard is connected is lost (as it would be
+        from a real board).  Start the emulator after opening the board to see
+        it.
+        """
+
+        if self._thread is not None:
+            return self
+
+        if self.setup is not None:
+            self.setup(self)
+
+        self._alive = True
+        self._thread = threading.Thread(target=self._loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stop processing serial data.
+        """
+
+        if self._thread is None:
+            return
+
+        self._alive = False
+        os.write(self._wake_write,b"x")
+        self._thread.join(2)
+        self._thread = None
+
+    def close(self):
+        """
+        Stop and close the pty.  (Leaving a with block also does this.)
+        """
+
+        self.stop()
+        for fd in [self._master,self._slave,self._wake_read,self._wake_write]:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_val,exc_tb):
+        self.close()
+
+    def _loop(self):
+        """
+        loop() { cmdMessenger.feedinSerialData(); ... }
+        """
+
+        if self.loop is None:
+            timeout = None
+        else:
+            timeout = self.loop_interval
+
+        while self._alive:
+
+            if self.loop is not None:
+                self.loop(self)
+
+            if len(self._input) == 0:
+                try:
+                    readable = select.select([self._master,self._wake_read],[],[],
+                                             timeout)[0]
+                except (OSError,ValueError):
+                    break
+
+                if self._wake_read in readable:
+                    break
+
+                if self._master not in readable:
+                    continue
+
+                try:
+                    self._input += os.read(self._master,MAXSTREAMBUFFERSIZE)
+                except OSError:
+                    break
+
+            chunk = bytes(self._input[:MAXSTREAMBUFFERSIZE])
+            del self._input[:MAXSTREAMBUFFERSIZE]
+            self.feed(chunk)
+
+    def feed(self,data):
+        """
+        Process bytes as if they had arrived on the serial port, calling
+        callbacks for every complete message.  (The emulator thread calls this
+        with data read from the pty; it can also be called directly.)
+        """
+
+        data = bytes(data)
+        for i in range(len(data)):
+            if self._process_byte(data[i:i+1]):
+                self._handle_message()
+
+    def _process_byte(self,char):
+        """
+        CmdMessenger::processLine.  Returns True at the end of a message.
+        """
+
+        escaped = self._is_escaped(char)
+
+        if char == self.command_separator and not escaped:
+            end_of_message = len(self._buffer) > 0
+            if end_of_message:
+                message = bytes(self._buffer)
+                if self._use_crc:
+                    message = self._check_crc(message)
+                    if message is None:
+                        self.crc_errors += 1
+                        end_of_message = False
+                if end_of_message:
+                    self._parse_args(message)
+                self._last_char = b""
+            self._buffer = bytearray()
+            return end_of_message
+
+        self._buffer += char
+        if len(self._buffer) >= self.buffer_size - 1:
+            self._buffer = bytearray()
+
+        return False
+
+    def _is_escaped(self,char):
+        """
+        CmdMessenger::isEscaped.  An escaped escape character does not escape
+        the character after it.
+        """
+
+        escaped = self._last_char == self.escape_separator
+        self._last_char = char
+        if char == self.escape_separator and escaped:
+            self._last_char = b""
+
+        return escaped
+
+    def _check_crc(self,message):
+        """
+        CmdMessenger::checkCrc.  Returns message without its CRC field, or
+        None if the CRC is missing or wrong.
+        """
+
+        # Last unescaped field separator
+        separator = -1
+        last = b""
+        for i in range(len(message)):
+            char = message[i:i+1]
+            escaped = last == self.escape_separator
+            last = char
+            if char == self.escape_separator and escaped:
+                last = b""
+            if char == self.field_separator and not escaped:
+                separator = i
+
+        if separator < 0:
+            return None
+
+        received = self.unescape(message[separator+1:])
+        if len(received) != 2:
+            return None
+
+        body = message[:separator]
+        if struct.unpack("<H",received)[0] != binascii.crc_hqx(body,0):
+            return None
+
+        return body
+
+    def _parse_args(self,message):
+        """
+        Split a message into its (still escaped) arguments the way split_r
+        does: stop at an unescaped null, split on unescaped field separators
+        and skip empty arguments.
+        """
+
+        args = []
+        current = bytearray()
+        last = b""
+        for i in range(len(message)):
+
+            char = message[i:i+1]
+            escaped = last == self.escape_separator
+            last = char
+            if char == self.escape_separator and escaped:
+                last = b""
+
+            if char == b"\0" and not escaped:
+                break
+
+            if char == self.field_separator and not escaped:
+                if len(current) > 0:
+                    args.append(bytes(current))
+                current = bytearray()
+            else:
+                current += char
+
+        if len(current) > 0:
+            args.append(bytes(current))
+
+        self._args = args
+        self._arg_index = 0
+
+    def _handle_message(self):
+        """
+        CmdMessenger::handleMessage
+        """
+
+        self.command_id = self.read_int16_arg()
+        if self.command_id >= 0 and self.command_id < MAXCALLBACKS and \
+           self.arg_ok and self._callbacks[self.command_id] is not None:
+            self._callbacks[self.command_id](self)
+        elif self._default_callback is not None:
+            self._default_callback(self)
+
+    # ------------------------------------------------------------------------
+    # Reading arguments
+
+    def _next(self):
+        """
+        Next argument (escaped, as on the arduino) or None.
+        """
+
+        if self._arg_index >= len(self._args):
+            self.arg_ok = False
+            return None
+
+        arg = self._args[self._arg_index]
+        self._arg_index += 1
+        self.arg_ok = True
+
+        return arg
+
+    def available(self):
+        """
+        Whether there is another argument to read.
+        """
+
+        return self._arg_index < len(self._args)
+
+    def read_int16_arg(self):
+        arg = self._next()
+        if arg is None:
+            return 0
+        return _wrap(_atoi(arg),2)
+
+    def read_int32_arg(self):
+        arg = self._next()
+        if arg is None:
+            return 0
+        return _wrap(_atoi(arg),4)
+
+    def read_bool_arg(self):
+        return self.read_int16_arg() != 0
+
+    def read_char_arg(self):
+        arg = self._next()
+        if arg is None:
+            return b"\0"
+        return arg[:1]
+
+    def read_float_arg(self):
+        arg = self._next()
+        if arg is None:
+            return 0.0
+        return self._to_board(_strtod(arg),"float")
+
+    def read_double_arg(self):
+        arg = self._next()
+        if arg is None:
+            return 0.0
+        return self._to_board(_strtod(arg),"double")
+
+    def read_string_arg(self):
+        """
+        Next argument as bytes.  Like readStringArg, this is not unescaped.
+        """
+
+        arg = self._next()
+        if arg is None:
+            return b""
+        return arg
+
+    def read_bin_arg(self,ctype):
+        """
+        readBinArg<ctype>: unescape the next argument and copy sizeof(ctype)
+        bytes out of it (padding with nulls if it is too short).
+        """
+
+        fmt = self._ctype_format(ctype)
+        size = struct.calcsize(fmt)
+
+        arg = self._next()
+        if arg is None:
+            value = b"\0"*size
+        else:
+            value = self.unescape(arg)[:size]
+            value = value + b"\0"*(size - len(value))
+
+        return struct.unpack("<" + fmt,value)[0]
+
+    def unescape(self,value):
+        """
+        Drop each escape character, keeping the character after it.
+        """
+
+        out = bytearray()
+        i = 0
+        while i < len(value):
+            if value[i:i+1] == self.escape_separator:
+                i += 1
+            out += value[i:i+1]
+            i += 1
+
+        return bytes(out)
+
+    # ------------------------------------------------------------------------
+    # Sending
+
+    def send_cmd(self,cmd,arg=None,req_ack=False,ack_cmd=1,timeout=DEFAULT_TIMEOUT):
+        """
+        Send a command with an optional argument sent as text.
+        """
+
+        if self._start_command:
+            return False
+
+        self.send_cmd_start(cmd)
+        if arg is not None:
+            self.send_cmd_arg(arg)
+
+        return self.send_cmd_end(req_ack,ack_cmd,timeout)
+
+    def send_bin_cmd(self,cmd,arg,ctype,req_ack=False,ack_cmd=1,
+                     timeout=DEFAULT_TIMEOUT):
+        """
+        Send a command with one argument sent in binary as ctype.
+        """
+
+        if self._start_command:
+            return False
+
+        self.send_cmd_start(cmd)
+        self.send_cmd_bin_arg(arg,ctype)
+
+        return self.send_cmd_end(req_ack,ack_cmd,timeout)
+
+    def send_cmd_start(self,cmd):
+        if not self._start_command:
+            self._start_command = True
+            self._output += "{}".format(self._command_id(cmd)).encode("ascii")
+
+    def send_cmd_arg(self,arg,n=None):
+        """
+        Send arg as text, the way Arduino's Print does: floats with n (default
+        2) decimals, ints in base n (default 10), bools as 1/0, strings and
+        bytes as is (not escaped).
+        """
+
+        if self._start_command:
+            self._output += self.field_separator + self._print(arg,n)
+
+    def send_cmd_esc_arg(self,arg):
+        if self._start_command:
+            if type(arg) == str:
+                arg = arg.encode("ascii")
+            self._output += self.field_separator + self._escape(arg)
+
+    def send_cmd_sci_arg(self,arg,n=6):
+        if self._start_command:
+            self._output += self.field_separator + _print_sci(arg,n)
+
+    def send_cmd_bin_arg(self,arg,ctype):
+        if self._start_command:
+            fmt = self._ctype_format(ctype)
+            self._output += self.field_separator + \
+                            self._escape(struct.pack("<" + fmt,arg))
+
+    def send_cmd_end(self,req_ack=False,ack_cmd=1,timeout=DEFAULT_TIMEOUT):
+
+        ack_reply = False
+        if self._start_command:
+            if self._use_crc:
+                crc = struct.pack("<H",binascii.crc_hqx(bytes(self._output),0))
+                self._output += self.field_separator + self._escape(crc)
+            self._output += self.command_separator
+            if self._print_newlines:
+                self._output += b"\r\n"
+            self._flush()
+            if req_ack:
+                ack_reply = self._blocked_till_reply(timeout,self._command_id(ack_cmd))
+
+        self._start_command = False
+
+        return ack_reply
+
+    def _flush(self):
+        """
+        Write everything sent so far to the pty.
+        """
+
+        data = memoryview(bytes(self._output))
+        self._output = bytearray()
+        while len(data) > 0:
+            try:
+                data = data[os.write(self._master,data):]
+            except BlockingIOError:
+                select.select([],[self._master],[])
+
+    def _blocked_till_reply(self,timeout,ack_cmd):
+        """
+        Process incoming bytes until ack_cmd arrives or timeout passes.  Other
+        messages that arrive in the meantime are dropped, as on the arduino.
+        """
+
+        end = time.time() + timeout
+        while True:
+
+            while len(self._input) > 0:
+                char = bytes(self._input[:1])
+                del self._input[:1]
+                if self._process_byte(char):
+                    if self.read_int16_arg() == ack_cmd and self.arg_ok:
+                        return True
+
+            remaining = end - time.time()
+            if remaining <= 0:
+                return False
+
+            readable = select.select([self._master],[],[],remaining)[0]
+            if len(readable) > 0:
+                self._input += os.read(self._master,MAXSTREAMBUFFERSIZE)
+
+    # ------------------------------------------------------------------------
+    # Helpers
+
+    def _command_id(self,cmd):
+        """
+        Command id for a command name (ids are passed through).
+        """
+
+        if type(cmd) == int:
+            return cmd
+
+        try:
+            return self._name_to_id[cmd]
+        except KeyError:
+            err = "Command '{}' not recognized.\n".format(cmd)
+            raise ValueError(err)
+
+    def _ctype_format(self,ctype):
+
+        try:
+            return self._ctypes[ctype]
+        except KeyError:
+            err = "C type '{}' not recognized. Should be one of:\n{}\n".format(
+                  ctype,", ".join(sorted(self._ctypes.keys())))
+            raise ValueError(err)
+
+    def _to_board(self,value,ctype):
+        """
+        Round a python float to the precision of ctype on the board.
+        """
+
+        fmt = "<" + self._ctype_format(ctype)
+        try:
+            return struct.unpack(fmt,struct.pack(fmt,value))[0]
+        except OverflowError:
+            return math.copysign(float("inf"),value)
+
+    def _escape(self,value):
+        """
+        CmdMessenger::printEsc
+        """
+
+        out = bytearray()
+        for i in range(len(value)):
+            char = value[i:i+1]
+            if char in self._special:
+                out += self.escape_separator
+            out += char
+
+        return bytes(out)
+
+    def _print(self,arg,n=None):
+        """
+        Text for arg as printed by Arduino's Print class.
+        """
+
+        if type(arg) == bytes:
+            return arg
+        if type(arg) == str:
+            return arg.encode("ascii")
+        if type(arg) == bool:
+            return b"1" if arg else b"0"
+        if type(arg) == float:
+            if n is None:
+                n = 2
+            return _print_float(self._to_board(arg,"double"),n)
+
+        if n is None or n == 10:
+            return "{}".format(arg).encode("ascii")
+
+        # Print(long,base) prints negative numbers in other bases as unsigned
+        if arg < 0:
+            arg += 2**(8*self.board["long"])
+        digits = []
+        while True:
+            digits.append("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"[arg % n])
+            arg = arg // n
+            if arg == 0:
+                break
+
+        return "".join(reversed(digits)).encode("ascii")
+
+
+def _atoi(value):
+    """
+    atoi/atol: optional whitespace and sign, then digits.  Anything else stops
+    the parse.
+    """
+
+    value = value.lstrip(b" \t\n\r\f\v")
+    sign = 1
+    if value[:1] in (b"-",b"+"):
+        if value[:1] == b"-":
+            sign = -1
+        value = value[1:]
+
+    number = 0
+    for i in range(len(value)):
+        digit = value[i:i+1]
+        if not digit.isdigit():
+            break
+        number = number*10 + int(digit)
+
+    return sign*number
+
+def _strtod(value):
+    """
+    strtod: the longest prefix of value that parses as a float.
+    """
+
+    value = value.lstrip(b" \t\n\r\f\v")
+    for end in range(len(value),0,-1):
+        try:
+            return float(value[:end].decode("ascii"))
+        except (ValueError,UnicodeDecodeError):
+            continue
+
+    return 0.0
+
+def _wrap(value,num_bytes):
+    """
+    Convert an integer to a signed num_bytes integer the way C does.
+    """
+
+    value = value % 2**(8*num_bytes)
+    if value >= 2**(8*num_bytes-1):
+        value -= 2**(8*num_bytes)
+
+    return value
+
+def _print_float(number,digits=2):
+    """
+    Print::printFloat
+    """
+
+    if math.isnan(number):
+        return b"nan"
+    if math.isinf(number):
+        return b"inf"
+    if number > 4294967040.0 or number < -4294967040.0:
+        return b"ovf"
+
+    out = ""
+    if number < 0.0:
+        out = "-"
+        number = -number
+
+    rounding = 0.5
+    for i in range(digits):
+        rounding /= 10.0
+    number += rounding
+
+    int_part = int(number)
+    remainder = number - int_part
+    out += "{}".format(int_part)
+
+    if digits > 0:
+        out += "."
+
+    while digits > 0:
+        remainder *= 10.0
+        to_print = int(remainder)
+        out += "{}".format(to_print)
+        remainder -= to_print
+        digits -= 1
+
+    return out.encode("ascii")
+
+def _print_sci(f,digits):
+    """
+    CmdMessenger::printSci
+    """
+
+    out = ""
+    if f < 0.0:
+        out = "-"
+        f = -f
+
+    if math.isinf(f):
+        return (out + "INF").encode("ascii")
+    if math.isnan(f):
+        return (out + "NaN").encode("ascii")
+
+    digits = min(digits,6)
+    multiplier = 10**digits
+
+    if abs(f) < 10.0:
+        exponent = 0
+    else:
+        exponent = int(math.log10(f))
+
+    g = struct.unpack("<f",struct.pack("<f",f/10.0**exponent))[0]
+    if g < 1.0 and g != 0.0:
+        g *= 10
+        exponent -= 1
+
+    whole = int(g)
+    part = int((g - whole)*multiplier + 0.5)
+
+    # CmdMessenger only checks for rounding up to 100
+    if part == 100:
+        whole += 1
+        part = 0
+
+    out += "{}.{:0{}d}E{:+d}".format(whole,part,digits,exponent)
+
+    return out.encode("ascii")
+
+
+# ----------------------------------------------------------------------------
+# The test sketches
+
+PINGPONG_COMMANDS = ["kCommError","kComment","kAcknowledge","kAreYouReady",
+                     "kError","kAskUsIfReady","kYouAreReady","kValuePing",
+                     "kValuePong","kMultiValuePing","kMultiValuePong",
+                     "kRequestReset","kRequestResetAcknowledge",
+                     "kRequestSeries","kReceiveSeries","kDoneReceiveSeries",
+                     "kPrepareSendSeries","kSendSeries","kAckSendSeries"]
+
+PINGPONG_TYPES = ["kBool","kInt16","kInt32","kFloat","kFloatSci","kDouble",
+                  "kDoubleSci","kChar","kString","kBBool","kBByte","kBInt16",
+                  "kBInt32","kBFloat","kBDouble","kBChar","kEscString"]
+
+def pingpong_sketch(board="uno",**kwargs):
+    """
+    Emulator running test/pingpong_arduino/main.cpp.  Keyword arguments are
+    passed to ArduinoEmulator.
+    """
+
+    series = {"length":0,"count":0}
+
+    def on_arduino_ready(a):
+        a.send_cmd("kAcknowledge","Arduino ready")
+
+    def on_unknown_command(a):
+        a.send_cmd("kError","Unknown command")
+        a.send_cmd_start("kYouAreReady")
+        a.send_cmd_arg("Command without attached callback")
+        a.send_cmd_arg(a.command_id)
+        a.send_cmd_end()
+
+    def on_ask_us_if_ready(a):
+        is_ack = a.send_cmd("kAreYouReady","Asking PC if ready",True,
+                            "kAcknowledge",1.0)
+        a.send_cmd("kYouAreReady",1 if is_ack else 0)
+
+    def on_value_ping(a):
+
+        data_type = a.read_int16_arg()
+        try:
+            data_type = PINGPONG_TYPES[data_type]
+        except IndexError:
+            data_type = None
+
+        text = {"kBool":a.read_bool_arg,
+                "kInt16":a.read_int16_arg,
+                "kInt32":a.read_int32_arg,
+                "kFloat":a.read_float_arg,
+                "kDouble":a.read_double_arg,
+                "kChar":a.read_char_arg,
+                "kString":a.read_string_arg}
+        binary = {"kBBool":"bool",
+                  "kBByte":"byte",
+                  "kBInt16":"int16_t",
+                  "kBInt32":"int32_t",
+                  "kBFloat":"float",
+                  "kBDouble":"double",
+                  "kBChar":"char"}
+
+        if data_type in text:
+            a.send_cmd("kValuePong",text[data_type]())
+        elif data_type in binary:
+            value = a.read_bin_arg(binary[data_type])
+            a.send_bin_cmd("kValuePong",value,binary[data_type])
+        elif data_type in ("kFloatSci","kDoubleSci"):
+            if data_type == "kFloatSci":
+                value = a.read_float_arg()
+            else:
+                value = a.read_double_arg()
+            a.send_cmd_start("kValuePong")
+            a.send_cmd_sci_arg(value,10)
+            a.send_cmd_end()
+        elif data_type == "kEscString":
+            value = a.unescape(a.read_string_arg())
+            a.send_cmd_start("kValuePong")
+            a.send_cmd_esc_arg(value)
+            a.send_cmd_end()
+        else:
+            a.send_cmd("kError","Unsupported type for valuePing!")
+
+    def on_multi_value_ping(a):
+        value_int16 = a.read_bin_arg("int16_t")
+        value_int32 = a.read_bin_arg("int32_t")
+        value_double = a.read_bin_arg("double")
+
+        a.send_cmd_start("kMultiValuePong")
+        a.send_cmd_bin_arg(value_int16,"int16_t")
+        a.send_cmd_bin_arg(value_int32,"int32_t")
+        a.send_cmd_bin_arg(value_double,"double")
+        a.send_cmd_end()
+
+    def on_request_reset(a):
+        series["count"] = 0
+        a.send_cmd("kRequestResetAcknowledge","")
+
+    def on_request_series(a):
+        length = a.read_int16_arg()
+        base = a.read_float_arg()
+        for i in range(length):
+            a.send_cmd_start("kReceiveSeries")
+            a.send_cmd_arg(a._to_board(float(i)*base,"float"),6)
+            a.send_cmd_end()
+        a.send_cmd("kDoneReceiveSeries","")
+
+    def on_prepare_send_series(a):
+        series["length"] = a.read_int16_arg()
+        series["count"] = 0
+
+    def on_send_series(a):
+        series["count"] += 1
+        if series["count"] == series["length"]:
+            a.send_cmd("kAckSendSeries","")
+
+    def setup(a):
+        a.send_cmd("kAcknowledge","Arduino has resetted!")
+
+    arduino = ArduinoEmulator(PINGPONG_COMMANDS,board,setup=setup,**kwargs)
+    arduino.attach("kAreYouReady",on_arduino_ready)
+    arduino.attach("kAskUsIfReady",on_ask_us_if_ready)
+    arduino.attach("kValuePing",on_value_ping)
+    arduino.attach("kMultiValuePing",on_multi_value_ping)
+    arduino.attach_default(on_unknown_command)
+    arduino.attach("kRequestReset",on_request_reset)
+    arduino.attach("kRequestSeries",on_request_series)
+    arduino.attach("kPrepareSendSeries",on_prepare_send_series)
+    arduino.attach("kSendSeries",on_send_series)
+
+    return arduino
+
+def rapid_float_sketch(board="uno",**kwargs):
+    """
+    Emulator running test/rapid-float_arduino/src/main.cpp.
+    """
+
+    def on_double_ping(a):
+        value = a.read_bin_arg("double")
+        a.send_bin_cmd("double_pong",value,"double")
+
+    arduino = ArduinoEmulator(["double_ping","double_pong"],board,**kwargs)
+    arduino.attach("double_ping",on_double_ping)
+
+    return arduino
+
+def clock_sketch(board="uno",**kwargs):
+    """
+    Emulator running a sketch that answers kGetMicros with kMicros (its
+    micros() as an unsigned long) and kGetReading with kReading (micros() and
+    a float reading), for clock synchronization.
+    """
+
+    def on_get_micros(a):
+        a.send_bin_cmd("kMicros",a.micros(),"unsigned long")
+
+    def on_get_reading(a):
+        a.send_cmd_start("kReading")
+        a.send_cmd_bin_arg(a.micros(),"unsigned long")
+        a.send_cmd_bin_arg(1.5,"float")
+        a.send_cmd_end()
+
+    arduino = ArduinoEmulator(["kGetMicros","kMicros","kGetReading","kReading"],
+                              board,**kwargs)
+    arduino.attach("kGetMicros",on_get_micros)
+    arduino.attach("kGetReading",on_get_reading)
+
+    return arduino
+
+def duplex_sketch(board="uno",**kwargs):
+    """
+    Emulator running test/duplex/main.cpp: reads three doubles while sending
+    them back in an unterminated command.
+    """
+
+    def on_double_ping(a):
+        a.send_cmd_start("double_pong")
+        for i in range(3):
+            value = a.read_bin_arg("double")
+            a.send_cmd_bin_arg(value,"double")
+        a.send_cmd_end()
+
+    arduino = ArduinoEmulator(["double_ping","double_pong"],board,**kwargs)
+    arduino.attach("double_ping",on_double_ping)
+
+    return arduino
+
+def example_sketch(name="Bob",board="uno",**kwargs):
+    """
+    Emulator running examples/arduino/example.ino, answering who_are_you with
+    name.
+    """
+
+    def on_who_are_you(a):
+        a.send_cmd("my_name_is",name)
+
+    def on_sum_two_ints(a):
+        value1 = a.read_bin_arg("int")
+        value2 = a.read_bin_arg("int")
+        a.send_bin_cmd("sum_is",value1 + value2,"int")
+
+    def on_unknown_command(a):
+        a.send_cmd("error","Command without callback.")
+
+    arduino = ArduinoEmulator(["who_are_you","my_name_is","sum_two_ints",
+                               "sum_is","error"],board,**kwargs)
+    arduino.attach("who_are_you",on_who_are_you)
+    arduino.attach("sum_two_ints",on_sum_two_ints)
+    arduino.attach_default(on_unknown_command)
+
+    return arduino
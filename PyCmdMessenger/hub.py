@@ -0,0 +1,348 @@
+__description__ = \
+"""
+Run many boards from one thread: a selectors loop that reads whichever serial
+ports are ready and dispatches their messages, tagged with the board they came
+from.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import concurrent.futures, os, selectors, threading
+
+from .inbound import InboundQueue
+
+class MessengerHub:
+    """
+    Reads any number of CmdMessenger instances from a single thread.  Instead
+    of one reader thread per port (each waking up for its own port), one
+    selector waits on every port at once; each port that is ready is read in
+    full with one os.read and every complete message in it is decoded and
+    dispatched as
+
+        (board_name, cmd_name, received, message_time)
+
+    to the callback passed to the hub, or to a bounded queue read with get()
+    and messages().  Replies to query()/query_async() go to the query instead.
+
+        hub = MessengerHub()
+        for i, device in enumerate(devices):
+            board = ArduinoBoard(device,baud_rate=115200)
+            hub.add("board{}".format(i),CmdMessenger(board,commands))
+        hub.start()
+
+        hub.send("board3","kSetLed",1)
+        for board_name, cmd_name, received, message_time in hub.messages():
+            ...
+
+    Messengers added to a hub belong to it: do not call their receive or
+    query methods directly.  Sending through them (or through hub.send) is
+    fine.  Ports need a file descriptor (serial devices, ptys and sockets;
+    not loop://).
+    """
+
+    def __init__(self,callback=None,maxsize=1000,policy="block",
+                 command_policies=None):
+        """
+        Input:
+            callback:
+                called as callback(board_name,cmd_name,received,message_time)
+                for every message, on the hub's thread (so keep it short).  If
+                None, messages are queued for get().
+                Default: None
+
+            maxsize, policy, command_policies:
+                size of the queue and what to do when it is full (see
+                CmdMessengerThreaded.enable_queue).  Conflation keeps the
+                latest message per command from each board.
+                command_policies can also be keyed by (board_name, cmd_name)
+                to set the policy for one board.
+        """
+
+        self.callback = callback
+        if callback is None:
+            self._queue = InboundQueue(maxsize,policy,command_policies)
+        else:
+            self._queue = None
+
+        self._selector = selectors.DefaultSelector()
+        self._messengers = {}
+        self.lost = {}
+
+        self._wake_read, self._wake_write = os.pipe()
+        self._selector.register(self._wake_read,selectors.EVENT_READ,None)
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self.alive = False
+
+    def add(self,name,messenger):
+        """
+        Start reading messenger (a CmdMessenger) as board name.
+        """
+
+        try:
+            fd = messenger.board.comm.fileno()
+        except (AttributeError,OSError,ValueError):
+            err = "MessengerHub needs a port with a file descriptor ({})".format(messenger.board.device)
+            raise ValueError(err)
+
+        with self._lock:
+            if name in self._messengers:
+                err = "a board named '{}' is already in the hub".format(name)
+                raise ValueError(err)
+
+            self._messengers[name] = messenger
+            self.lost.pop(name,None)
+            self._selector.register(fd,selectors.EVENT_READ,(name,messenger))
+
+        self._wake()
+
+    def remove(self,name):
+        """
+        Stop reading board name.  Returns its messenger.
+        """
+
+        with self._lock:
+            messenger = self._messengers.pop(name)
+            try:
+                self._selector.unregister(messenger.board.comm.fileno())
+            except (KeyError,ValueError,OSError):
+                pass
+
+        self._wake()
+
+        return messenger
+
+    def _wake(self):
+        """
+        Wake the loop up (to notice new boards or stop).
+        """
+
+        try:
+            os.write(self._wake_write,b"x")
+        except OSError:
+            pass
+
+    def start(self):
+        """
+        Run the loop on a daemon thread.
+        """
+
+        if self._thread is not None:
+            return
+
+        self.alive = True
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def run(self):
+        """
+        Read and dispatch until stop() is called.
+        """
+
+        self.alive = True
+        while self.alive:
+            self.poll(None)
+
+    def poll(self,timeout=0):
+        """
+        Wait up to timeout seconds (forever if None) for any port to be
+        ready, then read and dispatch everything waiting on every ready port.
+        Returns the number of messages dispatched (replies handed to queries
+        are not counted).  For running the hub from your own loop instead of
+        start().
+        """
+
+        num_messages = 0
+        for key, events in self._selector.select(timeout):
+
+            if key.data is None:
+                try:
+                    os.read(self._wake_read,4096)
+                except OSError:
+                    pass
+                continue
+
+            name, messenger = key.data
+            try:
+                chunk = os.read(key.fd,65536)
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                self._lose(name,e)
+                continue
+
+            if len(chunk) == 0:
+                self._lose(name,EOFError("serial device disconnected"))
+                continue
+
+            messenger.board.log_read(chunk)
+            num_messages += self._handle_chunk(name,messenger,chunk)
+
+        return num_messages
+
+    def _handle_chunk(self,name,messenger,chunk):
+        """
+        Split freshly read bytes into messages and dispatch them.  Messages
+        that cannot be decoded are counted in the messenger's corruption
+        stats and skipped.
+        """
+
+        num_messages = 0
+        for fields, message_time in messenger._frames_from_chunk(chunk):
+
+            msg = messenger._decode_counted(fields)
+            if msg is None:
+                continue
+            cmd_name, received = msg
+
+            num_messages += 1
+            if self._queue is None:
+                self.callback(name,cmd_name,received,message_time)
+            else:
+                self._queue.put(cmd_name,(name,cmd_name,received,message_time),
+                                key=(name,cmd_name))
+
+        return num_messages
+
+    def _lose(self,name,error):
+        """
+        Stop reading a board whose port failed, keeping the error in lost.
+        """
+
+        try:
+            self.remove(name)
+        except KeyError:
+            pass
+        self.lost[name] = error
+
+    def stop(self):
+        """
+        Stop the loop (the boards stay open).
+        """
+
+        self.alive = False
+        self._wake()
+        if self._thread is not None and threading.current_thread() is not self._thread:
+            self._thread.join(2)
+        self._thread = None
+
+    def close(self):
+        """
+        Stop the loop and close every board.
+        """
+
+        # Closing the queue first frees a hub thread blocked putting into a
+        # full queue, so stop() does not wait out its join
+        if self._queue is not None:
+            self._queue.close()
+        self.stop()
+
+        for name in list(self._messengers.keys()):
+            self.remove(name).board.close()
+
+        self._selector.close()
+        for fd in [self._wake_read,self._wake_write]:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def get(self,timeout=None):
+        """
+        Next (board_name, cmd_name, received, message_time), waiting up to
+        timeout seconds (forever if None).  Returns None on timeout.
+        """
+
+        if self._queue is None:
+            err = "messages go to the callback; there is no queue to get from"
+            raise RuntimeError(err)
+
+        return self._queue.get(timeout)
+
+    def messages(self,timeout=None):
+        """
+        Iterate over messages as they arrive, until none has arrived for
+        timeout seconds (never, if None) or the hub is closed.
+        """
+
+        while True:
+            msg = self.get(timeout)
+            if msg is None:
+                return
+            yield msg
+
+    def dropped_messages(self):
+        """
+        Number of messages dropped from the queue, by command.
+        """
+
+        if self._queue is None:
+            return {}
+
+        return dict(self._queue.dropped)
+
+    def send(self,name,cmd,*args,**kwargs):
+        """
+        Send a command to board name.
+        """
+
+        self._messengers[name].send(cmd,*args,**kwargs)
+
+    def query_async(self,name,cmd,*args,**kwargs):
+        """
+        Send a command to board name and return a concurrent.futures.Future
+        that completes with the reply (cmd_name, received, message_time).
+        """
+
+        messenger = self._messengers[name]
+        future = messenger._expect_reply(cmd)
+        try:
+            messenger.send(cmd,*args,**kwargs)
+        except Exception:
+            messenger._correlator.discard([future])
+            raise
+
+        return future
+
+    def query(self,name,cmd,*args,**kwargs):
+        """
+        Send a command to board name and wait for its reply.  timeout
+        (seconds) can be passed as a keyword argument and defaults to the
+        board timeout; None is returned if it passes first.
+        """
+
+        messenger = self._messengers[name]
+        timeout = kwargs.pop("timeout",messenger.board.timeout)
+
+        future = self.query_async(name,cmd,*args,**kwargs)
+        try:
+            concurrent.futures.wait([future],timeout)
+        finally:
+            messenger._correlator.discard([future])
+
+        if future.done():
+            return future.result()
+
+        return None
+
+    @property
+    def names(self):
+        return list(self._messengers.keys())
+
+    def __getitem__(self,name):
+        return self._messengers[name]
+
+    def __contains__(self,name):
+        return name in self._messengers
+
+    def __len__(self):
+        return len(self._messengers)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self,exc_type,exc_val,exc_tb):
+        self.close()
@@ -0,0 +1,257 @@
+__description__ = \
+"""
+Bounded queue for messages coming in from the arduino, with a choice of what
+to do when the consumer falls behind.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import collections, threading, time
+
+POLICIES = ["block","drop_oldest","drop_newest","conflate"]
+
+class InboundQueue:
+    """
+    First-in, first-out queue of (cmd_name, received, message_time) messages
+    holding at most maxsize messages.  What happens to a message that arrives
+    when the queue is full depends on the policy for its command:
+
+        block:       wait for room (the reader stops reading, so the arduino
+                     is held back by the serial buffers)
+        drop_oldest: throw away the oldest message in the queue that may be
+                     dropped (see below)
+        drop_newest: throw away the message that just arrived
+        conflate:    keep only the latest message per command.  A new message
+                     replaces one for the same command that is still waiting
+                     (keeping its place in line); if the queue is full, the
+                     oldest message that may be dropped is dropped.
+
+    Messages for block commands are never thrown away to make room: if every
+    queued message is a block message, a drop_oldest or conflate message that
+    finds the queue full is dropped itself.
+    Every message that is thrown away (or replaced) is counted per command in
+    dropped.
+    """
+
+    def __init__(self,maxsize,policy="block",command_policies=None):
+        """
+        Input:
+            maxsize:
+                maximum number of messages waiting in the queue
+
+            policy:
+                what to do with messages when the queue is full (see above)
+                Default: "block"
+
+            command_policies:
+                dictionary overriding policy for particular commands (e.g.
+                {"temperature":"conflate","alarm":"block"})
+        """
+
+        if maxsize < 1:
+            err = "maxsize must be at least 1"
+            raise ValueError(err)
+
+        if command_policies is None:
+            command_policies = {}
+
+        for p in [policy] + list(command_policies.values()):
+            if p not in POLICIES:
+                err = "policy '{}' not recognized. Should be one of:\n{}\n".format(p,
+                                                                   ", ".join(POLICIES))
+                raise ValueError(err)
+
+        self.maxsize = maxsize
+        self.policy = policy
+        self.command_policies = dict(command_policies)
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+        # Entries are [cmd_name, msg, policy, key] lists so conflation can swap
+        # msg in place.  _latest holds the queued conflate entry for each key.
+        self._entries = collections.deque()
+        self._latest = {}
+
+        self.dropped = {}
+        self.closed = False
+
+    def put(self,cmd_name,msg,timeout=None,key=None):
+        """
+        Add msg (a cmd_name message) to the queue.  Returns False if it was
+        dropped.  With the block policy, waits up to timeout seconds (forever
+        if None) for room.
+
+        key is what conflation goes by (default: cmd_name), e.g. (board_name,
+        cmd_name) to keep the latest message per command from each board.  A
+        policy given for key in command_policies overrides the one for
+        cmd_name.
+        """
+
+        if key is None:
+            key = cmd_name
+            policy = self.command_policies.get(cmd_name,self.policy)
+        else:
+            policy = self.command_policies.get(key)
+            if policy is None:
+                policy = self.command_policies.get(cmd_name,self.policy)
+
+        with self._lock:
+
+            if policy == "conflate":
+                entry = self._latest.get(key)
+                if entry is not None:
+                    self._count_drop(cmd_name)
+                    entry[1] = msg
+                    return True
+
+            if len(self._entries) >= self.maxsize:
+
+                if policy == "block":
+                    if not self._wait_for_room(timeout):
+                        self._count_drop(cmd_name)
+                        return False
+
+                elif policy == "drop_newest":
+                    self._count_drop(cmd_name)
+                    return False
+
+                elif not self._evict_oldest():
+                    self._count_drop(cmd_name)
+                    return False
+
+            entry = [cmd_name,msg,policy,key]
+            self._entries.append(entry)
+            if policy == "conflate":
+                self._latest[key] = entry
+
+            self._not_empty.notify()
+
+        return True
+
+    def get(self,timeout=None):
+        """
+        Remove and return the oldest message, waiting up to timeout seconds
+        (forever if None) for one.  Returns None on timeout or once the queue
+        is closed and empty.
+        """
+
+        with self._lock:
+
+            if timeout is not None:
+                end = time.monotonic() + timeout
+
+            while len(self._entries) == 0 and not self.closed:
+                if timeout is None:
+                    self._not_empty.wait()
+                else:
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    self._not_empty.wait(remaining)
+
+            if len(self._entries) == 0:
+                return None
+
+            entry = self._entries.popleft()
+            self._forget(entry)
+            self._not_full.notify()
+
+        return entry[1]
+
+    def get_many(self,max_count,timeout=None):
+        """
+        Remove and return up to max_count messages as a list, waiting up to
+        timeout seconds (forever if None) for max_count to arrive.  Everything
+        already queued is taken in one go under the lock.
+        """
+
+        batch = []
+
+        with self._lock:
+
+            if timeout is not None:
+                end = time.monotonic() + timeout
+
+            while True:
+
+                while len(self._entries) > 0 and len(batch) < max_count:
+                    entry = self._entries.popleft()
+                    self._forget(entry)
+                    batch.append(entry[1])
+                self._not_full.notify_all()
+
+                if len(batch) >= max_count or self.closed:
+                    break
+
+                if timeout is None:
+                    self._not_empty.wait()
+                else:
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._not_empty.wait(remaining)
+
+        return batch
+
+    def close(self):
+        """
+        Wake up everyone waiting.  Messages already queued can still be read;
+        blocked puts drop their message.
+        """
+
+        with self._lock:
+            self.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def _wait_for_room(self,timeout):
+        """
+        Wait (with the lock held) until there is room.  Returns False on
+        timeout or if the queue is closed.
+        """
+
+        if timeout is not None:
+            end = time.monotonic() + timeout
+
+        while len(self._entries) >= self.maxsize:
+            if self.closed:
+                return False
+            if timeout is None:
+                self._not_full.wait()
+            else:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._not_full.wait(remaining)
+
+        return True
+
+    def _evict_oldest(self):
+        """
+        Throw away the oldest queued message that is not a block message
+        (with the lock held).  Returns False if there is none.
+        """
+
+        for i, entry in enumerate(self._entries):
+            if entry[2] != "block":
+                del self._entries[i]
+                self._forget(entry)
+                self._count_drop(entry[0])
+                return True
+
+        return False
+
+    def _forget(self,entry):
+        if self._latest.get(entry[3]) is entry:
+            del self._latest[entry[3]]
+
+    def _count_drop(self,cmd_name):
+        try:
+            self.dropped[cmd_name] += 1
+        except KeyError:
+            self.dropped[cmd_name] = 1
+
+    def __len__(self):
+        return len(self._entries)
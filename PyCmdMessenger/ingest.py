@@ -0,0 +1,518 @@
+__description__ = \
+"""
+Spread the decoding of many boards over worker processes.  Each worker reads
+and decodes a group of boards with a MessengerHub and writes fixed-format
+messages as rows into shared memory ring buffers, which the main process
+copies out as numpy structured arrays without any pickling.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import inspect, multiprocessing, os, queue, struct
+from multiprocessing import shared_memory
+import numpy as np
+
+from .arduino import ArduinoBoard
+from .PyCmdMessenger import CmdMessenger
+from .hub import MessengerHub
+from .telemetry import telemetry_dtype, struct_codes
+
+# Board parameters that decide the row layout of a command
+_SIZES = ["int_bytes","long_bytes","float_bytes","double_bytes"]
+
+# write index, read index, dropped rows, capacity, row size
+_RING_HEADER = struct.Struct("<QQQQQ")
+_INDEX = struct.Struct("<Q")
+_RING_DATA = 64
+
+class SharedRing:
+    """
+    Single-producer, single-consumer ring of fixed-size rows (a numpy
+    structured dtype) in a multiprocessing.shared_memory block.  The producer
+    packs a row in place and then moves the write index on; the consumer
+    copies out everything between its read index and the write index.  When
+    the ring is full, new rows are dropped (and counted) rather than making
+    the producer wait.
+    """
+
+    def __init__(self,dtype,capacity=65536,name=None):
+        """
+        Input:
+            dtype:
+                numpy dtype of a row (packed, little-endian fields)
+
+            capacity:
+                number of rows the ring holds
+                Default: 65536
+
+            name:
+                name of an existing ring's shared memory block to attach to,
+                or None to create a new one
+                Default: None
+        """
+
+        self.dtype = np.dtype(dtype)
+        self._row = struct.Struct("<" + "".join(struct_codes(self.dtype)))
+
+        if name is None:
+            if capacity < 1:
+                err = "capacity must be at least 1"
+                raise ValueError(err)
+            size = _RING_DATA + capacity*self.dtype.itemsize
+            self._shm = shared_memory.SharedMemory(create=True,size=size)
+            _RING_HEADER.pack_into(self._shm.buf,0,0,0,0,capacity,self.dtype.itemsize)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+
+        self.name = self._shm.name
+        self._buf = self._shm.buf
+
+        header = _RING_HEADER.unpack_from(self._buf,0)
+        self.capacity = header[3]
+        if header[4] != self.dtype.itemsize:
+            self._shm.close()
+            err = "ring rows are {} bytes, not {}".format(header[4],self.dtype.itemsize)
+            raise ValueError(err)
+
+        self._rows = np.ndarray((self.capacity,),dtype=self.dtype,buffer=self._buf,
+                                offset=_RING_DATA)
+
+    def append(self,*values):
+        """
+        Add a row (one value per column).  Returns False if the ring was full
+        and the row was dropped.
+        """
+
+        buf = self._buf
+        write = _INDEX.unpack_from(buf,0)[0]
+        if write - _INDEX.unpack_from(buf,8)[0] >= self.capacity:
+            _INDEX.pack_into(buf,16,_INDEX.unpack_from(buf,16)[0] + 1)
+            return False
+
+        slot = write % self.capacity
+        self._row.pack_into(buf,_RING_DATA + slot*self.dtype.itemsize,*values)
+
+        # Publish the row only once it is complete
+        _INDEX.pack_into(buf,0,write + 1)
+
+        return True
+
+    def read(self,max_rows=None):
+        """
+        Copy out (and consume) the rows waiting in the ring, oldest first, as
+        a numpy structured array.
+        """
+
+        write, read = _RING_HEADER.unpack_from(self._buf,0)[:2]
+        num_rows = write - read
+        if max_rows is not None:
+            num_rows = min(num_rows,max_rows)
+
+        start = read % self.capacity
+        end = start + num_rows
+        if end <= self.capacity:
+            rows = self._rows[start:end].copy()
+        else:
+            rows = np.concatenate((self._rows[start:],
+                                   self._rows[:end - self.capacity]))
+
+        _INDEX.pack_into(self._buf,8,read + num_rows)
+
+        return rows
+
+    @property
+    def dropped(self):
+        """
+        Number of rows dropped because the ring was full.
+        """
+
+        return _INDEX.unpack_from(self._buf,16)[0]
+
+    def __len__(self):
+        write, read = _RING_HEADER.unpack_from(self._buf,0)[:2]
+        return write - read
+
+    def close(self):
+        """
+        Detach from the shared memory (the block stays until unlink()).
+        """
+
+        if self._shm is None:
+            return
+
+        self._rows = None
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        """
+        Free the shared memory block.  Call once, from the process that
+        created the ring, after every process has closed it.
+        """
+
+        self._shm.unlink()
+
+def _worker(conn,others,boards,commands,record,messenger_kwargs):
+    """
+    Worker process: read and decode a group of boards with a MessengerHub.
+    Recorded commands go into the rings the main process set up, everything
+    else goes through the others queue.  conn carries the setup handshake,
+    commands to send and the stop request, and tells the main process why
+    the worker died if it does.
+    """
+
+    hub = MessengerHub(callback=lambda *msg: None)
+    try:
+        for index, name, board_kwargs in boards:
+            board = ArduinoBoard(**board_kwargs)
+            hub.add(name,CmdMessenger(board,commands,**messenger_kwargs))
+    except Exception as e:
+        conn.send(("error","{}: {}".format(type(e).__name__,e)))
+        hub.close()
+        return
+
+    # Tell the main process the row layout of each recorded command on these
+    # boards; it answers with the rings to write them into
+    messenger = hub[boards[0][1]]
+    layouts = {}
+    for cmd_name in record:
+        layouts[cmd_name] = telemetry_dtype(messenger.board,
+                                            messenger._cmd_name_to_format.get(cmd_name)).descr
+    conn.send(("ready",layouts))
+
+    rings = {}
+    chars = {}
+    for cmd_name, (ring_name, descr) in conn.recv().items():
+        dtype = np.dtype(descr)
+        rings[cmd_name] = SharedRing(dtype,name=ring_name)
+        chars[cmd_name] = [i for i, n in enumerate(dtype.names) if dtype.fields[n][0].kind == "S"]
+
+    board_index = dict([(name,index) for index, name, board_kwargs in boards])
+
+    def on_message(board_name,cmd_name,received,message_time):
+
+        ring = rings.get(cmd_name)
+        if ring is None:
+            others.put((board_name,cmd_name,received,message_time))
+            return
+
+        values = [message_time,board_index[board_name]] + received
+        try:
+            for i in chars[cmd_name]:
+                values[i] = values[i].encode("ascii")
+            ring.append(*values)
+        except (struct.error,UnicodeEncodeError) as e:
+            others.put((board_name,"error",["{}: {}".format(type(e).__name__,e)],
+                        message_time))
+
+    hub.callback = on_message
+
+    try:
+        while True:
+            hub.poll(0.01)
+            while conn.poll():
+                request = conn.recv()
+                if request[0] == "stop":
+                    return
+                name, cmd, args = request[1:]
+                try:
+                    hub.send(name,cmd,*args)
+                except Exception as e:
+                    others.put((name,"error",["{}: {}".format(type(e).__name__,e)],None))
+    except Exception as e:
+        try:
+            conn.send(("error","{}: {}".format(type(e).__name__,e)))
+        except (OSError,EOFError):
+            pass
+        raise
+    finally:
+        hub.close()
+        for ring in rings.values():
+            ring.close()
+
+class IngestPool:
+    """
+    Read many boards with a pool of worker processes, so decoding is spread
+    over several cores rather than bound by one interpreter's GIL.  Boards
+    are shared out between the workers, each of which runs a MessengerHub on
+    its group.  Messages for the recorded commands (which need fixed-size
+    formats) come back through shared memory ring buffers:
+
+        pool = IngestPool(commands,[("rig{}".format(i),{"device":d,"baud_rate":115200})
+                                    for i, d in enumerate(devices)],
+                          record=["kReading"],num_workers=4)
+        while running:
+            rows = pool.read("kReading")        # numpy structured array
+            rows["board"], rows["message_time"], rows["f0"], ...
+
+    board is an index into pool.board_names.  Other messages are pickled
+    through a queue and read with get().  Ports are opened in the workers, so
+    boards are described by ArduinoBoard keyword arguments rather than
+    passed in open.  Every board must have the same type sizes (int_bytes,
+    etc.), so that a command's rows have one layout.  If a worker dies,
+    read(), get() and send() raise RuntimeError.
+    """
+
+    def __init__(self,commands,boards,record=None,num_workers=None,
+                 capacity=65536,messenger_kwargs=None,context="spawn",
+                 timeout=30):
+        """
+        Input:
+            commands:
+                command table shared by every board (as for CmdMessenger)
+
+            boards:
+                list of (name, kwargs) pairs; kwargs are passed to
+                ArduinoBoard in the worker (device, baud_rate, int_bytes, ...)
+
+            record:
+                commands whose messages go through the rings.  Their formats
+                must have a fixed size.
+                Default: every command with a fixed-size format
+
+            num_workers:
+                number of worker processes
+                Default: the number of boards or cores, whichever is smaller
+
+            capacity:
+                rows per ring (there is a ring per worker and command)
+                Default: 65536
+
+            messenger_kwargs:
+                extra keyword arguments for CmdMessenger (crc, warnings, ...)
+
+            context:
+                multiprocessing start method
+                Default: "spawn"
+
+            timeout:
+                seconds to wait for the workers to open their boards
+                Default: 30
+        """
+
+        if len(boards) == 0:
+            err = "IngestPool needs at least one board"
+            raise ValueError(err)
+
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        num_workers = max(1,min(num_workers,len(boards)))
+
+        if messenger_kwargs is None:
+            messenger_kwargs = {}
+        messenger_kwargs = dict(messenger_kwargs)
+        messenger_kwargs.setdefault("warnings",False)
+
+        formats = dict([(c[0],c[1] if len(c) > 1 else None) for c in commands])
+        if record is None:
+            record = [cmd_name for cmd_name in formats if _fixed_size(formats[cmd_name])]
+        for cmd_name in record:
+            if cmd_name not in formats:
+                err = "Command '{}' not recognized.\n".format(cmd_name)
+                raise ValueError(err)
+            if not _fixed_size(formats[cmd_name]):
+                err = "Command '{}' does not have a fixed-size format.\n".format(cmd_name)
+                raise ValueError(err)
+
+        self.commands = commands
+        self.record = list(record)
+        self.capacity = capacity
+        self.board_names = [name for name, kwargs in boards]
+        if len(set(self.board_names)) != len(self.board_names):
+            err = "board names must be unique"
+            raise ValueError(err)
+
+        boards = [(name,dict(kwargs)) for name, kwargs in boards]
+        for name, kwargs in boards:
+            kwargs.setdefault("settle_time",0)
+
+        # Rows of every board go into the same rings, so the sizes that set
+        # their layout have to match
+        defaults = inspect.signature(ArduinoBoard).parameters
+        sizes = [tuple([kwargs.get(k,defaults[k].default) for k in _SIZES])
+                 for name, kwargs in boards]
+        if len(set(sizes)) > 1:
+            err = "every board in the pool must have the same {}".format(", ".join(_SIZES))
+            raise ValueError(err)
+
+        ctx = multiprocessing.get_context(context)
+        self._others = ctx.Queue()
+        self._workers = []
+        self._conns = []
+        self._rings = dict([(cmd_name,[]) for cmd_name in self.record])
+        self._board_conn = {}
+
+        groups = [[] for i in range(num_workers)]
+        for index, (name, kwargs) in enumerate(boards):
+            groups[index % num_workers].append((index,name,kwargs))
+
+        try:
+            for group in groups:
+                conn, worker_conn = ctx.Pipe()
+                worker = ctx.Process(target=_worker,
+                                     args=(worker_conn,self._others,group,commands,
+                                           self.record,messenger_kwargs))
+                worker.daemon = True
+                worker.start()
+                worker_conn.close()
+
+                self._workers.append(worker)
+                self._conns.append(conn)
+                for index, name, kwargs in group:
+                    self._board_conn[name] = conn
+
+            for conn in self._conns:
+                self._set_up_rings(conn,timeout)
+        except Exception:
+            self.close()
+            raise
+
+    def _set_up_rings(self,conn,timeout):
+        """
+        Create the rings a worker asks for and send it their names.
+        """
+
+        if not conn.poll(timeout):
+            err = "worker did not start within {} seconds".format(timeout)
+            raise RuntimeError(err)
+
+        status, layouts = conn.recv()
+        if status != "ready":
+            err = "worker could not open its boards ({})".format(layouts)
+            raise RuntimeError(err)
+
+        names = {}
+        for cmd_name, descr in layouts.items():
+            dtype = np.dtype([("message_time","<f8"),("board","<u2")] +
+                             [tuple(d) for d in descr[1:]])
+            ring = SharedRing(dtype,self.capacity)
+            self._rings[cmd_name].append(ring)
+            names[cmd_name] = (ring.name,dtype.descr)
+
+        conn.send(names)
+
+    def _check_workers(self):
+        """
+        Raise RuntimeError if a worker has died.
+        """
+
+        for i, (worker, conn) in enumerate(zip(self._workers,self._conns)):
+
+            reason = None
+            try:
+                if conn.poll():
+                    reason = conn.recv()[1]
+            except (OSError,EOFError):
+                pass
+
+            if reason is None and worker.is_alive():
+                continue
+
+            if reason is None:
+                reason = "exit code {}".format(worker.exitcode)
+            err = "ingest worker {} died ({})".format(i,reason)
+            raise RuntimeError(err)
+
+    def read(self,cmd_name,max_rows=None):
+        """
+        Copy out the cmd_name rows that have arrived since the last read, from
+        every worker, as one numpy structured array (message_time, board, f0,
+        f1, ...) ordered by message_time.
+        """
+
+        self._check_workers()
+
+        rings = self._rings[cmd_name]
+        parts = [ring.read(max_rows) for ring in rings]
+        if len(parts) == 1:
+            return parts[0]
+
+        rows = np.concatenate(parts)
+
+        return rows[np.argsort(rows["message_time"],kind="stable")]
+
+    def get(self,timeout=None):
+        """
+        Next message that is not recorded in a ring, as (board_name,
+        cmd_name, received, message_time), waiting up to timeout seconds
+        (forever if None).  Returns None on timeout.
+        """
+
+        self._check_workers()
+
+        try:
+            return self._others.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def send(self,board_name,cmd,*args):
+        """
+        Have the worker that owns board_name send it a command.
+        """
+
+        try:
+            conn = self._board_conn[board_name]
+        except KeyError:
+            err = "Board '{}' not in the pool.\n".format(board_name)
+            raise ValueError(err)
+
+        self._check_workers()
+        conn.send(("send",board_name,cmd,args))
+
+    def dropped(self):
+        """
+        Rows dropped because a ring was full, by command.
+        """
+
+        return dict([(cmd_name,sum([r.dropped for r in rings]))
+                     for cmd_name, rings in self._rings.items()])
+
+    def close(self):
+        """
+        Stop the workers (which close their boards) and free the rings.
+        """
+
+        for conn in self._conns:
+            try:
+                conn.send(("stop",))
+            except (OSError,EOFError):
+                pass
+
+        for worker in self._workers:
+            worker.join(5)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+
+        for conn in self._conns:
+            conn.close()
+        self._conns = []
+        self._workers = []
+
+        for rings in self._rings.values():
+            for ring in rings:
+                ring.close()
+                ring.unlink()
+            del rings[:]
+
+        self._others.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_val,exc_tb):
+        self.close()
+
+def _fixed_size(arg_formats):
+    """
+    Whether every format in arg_formats has a fixed binary size.
+    """
+
+    if arg_formats is None:
+        return True
+
+    for f in arg_formats:
+        if f not in "bc?iIlLfd":
+            return False
+
+    return True
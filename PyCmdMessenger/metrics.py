@@ -0,0 +1,349 @@
+__description__ = \
+"""
+Counters for what a messenger is doing on the link: messages and bytes per
+command in each direction, escape overhead, decode errors, timeouts and query
+round trip latencies.  Every messenger keeps one (CmdMessenger.metrics); it
+can be read as a dictionary (snapshot) or in the Prometheus text format, which
+serve() makes available over HTTP on a local socket.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import bisect, http.server, threading
+
+# Upper bounds (seconds) of the query latency histogram buckets.  Anything
+# slower lands in the last (+Inf) bucket.
+LATENCY_BUCKETS = [0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,
+                   1.0,2.5,5.0]
+
+ERRORS = ["unknown_command","argument_count","decode","crc","incomplete"]
+TIMEOUTS = ["receive","query"]
+
+class LinkMetrics:
+    """
+    Link and command counters for one messenger.  Messages are counted by
+    their command id field as they are compiled for sending or split off the
+    receive buffer; ids are only turned into command names when a snapshot is
+    taken, so counting costs a few dictionary updates per message.  Counters
+    are updated without a lock (a lock would cost more than the counting);
+    if several threads send at the same moment, a count can occasionally be
+    lost.
+
+    errors counts:
+
+        unknown_command: received messages whose command id is not in the
+                         command table
+        argument_count:  received messages with the wrong number of arguments
+        decode:          received messages whose arguments could not be
+                         decoded (including argument count errors)
+        crc:             received messages that failed the CRC check
+        incomplete:      partial messages thrown away when the serial port
+                         timed out
+
+    timeouts counts receive calls that gave up without a message and queries
+    whose reply did not arrive in time.
+    """
+
+    def __init__(self,command_name=None):
+        """
+        Input:
+            command_name:
+                function that turns a command id field (bytes) into a command
+                name, or None if the id is not recognized.  If None, ids are
+                reported as they came in.
+        """
+
+        self._command_name = command_name
+        self._server = None
+
+        self.reset()
+
+    def reset(self):
+        """
+        Zero every counter.
+        """
+
+        # command id field -> [messages, bytes, escape bytes]
+        self._sent = {}
+        self._received = {}
+
+        self._errors = dict([(e,0) for e in ERRORS])
+        self._timeouts = dict([(t,0) for t in TIMEOUTS])
+
+        # command name -> [count per bucket..., +Inf count, sum of seconds]
+        self._latency = {}
+
+    def count_sent(self,cmd_id,num_bytes,num_escapes=0):
+        """
+        Record a message for command id field cmd_id of num_bytes bytes (on
+        the wire), num_escapes of which are escape characters.
+        """
+
+        try:
+            counts = self._sent[cmd_id]
+        except KeyError:
+            counts = self._sent[cmd_id] = [0,0,0]
+        counts[0] += 1
+        counts[1] += num_bytes
+        counts[2] += num_escapes
+
+    def count_received(self,cmd_id,num_bytes,num_escapes=0):
+        """
+        Record a received message (see count_sent).  cmd_id is None for a
+        message that could not be attributed to a command (e.g. a failed CRC
+        check).
+        """
+
+        try:
+            counts = self._received[cmd_id]
+        except KeyError:
+            counts = self._received[cmd_id] = [0,0,0]
+        counts[0] += 1
+        counts[1] += num_bytes
+        counts[2] += num_escapes
+
+    def count_error(self,kind):
+        """
+        Record an error (one of ERRORS).
+        """
+
+        self._errors[kind] += 1
+
+    def count_timeout(self,kind):
+        """
+        Record a timeout (one of TIMEOUTS).
+        """
+
+        self._timeouts[kind] += 1
+
+    def observe_query(self,cmd_name,seconds):
+        """
+        Record the round trip time of a query answered by a cmd_name message.
+        """
+
+        try:
+            histogram = self._latency[cmd_name]
+        except KeyError:
+            histogram = self._latency[cmd_name] = [0 for i in range(len(LATENCY_BUCKETS) + 2)]
+
+        histogram[bisect.bisect_left(LATENCY_BUCKETS,seconds)] += 1
+        histogram[-1] += seconds
+
+    def snapshot(self):
+        """
+        Copy of every counter, as a dictionary:
+
+            sent, received: totals for messages, bytes and escape_bytes
+            escape_overhead: escape bytes as a fraction of all other bytes
+                             sent and received
+            commands: sent_messages, sent_bytes, received_messages and
+                      received_bytes for each command name.  Received messages
+                      with an unrecognized id are under "unknown"; those that
+                      could not be attributed to a command (failed CRC checks)
+                      are only in the totals.
+            errors, timeouts: counts (see above)
+            query_latency: for each reply command, count, sum (seconds) and
+                           buckets, a list of (upper bound, cumulative count)
+                           ending with (inf, count)
+        """
+
+        # Copying a dictionary is a single step for the interpreter, so this
+        # is safe while other threads are counting
+        sent = dict(self._sent)
+        received = dict(self._received)
+        errors = dict(self._errors)
+        timeouts = dict(self._timeouts)
+        latency = dict(self._latency)
+
+        commands = {}
+        for direction, counts in [("sent",sent),("received",received)]:
+            for cmd_id, (num_messages, num_bytes, num_escapes) in counts.items():
+
+                # Only in the totals
+                if cmd_id is None:
+                    continue
+
+                cmd_name = self._name(cmd_id)
+                if cmd_name not in commands:
+                    commands[cmd_name] = {"sent_messages":0,
+                                          "sent_bytes":0,
+                                          "received_messages":0,
+                                          "received_bytes":0}
+
+                commands[cmd_name][direction + "_messages"] += num_messages
+                commands[cmd_name][direction + "_bytes"] += num_bytes
+
+                if direction == "received" and cmd_name == "unknown":
+                    errors["unknown_command"] += num_messages
+
+        totals = {}
+        for direction, counts in [("sent",sent),("received",received)]:
+            totals[direction] = {"messages":sum([c[0] for c in counts.values()]),
+                                 "bytes":sum([c[1] for c in counts.values()]),
+                                 "escape_bytes":sum([c[2] for c in counts.values()])}
+
+        num_escapes = totals["sent"]["escape_bytes"] + totals["received"]["escape_bytes"]
+        num_bytes = totals["sent"]["bytes"] + totals["received"]["bytes"]
+        if num_bytes > num_escapes:
+            escape_overhead = num_escapes/(num_bytes - num_escapes)
+        else:
+            escape_overhead = 0.0
+
+        query_latency = {}
+        for cmd_name, histogram in latency.items():
+            buckets = []
+            total = 0
+            for i, bound in enumerate(LATENCY_BUCKETS + [float("inf")]):
+                total += histogram[i]
+                buckets.append((bound,total))
+            query_latency[cmd_name] = {"count":total,
+                                       "sum":histogram[-1],
+                                       "buckets":buckets}
+
+        return {"sent":totals["sent"],
+                "received":totals["received"],
+                "escape_overhead":escape_overhead,
+                "commands":commands,
+                "errors":errors,
+                "timeouts":timeouts,
+                "query_latency":query_latency}
+
+    def _name(self,cmd_id):
+        """
+        Command name for a command id field.
+        """
+
+        if self._command_name is None:
+            return cmd_id.decode("ascii","replace")
+
+        cmd_name = self._command_name(cmd_id)
+        if cmd_name is None:
+            return "unknown"
+
+        return cmd_name
+
+    def prometheus(self,prefix="cmdmessenger"):
+        """
+        Snapshot in the Prometheus text exposition format (version 0.0.4),
+        with metric names starting with prefix.
+        """
+
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name,kind,doc,samples):
+            lines.append("# HELP {}_{} {}".format(prefix,name,doc))
+            lines.append("# TYPE {}_{} {}".format(prefix,name,kind))
+            for suffix, labels, value in samples:
+                lines.append("{}_{}{}{} {}".format(prefix,name,suffix,
+                                                   _labels(labels),
+                                                   _number(value)))
+
+        commands = sorted(snapshot["commands"].items(),key=lambda c: str(c[0]))
+        for direction in ["sent","received"]:
+            for unit in ["messages","bytes"]:
+                key = "{}_{}".format(direction,unit)
+                metric(key + "_total","counter",
+                       "{} {} per command.".format(unit.capitalize(),direction),
+                       [("",[("command",c)],v[key]) for c, v in commands])
+
+        metric("escape_bytes_total","counter",
+               "Escape characters sent and received.",
+               [("",[("direction",d)],snapshot[d]["escape_bytes"])
+                for d in ["sent","received"]])
+
+        metric("escape_overhead_ratio","gauge",
+               "Escape bytes as a fraction of all other bytes.",
+               [("",[],snapshot["escape_overhead"])])
+
+        metric("errors_total","counter","Received messages that could not be used.",
+               [("",[("kind",k)],snapshot["errors"][k]) for k in ERRORS])
+
+        metric("timeouts_total","counter","Receives and queries that timed out.",
+               [("",[("kind",k)],snapshot["timeouts"][k]) for k in TIMEOUTS])
+
+        samples = []
+        for cmd_name, histogram in sorted(snapshot["query_latency"].items()):
+            for bound, count in histogram["buckets"]:
+                samples.append(("_bucket",[("command",cmd_name),("le",bound)],count))
+            samples.append(("_sum",[("command",cmd_name)],histogram["sum"]))
+            samples.append(("_count",[("command",cmd_name)],histogram["count"]))
+        metric("query_latency_seconds","histogram",
+               "Query round trip time by reply command.",samples)
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self,port=0,host="127.0.0.1",prefix="cmdmessenger"):
+        """
+        Serve prometheus() over HTTP on a background thread (at any path, e.g.
+        http://127.0.0.1:port/metrics).  port=0 picks a free port.  Returns
+        the (host, port) the server is listening on.  Stop it with
+        stop_serving.
+        """
+
+        if self._server is not None:
+            err = "metrics are already being served on {}".format(self._server.server_address)
+            raise RuntimeError(err)
+
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                body = metrics.prometheus(prefix).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type","text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length",str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self,*args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host,port),Handler)
+        self._server.daemon_threads = True
+
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        return self._server.server_address[:2]
+
+    def stop_serving(self):
+        """
+        Stop the server started by serve.
+        """
+
+        if self._server is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+
+def _labels(labels):
+    """
+    Prometheus label set, e.g. {command="ping",le="0.5"}.
+    """
+
+    if len(labels) == 0:
+        return ""
+
+    pairs = []
+    for name, value in labels:
+        if type(value) is float:
+            value = _number(value)
+        value = str(value).replace("\\","\\\\").replace("\"","\\\"").replace("\n","\\n")
+        pairs.append("{}=\"{}\"".format(name,value))
+
+    return "{" + ",".join(pairs) + "}"
+
+def _number(value):
+    """
+    Prometheus sample value.
+    """
+
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(value)
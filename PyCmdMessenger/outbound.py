@@ -0,0 +1,383 @@
+__description__ = \
+"""
+Writer thread for messages going out to the arduino, merging messages that
+arrive close together into one serial write.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import collections, threading, time
+
+class OutboundWriter:
+    """
+    Takes compiled messages from any number of threads and writes them to the
+    serial port on its own thread.  put() only appends the message to a queue
+    (holding a lock for a few instructions, never across a syscall), so
+    senders do not wait on the port or on each other.
+
+    Each message goes into the lane for its priority (an integer, 0 by
+    default).  Higher priority lanes are always emptied first, so an urgent
+    message jumps ahead of queued bulk traffic at the next write; it only
+    waits for the batch already being written (or, for chunks queued together
+    with put_chunks, for the rest of those chunks).  Within a lane, messages are
+    written in the order they were put, merged into batches:
+
+        linger:          once a message is waiting, wait up to linger seconds
+                         for more before writing (like Nagle's algorithm).
+                         With linger=0 nothing waits on purpose, but whatever
+                         piles up while a write is in progress still goes out
+                         in the next one.
+        max_batch_bytes: write as soon as this many bytes are waiting, and
+                         never more than this in one write (a single larger
+                         message is written on its own).  This also bounds
+                         how long an urgent message can wait behind bulk
+                         traffic.
+
+    Messages with a priority above 0 never wait out the linger time.  stats()
+    reports the batch sizes and how long messages waited in the queue, per
+    priority.
+    """
+
+    def __init__(self,write,linger=0.0,max_batch_bytes=4096):
+        """
+        Input:
+            write:
+                function called with the bytes of each batch (e.g. the
+                board's write method)
+
+            linger:
+                seconds to wait for more messages before writing
+                Default: 0.0
+
+            max_batch_bytes:
+                most bytes to merge into one write
+                Default: 4096
+        """
+
+        if linger < 0:
+            err = "linger must be zero or more seconds"
+            raise ValueError(err)
+
+        if max_batch_bytes < 1:
+            err = "max_batch_bytes must be at least 1"
+            raise ValueError(err)
+
+        self._write = write
+        self.linger = linger
+        self.max_batch_bytes = max_batch_bytes
+
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+
+        # priority -> deque of (time put, data, size), in order.  data is
+        # bytes, or a tuple of chunks from put_chunks.  _priorities lists
+        # the lanes from most to least urgent; _num_pending and _pending_bytes
+        # count the messages waiting in all of them
+        self._lanes = {}
+        self._priorities = []
+        self._num_pending = 0
+        self._pending_bytes = 0
+        self._writing = False
+
+        self.error = None
+        self.closed = False
+
+        self.reset_stats()
+
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self,data,priority=0):
+        """
+        Queue data to be written, ahead of anything queued with a lower
+        priority.  Returns at once.  Raises RuntimeError if the writer is
+        closed or a write has failed.
+        """
+
+        self._put(data,len(data),priority)
+
+    def put_chunks(self,chunks,priority=0):
+        """
+        Queue chunks to be written one write each, back to back, as a single
+        unit: they are never merged with each other or with other messages,
+        and nothing (not even a more urgent message) is written between them.
+        For batches split to fit the arduino's receive buffer (see
+        CmdMessenger.send_many).
+        """
+
+        chunks = tuple(chunks)
+        if len(chunks) == 0:
+            return
+
+        self._put(chunks,sum([len(c) for c in chunks]),priority)
+
+    def _put(self,data,size,priority):
+
+        with self._lock:
+            if self.closed or self.error is not None:
+                self._raise_closed()
+
+            try:
+                lane = self._lanes[priority]
+            except KeyError:
+                lane = self._add_lane(priority)
+
+            lane.append((time.perf_counter(),data,size))
+            self._num_pending += 1
+            self._pending_bytes += size
+            self._not_empty.notify()
+
+    def _add_lane(self,priority):
+        """
+        Start a queue for priority.  Call with the lock held.
+        """
+
+        if type(priority) != int:
+            err = "priority must be an integer, not {}".format(priority)
+            raise ValueError(err)
+
+        lane = collections.deque()
+        self._lanes[priority] = lane
+        self._priorities = sorted(self._lanes.keys(),reverse=True)
+        self._stats[priority] = [0,0.0,0.0]
+
+        return lane
+
+    def _raise_closed(self):
+
+        if self.error is not None:
+            err = "writing to the board failed: {}".format(self.error)
+            raise RuntimeError(err) from self.error
+
+        err = "writer is closed"
+        raise RuntimeError(err)
+
+    def _run(self):
+        """
+        Write batches until closed.
+        """
+
+        while True:
+
+            with self._lock:
+
+                while self._num_pending == 0 and not self.closed:
+                    self._not_empty.wait()
+
+                if self._num_pending == 0:
+                    return
+
+                # Give more messages linger seconds (from the first one
+                # arriving) to join the batch, unless an urgent one is waiting
+                if self.linger > 0:
+                    deadline = self._oldest() + self.linger
+                    while self._pending_bytes < self.max_batch_bytes and \
+                          not self.closed and not self._urgent():
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            break
+                        self._not_empty.wait(remaining)
+
+                batch = self._take_batch()
+                self._writing = True
+
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                with self._lock:
+                    self.error = e
+                    for lane in self._lanes.values():
+                        lane.clear()
+                    self._num_pending = 0
+                    self._pending_bytes = 0
+                    self._writing = False
+                    self._idle.notify_all()
+                return
+
+            with self._lock:
+                self._writing = False
+                if self._num_pending == 0:
+                    self._idle.notify_all()
+
+    def _oldest(self):
+        """
+        When the longest waiting message was put.  Call with the lock held.
+        """
+
+        return min([lane[0][0] for lane in self._lanes.values() if len(lane) > 0])
+
+    def _urgent(self):
+        """
+        Whether a message with a priority above 0 is waiting.  Call with the
+        lock held.
+        """
+
+        for priority in self._priorities:
+            if priority <= 0:
+                return False
+            if len(self._lanes[priority]) > 0:
+                return True
+
+        return False
+
+    def _take_batch(self):
+        """
+        Pop up to max_batch_bytes of messages (at least one) off the queues,
+        most urgent first, as (priority, time put, data).  Chunks queued with
+        put_chunks always make up a batch on their own.  Call with the lock
+        held.
+        """
+
+        batch = []
+        num_bytes = 0
+        full = False
+        for priority in self._priorities:
+            lane = self._lanes[priority]
+            while len(lane) > 0 and not full:
+                t, data, size = lane[0]
+                chunked = type(data) == tuple
+                if len(batch) > 0 and (chunked or num_bytes + size > self.max_batch_bytes):
+                    full = True
+                    break
+                lane.popleft()
+                batch.append((priority,t,data))
+                num_bytes += size
+                full = chunked
+            if full:
+                break
+
+        self._num_pending -= len(batch)
+        self._pending_bytes -= num_bytes
+
+        return batch
+
+    def _write_batch(self,batch):
+        """
+        Write one batch and count it.
+        """
+
+        if type(batch[0][2]) == tuple:
+            writes = batch[0][2]
+        elif len(batch) == 1:
+            writes = [batch[0][2]]
+        else:
+            writes = [b"".join([d for p, t, d in batch])]
+
+        start = time.perf_counter()
+        for data in writes:
+            self._write(data)
+
+        self.batches += len(writes)
+        self.messages += len(batch)
+        self.max_batch_messages = max(self.max_batch_messages,len(batch))
+        for data in writes:
+            self.bytes += len(data)
+            self.max_batch_bytes_written = max(self.max_batch_bytes_written,len(data))
+
+        for priority, t, d in batch:
+            waited = start - t
+            counts = self._stats[priority]
+            counts[0] += 1
+            counts[1] += waited
+            if waited > counts[2]:
+                counts[2] = waited
+
+    def flush(self,timeout=None):
+        """
+        Wait up to timeout seconds (forever if None) until everything put so
+        far has been written.  Returns True if it has.
+        """
+
+        with self._lock:
+            if timeout is not None:
+                deadline = time.perf_counter() + timeout
+
+            while (self._num_pending > 0 or self._writing) and self.error is None:
+                if timeout is None:
+                    self._idle.wait()
+                else:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        return False
+                    self._idle.wait(remaining)
+
+            if self.error is not None:
+                self._raise_closed()
+
+        return True
+
+    def close(self,timeout=2):
+        """
+        Write what is still queued and stop the thread.
+        """
+
+        with self._lock:
+            self.closed = True
+            self._not_empty.notify_all()
+
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
+
+    def reset_stats(self):
+        """
+        Zero the counters.
+        """
+
+        self.batches = 0
+        self.messages = 0
+        self.bytes = 0
+        self.max_batch_messages = 0
+        self.max_batch_bytes_written = 0
+
+        # priority -> [messages, total seconds queued, max seconds queued]
+        with self._lock:
+            self._stats = dict([(p,[0,0.0,0.0]) for p in self._lanes])
+
+    def stats(self):
+        """
+        batches written, messages and bytes in them, mean and max messages
+        and bytes per batch, mean and max time (seconds) messages waited
+        between put() and the start of their write, and how many messages are
+        queued now.  priorities breaks messages, queue times and queued down
+        by priority.
+        """
+
+        if self.batches > 0:
+            mean_batch_messages = self.messages/self.batches
+            mean_batch_bytes = self.bytes/self.batches
+        else:
+            mean_batch_messages = 0.0
+            mean_batch_bytes = 0.0
+
+        priorities = {}
+        for priority, counts in list(self._stats.items()):
+            num_messages, total_time, max_time = counts
+            if num_messages > 0:
+                mean_time = total_time/num_messages
+            else:
+                mean_time = 0.0
+            priorities[priority] = {"messages":num_messages,
+                                    "mean_queue_time":mean_time,
+                                    "max_queue_time":max_time,
+                                    "queued":len(self._lanes[priority])}
+
+        total_time = sum([c[1] for c in self._stats.values()])
+        if self.messages > 0:
+            mean_queue_time = total_time/self.messages
+        else:
+            mean_queue_time = 0.0
+        max_queue_time = max([0.0] + [c[2] for c in self._stats.values()])
+
+        return {"batches":self.batches,
+                "messages":self.messages,
+                "bytes":self.bytes,
+                "mean_batch_messages":mean_batch_messages,
+                "max_batch_messages":self.max_batch_messages,
+                "mean_batch_bytes":mean_batch_bytes,
+                "max_batch_bytes":self.max_batch_bytes_written,
+                "mean_queue_time":mean_queue_time,
+                "max_queue_time":max_queue_time,
+                "queued":self._num_pending,
+                "priorities":priorities}
@@ -0,0 +1,218 @@
+__description__ = \
+"""
+Feed a capture (see capture.py) back into the decoder, either paced like the
+original traffic or as fast as possible.  For debugging a recorded session
+offline and for benchmarking the decoders on real traffic.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import bisect, threading, time
+
+from .arduino import ArduinoBoard
+from .capture import read_capture, read_header, READ
+
+class ReplaySerial:
+    """
+    Stand-in for a pyserial port that returns the bytes read in a capture.
+    Everything written to it is thrown away (and counted).  It has no file
+    descriptor, so CmdMessengerThreaded reads it through in_waiting/read.
+    """
+
+    def __init__(self,path,speed=None,timeout=1.0):
+        """
+        Input:
+            path:
+                capture file
+
+            speed:
+                None to make the whole capture available at once, otherwise
+                how much faster than the original traffic to release the bytes
+                (1.0 is real time)
+                Default: None
+
+            timeout:
+                seconds read waits for data, as for a pyserial port
+                Default: 1.0
+        """
+
+        if speed is not None and speed <= 0:
+            err = "speed must be positive (or None for as fast as possible)"
+            raise ValueError(err)
+
+        self.speed = speed
+        self.timeout = timeout
+        self.baudrate = None
+
+        # All bytes read in the capture, the offset at which each chunk ends
+        # and when it arrived
+        data = bytearray()
+        self._ends = []
+        self._times = []
+        for t, direction, chunk in read_capture(path):
+            if direction != READ:
+                continue
+            data += chunk
+            self._ends.append(len(data))
+            self._times.append(t)
+        self._data = bytes(data)
+
+        self._cancel = threading.Event()
+        self.bytes_written = 0
+        self.is_open = False
+
+    def open(self):
+        self.is_open = True
+        self.rewind()
+
+    def rewind(self):
+        """
+        Start the replay over from the beginning of the capture.
+        """
+
+        self._pos = 0
+        self._start = time.perf_counter()
+        self._cancel.clear()
+
+    def _released(self):
+        """
+        Number of bytes of the capture released so far.
+        """
+
+        if self.speed is None:
+            return len(self._data)
+
+        elapsed = (time.perf_counter() - self._start)*self.speed
+        num_chunks = bisect.bisect_right(self._times,elapsed)
+        if num_chunks == 0:
+            return 0
+
+        return self._ends[num_chunks - 1]
+
+    def _next_release(self):
+        """
+        Seconds (wall clock) until the next chunk is released, or None if the
+        whole capture has been.
+        """
+
+        if self.speed is None:
+            return None
+
+        elapsed = (time.perf_counter() - self._start)*self.speed
+        i = bisect.bisect_right(self._times,elapsed)
+        if i == len(self._times):
+            return None
+
+        return (self._times[i] - elapsed)/self.speed
+
+    @property
+    def in_waiting(self):
+        return self._released() - self._pos
+
+    @property
+    def finished(self):
+        """
+        True once every byte of the capture has been read.
+        """
+
+        return self._pos >= len(self._data)
+
+    def read(self,size=1):
+        """
+        Read up to size bytes, waiting up to timeout seconds for the first one
+        to be released.
+        """
+
+        if self.timeout is not None:
+            deadline = time.perf_counter() + self.timeout
+
+        while self.is_open:
+
+            end = min(self._released(),self._pos + size)
+            if end > self._pos:
+                chunk = self._data[self._pos:end]
+                self._pos = end
+                return chunk
+
+            wait = self._next_release()
+            if self.timeout is not None:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                if wait is None or wait > remaining:
+                    wait = remaining
+
+            if self._cancel.wait(wait):
+                self._cancel.clear()
+                break
+
+        return b""
+
+    def write(self,data):
+        self.bytes_written += len(data)
+        return len(data)
+
+    def cancel_read(self):
+        self._cancel.set()
+
+    def close(self):
+        self.is_open = False
+        self._cancel.set()
+
+class ReplayBoard(ArduinoBoard):
+    """
+    Board that plays back the bytes read in a capture file.  Messengers built
+    on it decode the recorded traffic just as they decoded it live:
+
+        board = ReplayBoard("session.cap",timeout=0.1)
+        c = CmdMessenger(board,commands)
+        for msg in iter(c.receive,None):
+            print(msg)
+
+    The type sizes (int_bytes, etc.) default to those of the board the capture
+    was made on.
+    """
+
+    def __init__(self,path,speed=None,timeout=1.0,**kwargs):
+        """
+        Input:
+            path:
+                capture file
+
+            speed:
+                None to replay as fast as possible, otherwise how much faster
+                than the original traffic to replay (1.0 is real time)
+                Default: None
+
+            timeout:
+                seconds reads wait for data
+                Default: 1.0
+
+            kwargs are passed on to ArduinoBoard (int_bytes, etc.)
+        """
+
+        with open(path,"rb") as f:
+            start_time, parameters = read_header(f)
+
+        self.path = path
+        self.speed = speed
+        self.start_time = start_time
+        self.parameters = parameters
+
+        for p in ["baud_rate","int_bytes","long_bytes","float_bytes","double_bytes"]:
+            if p not in kwargs and parameters.get(p) is not None:
+                kwargs[p] = parameters[p]
+        kwargs["settle_time"] = 0
+
+        super(ReplayBoard,self).__init__(path,timeout=timeout,**kwargs)
+
+    def open(self):
+        """
+        Open the capture and start the replay clock.
+        """
+
+        if not self._is_connected:
+            self.comm = ReplaySerial(self.path,self.speed,self.timeout)
+            self.comm.baudrate = self.baud_rate
+            self.comm.open()
+            self._is_connected = True
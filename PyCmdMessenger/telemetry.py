@@ -0,0 +1,436 @@
+__description__ = \
+"""
+Columnar store for fixed-format telemetry messages.  Each command gets its own
+memory-mapped file holding a numpy structured array (one row per message: the
+arrival time and one column per argument), which grows in chunks as messages
+arrive.  Other processes can read the rows written so far while writing goes
+on.
+
+A table file is:
+
+    8 bytes   b"PCMDTLM1"
+    uint64    number of rows written (updated after each row is complete)
+    uint32    length of the JSON description that follows
+    JSON      command name, formats, and the dtype of a row
+    padding   up to a multiple of 64 bytes
+    rows      the structured array, capacity rows long
+
+All numbers are little-endian.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+
+import json, os, struct
+import numpy as np
+
+from .codec import numpy_dtype
+
+MAGIC = b"PCMDTLM1"
+EXTENSION = ".tlm"
+
+_HEADER = struct.Struct("<8sQI")
+_COUNT = struct.Struct("<Q")
+_DATA_ALIGN = 64
+
+# struct codes for the column dtypes, by numpy kind and size
+_STRUCT_CODES = {"b":{1:"?"},
+                 "u":{1:"B",2:"H",4:"I",8:"Q"},
+                 "i":{1:"b",2:"h",4:"i",8:"q"},
+                 "f":{4:"f",8:"d"},
+                 "S":{1:"c"}}
+
+def telemetry_dtype(board,arg_formats,names=None):
+    """
+    Structured dtype of a row for a command with arg_formats on this board:
+    message_time (float64 seconds, see CmdMessenger.clock) followed by one
+    column per argument.  Columns are named f0, f1, ... unless names are given.
+    Raises ValueError for formats without a fixed size (s, g and "*").
+    """
+
+    if arg_formats is None:
+        arg_formats = ""
+
+    if names is None:
+        names = ["f{}".format(i) for i in range(len(arg_formats))]
+
+    if len(names) != len(arg_formats):
+        err = "{} column names given for {} arguments".format(len(names),
+                                                            len(arg_formats))
+        raise ValueError(err)
+
+    columns = [("message_time","<f8")]
+    for name, arg_format in zip(names,arg_formats):
+        if arg_format == "c":
+            columns.append((name,"S1"))
+        else:
+            columns.append((name,numpy_dtype(board,arg_format)))
+
+    return np.dtype(columns)
+
+def struct_codes(dtype):
+    """
+    struct format code for each column of a telemetry dtype, so rows can be
+    packed with struct instead of through numpy.
+    """
+
+    codes = []
+    for name in dtype.names:
+        column = dtype.fields[name][0]
+        codes.append(_STRUCT_CODES[column.kind][column.itemsize])
+
+    return codes
+
+def _data_offset(description):
+    return -(-(_HEADER.size + len(description))//_DATA_ALIGN)*_DATA_ALIGN
+
+class TelemetryTable:
+    """
+    Append-only, memory-mapped table of the messages for one command.
+    """
+
+    def __init__(self,path,board,cmd_name,arg_formats,names=None,
+                 separator=b",",chunk_rows=65536):
+        """
+        Input:
+            path:
+                file to write (overwritten)
+
+            board:
+                ArduinoBoard the messages come from (for the type sizes)
+
+            cmd_name, arg_formats:
+                command stored in the table and its format string
+
+            names:
+                column names for the arguments
+                Default: f0, f1, ...
+
+            separator:
+                field separator the messages arrive with
+                Default: b","
+
+            chunk_rows:
+                number of rows the file grows by when it fills up
+                Default: 65536
+        """
+
+        if chunk_rows < 1:
+            err = "chunk_rows must be at least 1"
+            raise ValueError(err)
+
+        self.path = path
+        self.cmd_name = cmd_name
+        self.arg_formats = arg_formats
+        self.chunk_rows = chunk_rows
+        self.dtype = telemetry_dtype(board,arg_formats,names)
+
+        description = {"command":cmd_name,
+                       "formats":arg_formats,
+                       "descr":self.dtype.descr}
+        description = json.dumps(description).encode("utf-8")
+        self._offset = _data_offset(description)
+
+        with open(path,"wb") as f:
+            f.write(_HEADER.pack(MAGIC,0,len(description)))
+            f.write(description)
+
+        self._wire = None
+        self._separator = separator
+        if len(self.dtype.names) > 1:
+            self._compile_wire_layout()
+
+        self.num_rows = 0
+        self.capacity = 0
+        self._map = None
+        self._grow()
+
+    def _compile_wire_layout(self):
+        """
+        Binary arguments sit at fixed offsets in a received message (each is
+        followed by one separator), so a message can be moved into a row
+        without decoding it: one struct unpacks the arguments, skipping the
+        separators, and another packs them into the row behind the time.
+        """
+
+        codes = struct_codes(self.dtype)[1:]
+
+        self._wire = struct.Struct("<" + "x".join(codes))
+        self._row = struct.Struct("<d" + "".join(codes))
+        self._num_separators = len(codes) - 1
+
+        # Where the separators sit, counting from the first argument
+        offsets = []
+        end = 0
+        for code in codes[:-1]:
+            end += struct.calcsize("<" + code)
+            offsets.append(end)
+            end += 1
+        self._separator_offsets = tuple(offsets)
+
+    def _grow(self):
+        """
+        Add chunk_rows rows to the end of the file and map it again.
+        """
+
+        if self._map is not None:
+            self._map.flush()
+            self._bytes.release()
+
+        self.capacity += self.chunk_rows
+        with open(self.path,"r+b") as f:
+            f.truncate(self._offset + self.capacity*self.dtype.itemsize)
+
+        self._map = np.memmap(self.path,dtype=np.uint8,mode="r+")
+        self._bytes = memoryview(self._map)
+        self._data = self._map[self._offset:].view(self.dtype)
+
+    def _next_row(self):
+
+        if self.num_rows == self.capacity:
+            self._grow()
+
+        return self.num_rows
+
+    def _commit(self,n):
+        """
+        Make row n visible to readers.
+        """
+
+        self.num_rows = n + 1
+        _COUNT.pack_into(self._bytes,8,self.num_rows)
+
+    def append(self,received,message_time):
+        """
+        Append a decoded message (its list of arguments).
+        """
+
+        n = self._next_row()
+        self._data[n] = (message_time,*received)
+        self._commit(n)
+
+    def append_fields(self,fields,message_time):
+        """
+        Append a received message (FrameFields) without decoding it.  Returns
+        False, having stored nothing, if the message does not have the layout
+        of this command's arguments; decode it and call append instead (which
+        raises the usual errors).
+        """
+
+        if self._wire is None:
+            return False
+
+        start = fields.args_start
+        buffer = fields.buffer
+        if start == 0 or len(buffer) - start != self._wire.size:
+            return False
+
+        layout = fields.layout
+        if layout.count(self._separator,start) != self._num_separators:
+            return False
+
+        # The right number of separators in the wrong places is garbage
+        sep = self._separator[0]
+        for offset in self._separator_offsets:
+            if layout[start + offset] != sep:
+                return False
+
+        n = self._next_row()
+        self._row.pack_into(self._bytes,self._offset + n*self.dtype.itemsize,
+                            message_time,*self._wire.unpack_from(buffer,start))
+        self._commit(n)
+
+        return True
+
+    @property
+    def rows(self):
+        """
+        The rows written so far (a view of the file, not a copy).
+        """
+
+        return self._data[:self.num_rows]
+
+    def flush(self):
+        """
+        Write changes to disk (readers in other processes see them already).
+        """
+
+        if self._map is not None:
+            self._map.flush()
+
+    def close(self):
+        """
+        Flush and trim the file to the rows written.
+        """
+
+        if self._map is None:
+            return
+
+        self._map.flush()
+        self._bytes.release()
+        self._map = None
+        self._bytes = self._data = None
+
+        with open(self.path,"r+b") as f:
+            f.truncate(self._offset + self.num_rows*self.dtype.itemsize)
+
+    def __len__(self):
+        return self.num_rows
+
+class TelemetryReader:
+    """
+    Read-only view of a table file, which may still be being written to.
+    """
+
+    def __init__(self,path):
+
+        self.path = path
+
+        with open(path,"rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size or header[:len(MAGIC)] != MAGIC:
+                err = "{} is not a telemetry table".format(path)
+                raise ValueError(err)
+
+            magic, num_rows, length = _HEADER.unpack(header)
+            description = f.read(length)
+
+        self._offset = _data_offset(description)
+        description = json.loads(description.decode("utf-8"))
+
+        self.cmd_name = description["command"]
+        self.arg_formats = description["formats"]
+        self.dtype = np.dtype([tuple(d) for d in description["descr"]])
+
+        self._size = None
+        self._map = None
+
+    @property
+    def rows(self):
+        """
+        Every row written so far (a read-only view of the file).  Call again
+        to pick up new rows.
+        """
+
+        size = os.path.getsize(self.path)
+        if size != self._size:
+            self._map = np.memmap(self.path,dtype=np.uint8,mode="r")
+            self._size = size
+
+        num_rows = int(self._map[8:16].view("<u8")[0])
+        num_rows = min(num_rows,(size - self._offset)//self.dtype.itemsize)
+
+        return self._map[self._offset:self._offset + num_rows*self.dtype.itemsize].view(self.dtype)
+
+    def __len__(self):
+        return len(self.rows)
+
+class TelemetryStore:
+    """
+    Directory of telemetry tables, one per command, for a messenger:
+
+        store = TelemetryStore("run1",c,["kReading"],
+                               names={"kReading":["micros","value"]})
+
+    CmdMessengerThreaded.record_to(store) appends the messages straight from
+    the reader thread without building python objects for them; messages
+    received any other way can be added with append(cmd_name,received,
+    message_time).  read_store("run1") gives the tables to other processes.
+    """
+
+    def __init__(self,directory,messenger,commands=None,names=None,
+                 chunk_rows=65536):
+        """
+        Input:
+            directory:
+                directory for the table files (created if needed)
+
+            messenger:
+                CmdMessenger the messages come from (for the formats and type
+                sizes)
+
+            commands:
+                commands to store.  Every command must have a fixed-size
+                format.
+                Default: every command with arguments of fixed size
+
+            names:
+                dictionary of column names for each command's arguments
+
+            chunk_rows:
+                number of rows each file grows by when it fills up
+                Default: 65536
+        """
+
+        if names is None:
+            names = {}
+
+        formats = messenger._cmd_name_to_format
+        if commands is None:
+            commands = []
+            for cmd_name in messenger._cmd_name_to_int:
+                try:
+                    telemetry_dtype(messenger.board,formats.get(cmd_name))
+                except ValueError:
+                    continue
+                commands.append(cmd_name)
+
+        os.makedirs(directory,exist_ok=True)
+        self.directory = directory
+
+        self.tables = {}
+        for cmd_name in commands:
+            if cmd_name not in messenger._cmd_name_to_int:
+                err = "Command '{}' not recognized.\n".format(cmd_name)
+                raise ValueError(err)
+
+            path = os.path.join(directory,"{}{}".format(cmd_name,EXTENSION))
+            self.tables[cmd_name] = TelemetryTable(path,messenger.board,cmd_name,
+                                                   formats.get(cmd_name),
+                                                   names.get(cmd_name),
+                                                   bytes(messenger._byte_field_sep),
+                                                   chunk_rows)
+
+    def append(self,cmd_name,received,message_time):
+        """
+        Append a decoded message.  Messages for commands not in the store are
+        ignored.  Takes the same arguments as response_to_command and on()
+        callbacks.
+        """
+
+        table = self.tables.get(cmd_name)
+        if table is not None:
+            table.append(received,message_time)
+
+    def flush(self):
+        for table in self.tables.values():
+            table.flush()
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+
+    def __getitem__(self,cmd_name):
+        return self.tables[cmd_name]
+
+    def __contains__(self,cmd_name):
+        return cmd_name in self.tables
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_val,exc_tb):
+        self.close()
+
+def read_store(directory):
+    """
+    Open every table in directory for reading.  Returns a dictionary of
+    TelemetryReaders keyed by command name.
+    """
+
+    readers = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(EXTENSION):
+            reader = TelemetryReader(os.path.join(directory,filename))
+            readers[reader.cmd_name] = reader
+
+    return readers
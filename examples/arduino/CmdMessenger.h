@@ -53,6 +53,20 @@ enum
 	kProcessingArguments,			 // Message is received, arguments are being read parsed
 };
 
+/**
+ * Print that passes everything through to the serial stream, updating a
+ * CRC16 (XModem) of the bytes as they go by
+ */
+class CrcPrint : public Print
+{
+public:
+	Print *out;
+	uint16_t crc;
+
+	virtual size_t write(uint8_t c);
+	using Print::write;
+};
+
 #define white_space(c) ((c) == ' ' || (c) == '\t')
 #define valid_digit(c) ((c) >= '0' && (c) <= '9')
 
@@ -70,6 +84,8 @@ private:
 	char CmdlastChar;                 // Bookkeeping of command escape char 
 	bool pauseProcessing;             // pauses processing of new commands, during sending
 	bool print_newlines;              // Indicates if \r\n should be added after send command
+	bool use_crc;                     // Indicates if messages carry a CRC16 field
+	uint16_t crc_errors;              // Number of received messages with a bad CRC
 	char commandBuffer[MESSENGERBUFFERSIZE]; // Buffer that holds the data
 	char streamBuffer[MAXSTREAMBUFFERSIZE]; // Buffer that holds the data
 	uint8_t messageState;             // Current state of message processing
@@ -79,6 +95,7 @@ private:
 	char *last;                       // Pointer to previous buffer position
 	char prevChar;                    // Previous char (needed for unescaping)
 	Stream *comms;                    // Serial data stream
+	CrcPrint output;                  // comms, with a running CRC of the command being sent
 
 	char command_separator;           // Character indicating end of command (default: ';')
 	char field_separator;				// Character indicating end of argument (default: ',')
@@ -99,6 +116,7 @@ private:
 	inline void handleMessage() __attribute__((always_inline));
 	inline bool blockedTillReply(unsigned int timeout = DEFAULT_TIMEOUT, byte ackCmdId = 1) __attribute__((always_inline));
 	inline bool checkForAck(byte AckCommand) __attribute__((always_inline));
+	bool checkCrc(uint8_t length);
 
 	// **** Command sending ****
 
@@ -169,6 +187,8 @@ public:
 		const char esc_character = '/');
 
 	void printLfCr(bool addNewLine = true);
+	void useCrc16(bool enable = true);
+	uint16_t crcErrorCount();
 	void attach(messengerCallbackFunction newFunction);
 	void attach(byte msgId, messengerCallbackFunction newFunction);
 
@@ -230,8 +250,8 @@ public:
 	template < class T > void sendCmdArg(T arg)
 	{
 		if (startCommand) {
-			comms->print(field_separator);
-			comms->print(arg);
+			output.print(field_separator);
+			output.print(arg);
 		}
 	}
 
@@ -242,8 +262,8 @@ public:
 	template < class T > void sendCmdArg(T arg, unsigned int n)
 	{
 		if (startCommand) {
-			comms->print(field_separator);
-			comms->print(arg, n);
+			output.print(field_separator);
+			output.print(arg, n);
 		}
 	}
 
@@ -261,7 +281,7 @@ public:
 	template < class T > void sendCmdBinArg(T arg)
 	{
 		if (startCommand) {
-			comms->print(field_separator);
+			output.print(field_separator);
 			writeBin(arg);
 		}
 	}
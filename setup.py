@@ -15,6 +15,6 @@ setup(name='PyCmdMessenger',
       url='https://github.com/harmsm/PyCmdMessenger',
       download_url='https://github.com/harmsm/PyCmdMessenger/tarball/0.2.5',
       zip_safe=False,
-      install_requires=["pyserial"],
+      install_requires=["pyserial","numpy"],
       classifiers=['Programming Language :: Python'])
 
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test in-place decoding of received messages (FrameFields) and measure, with
+tracemalloc, how much memory decoding one message allocates.  No hardware
+needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./alloc_test.py"
+
+import random, struct, tracemalloc
+import numpy as np
+import PyCmdMessenger
+
+COMMANDS = [["kAcknowledge","s"],
+            ["kMultiValuePing","ild"],
+            ["double_ping","d"],
+            ["multi_ping","f*"],
+            ["mixed","is?"],
+            ["counted","if*"]]
+
+# Fixed-size binary messages, including values that have to be escaped
+BINARY_CASES = [("kMultiValuePing",(-1234,123456789,3.14159)),
+                ("kMultiValuePing",(44,59,47.0)),
+                ("double_ping",(0.123456,)),
+                ("double_ping",(struct.unpack("<f",b";,/\0")[0],))]
+
+def open_messenger():
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.1,settle_time=0)
+
+    return PyCmdMessenger.CmdMessenger(board,COMMANDS,warnings=False)
+
+def peak(function,repeat=3):
+    """
+    Smallest peak memory (in bytes, above what was already allocated) traced
+    while calling function.  It is called once first so caches are warm.
+    """
+
+    function()
+
+    tracemalloc.start()
+    peaks = []
+    for i in range(repeat):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function()
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return min(peaks)
+
+def split_fields(c,frame):
+    """
+    Split a message (without its command separator) into a list of unescaped
+    bytes fields, one bytes object per field, the way messages were split
+    before FrameFields.  The reference FrameFields is checked against.
+    """
+
+    # Nothing escaped, so we can split directly
+    if c._byte_escape_sep not in frame:
+        return frame.split(c._byte_field_sep)
+
+    fields = []
+    start = 0
+    pos = c._find_unescaped(frame,c._byte_field_sep)
+    while pos >= 0:
+        fields.append(frame[start:pos])
+        start = pos + 1
+        pos = c._find_unescaped(frame,c._byte_field_sep,start)
+    fields.append(frame[start:])
+
+    # Either drop the escape character or, if this wasn't really an
+    # escape, keep escape character and the character after it
+    return [c._unescape_re.sub(b"\\1",f) for f in fields]
+
+def frame(c,cmd,args):
+    """
+    Message as it comes off the wire, without the command separator.
+    """
+
+    return c._encode(cmd,args)[:-1]
+
+def test_split_frame():
+
+    c = open_messenger()
+
+    # Random fields full of characters that need escaping
+    rng = random.Random(15)
+    special = b",;/\0"
+    for i in range(500):
+        fields = [str(rng.randint(0,5)).encode()]
+        for j in range(rng.randint(0,6)):
+            fields.append(bytes([rng.choice(special + b"ab")
+                                 for k in range(rng.randint(0,5))]))
+        f = c._compile_message(fields[0],fields[1:])[:-1]
+
+        ff = c._split_frame(f)
+        assert list(ff) == split_fields(c,f) == fields
+        assert ff[0] == fields[0]
+        assert ff[1:] == fields[1:]
+        assert len(ff) == len(fields)
+        assert ff.lengths == [len(x) for x in fields]
+
+    c.board.close()
+
+def test_decode_frame():
+
+    c = open_messenger()
+
+    cases = BINARY_CASES + [("kAcknowledge",("Arduino, ready",)),
+                            ("mixed",(-5,"a;b",True)),
+                            ("multi_ping",(0.5,1.5,2.5))]
+    for cmd, args in cases:
+        f = frame(c,cmd,args)
+        assert c._decode(c._split_frame(f)) == c._decode(split_fields(c,f))
+
+    # Wrong number or size of fields, including a separator standing in for
+    # a missing field
+    for bad in [b"2,abc",b"1," + struct.pack("<h",1),
+                b"2," + struct.pack("<f",1.0)[:3] + b","]:
+        for fields in [c._split_frame(bad),split_fields(c,bad)]:
+            try:
+                c._decode(fields)
+                assert False
+            except (ValueError,struct.error):
+                pass
+
+    # No arguments at all is let through, as before
+    assert c._decode(c._split_frame(b"2")) == ("double_ping",[])
+
+    c.board.close()
+
+def test_arrays():
+
+    c = open_messenger()
+
+    for values in [(1.0,),(0.5,44.0,59.0,47.0,3.25)]:
+        for cmd, args in [("multi_ping",values),("counted",(3,) + values)]:
+            c.send(cmd,*args)
+            received = c.receive(as_array=True)
+            assert received[0] == cmd
+            array = received[1][-1]
+            assert array.dtype == np.float32
+            assert array.flags["C_CONTIGUOUS"]
+            assert list(array) == list(values)
+            if cmd == "counted":
+                assert received[1][0] == 3
+
+    # An array with nothing in it
+    for fields in [c._split_frame(b"3"),split_fields(c,b"3")]:
+        received = c._decode_array(fields)
+        assert received[0] == "multi_ping"
+        assert len(received[1][0]) == 0
+
+    c.board.close()
+
+def test_allocations():
+
+    c = open_messenger()
+
+    for cmd, args in BINARY_CASES:
+        f = frame(c,cmd,args)
+        in_place = peak(lambda: c._decode(c._split_frame(f)))
+        split = peak(lambda: c._decode(split_fields(c,f)))
+
+        # Never more than splitting into a list of fields.  Without escapes,
+        # only a few small objects: the FrameFields and the decoded values.
+        assert in_place <= split
+        if c._byte_escape_sep not in f:
+            assert in_place < 1024
+
+    c.board.close()
+
+def main(argv=None):
+
+    for test in [test_split_frame,test_decode_frame,test_arrays,
+                 test_allocations]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+    # Report per-message allocation for each kind of message
+    c = open_messenger()
+    print()
+    print("{:20s} {:>12s} {:>12s}".format("message","in place (B)","split (B)"))
+    for cmd, args in BINARY_CASES + [("kAcknowledge",("Arduino ready",)),
+                                     ("multi_ping",tuple(range(100)))]:
+        f = frame(c,cmd,args)
+        print("{:20s} {:12d} {:12d}".format(cmd,
+                                            peak(lambda: c._decode(c._split_frame(f))),
+                                            peak(lambda: c._decode(split_fields(c,f)))))
+    c.board.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Round trip numpy arrays through send_array and receive(as_array=True) against
+an emulated sketch that echoes them back.  No hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./array_test.py"
+
+import numpy as np
+import PyCmdMessenger
+from PyCmdMessenger import emulator
+
+COMMANDS = [["kFloats","f*"],
+            ["kFloatsEcho","f*"],
+            ["kCounted","if*"],
+            ["kCountedEcho","if*"],
+            ["kLongs","l*"],
+            ["kLongsEcho","l*"]]
+
+def array_sketch(board="uno"):
+    """
+    Echoes every binary argument of kFloats, kCounted and kLongs back.  The
+    message buffer is enlarged (MESSENGERBUFFERSIZE) to fit whole arrays.
+    """
+
+    def echo(reply,ctypes):
+        def on_array(a):
+            a.send_cmd_start(reply)
+            i = 0
+            while a.available():
+                ctype = ctypes[min(i,len(ctypes) - 1)]
+                a.send_cmd_bin_arg(a.read_bin_arg(ctype),ctype)
+                i += 1
+            a.send_cmd_end()
+        return on_array
+
+    arduino = emulator.ArduinoEmulator(COMMANDS,board,buffer_size=512)
+    arduino.attach("kFloats",echo("kFloatsEcho",["float"]))
+    arduino.attach("kCounted",echo("kCountedEcho",["int","float"]))
+    arduino.attach("kLongs",echo("kLongsEcho",["long"]))
+
+    return arduino
+
+def connect(arduino):
+
+    board = PyCmdMessenger.ArduinoBoard(arduino.device,baud_rate=115200,
+                                        timeout=1.0,settle_time=0)
+    arduino.start()
+
+    return board, PyCmdMessenger.CmdMessenger(board,COMMANDS)
+
+def test_numeric_arrays():
+
+    with array_sketch() as arduino:
+        board, c = connect(arduino)
+
+        values = np.linspace(-10,10,25).astype(np.float32)
+        c.send_array("kFloats",values)
+        cmd_name, received, message_time = c.receive(as_array=True)
+        assert cmd_name == "kFloatsEcho"
+        assert len(received) == 1
+        array = received[0]
+        assert array.dtype == np.float32
+        assert array.shape == (25,)
+        assert np.array_equal(array,values)
+
+        # Leading arguments, and a 2D array sent flattened
+        values = np.arange(12,dtype=np.float64).reshape(3,4)/8
+        c.send_array("kCounted",7,values)
+        cmd_name, received, message_time = c.receive(as_array=True)
+        assert cmd_name == "kCountedEcho"
+        assert received[0] == 7
+        assert received[1].shape == (12,)
+        assert np.array_equal(received[1],values.ravel())
+
+        # Without as_array the values come back one by one
+        c.send_array("kFloats",[0.5,1.5])
+        assert c.receive()[1] == [0.5,1.5]
+
+        # An empty array
+        c.send_array("kCounted",3,[])
+        received = c.receive(as_array=True)[1]
+        assert received[0] == 3
+        assert received[1].shape == (0,)
+        assert received[1].dtype == np.float32
+
+        board.close()
+
+def test_escaped_arrays():
+
+    # Values whose bytes include the field separator (","=0x2C), command
+    # separator (";"=0x3B), escape ("/"=0x2F) and NUL
+    special = [0x2C2C2C2C,0x3B3B3B3B,0x2F2F2F2F,0x2C3B2F00,0,-1,
+               -0x2C2C2C2C,0x002F002C]
+
+    with array_sketch() as arduino:
+        board, c = connect(arduino)
+
+        c.send_array("kLongs",np.array(special))
+        received = c.receive(as_array=True)[1][0]
+        assert received.dtype == np.int32
+        assert list(received) == special
+
+        floats = np.frombuffer(np.array(special[:4],dtype="<i4").tobytes(),
+                               dtype=np.float32)
+        c.send_array("kFloats",floats)
+        assert np.array_equal(c.receive(as_array=True)[1][0],floats)
+
+        # Values that do not fit the board's type are refused before sending
+        try:
+            c.send_array("kLongs",[2**31])
+            assert False
+        except OverflowError:
+            pass
+
+        try:
+            c.send_array("kLongs")
+            assert False
+        except ValueError:
+            pass
+
+        board.close()
+
+def test_due_arrays():
+
+    commands = COMMANDS + [["kInts","i*"]]
+    with array_sketch(board="due") as arduino:
+        board = PyCmdMessenger.ArduinoDueBoard(arduino.device,baud_rate=115200,
+                                               timeout=1.0,settle_time=0)
+        arduino.start()
+        c = PyCmdMessenger.CmdMessenger(board,commands)
+
+        values = [-5,2**20,0x2C2C2C2C]
+        c.send_array("kCounted",2**20,np.array([0.25,-0.5]))
+        received = c.receive(as_array=True)[1]
+        assert received[0] == 2**20
+        assert list(received[1]) == [0.25,-0.5]
+
+        c.send_array("kLongs",values)
+        assert list(c.receive(as_array=True)[1][0]) == values
+
+        try:
+            c.send_array("kInts",[2**31])
+            assert False
+        except OverflowError:
+            pass
+
+        board.close()
+
+def main(argv=None):
+
+    for test in [test_numeric_arrays,test_escaped_arrays,test_due_arrays]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
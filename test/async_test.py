@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test AsyncCmdMessenger against a pty pair, with the test playing the part of
+the arduino on the master side.  No hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./async_test.py"
+
+import asyncio, os, struct
+import PyCmdMessenger
+
+COMMANDS = [["kAcknowledge","s"],
+            ["kMultiValuePing","ild"],
+            ["kMultiValuePong","ild"],
+            ["multi_pong","f*"],
+            ["kValuePing","i","kValuePong"],
+            ["kValuePong","i"]]
+
+def open_pty():
+    """
+    Return the master file descriptor and an ArduinoBoard on the slave end.
+    """
+
+    master, slave = os.openpty()
+    board = PyCmdMessenger.ArduinoBoard(os.ttyname(slave),baud_rate=115200,
+                                        settle_time=0)
+    os.close(slave)
+
+    return master, board
+
+def read_message(master):
+    """
+    Read one message (up to and including the command separator) from the
+    master side.
+    """
+
+    msg = b""
+    while not msg.endswith(b";"):
+        msg += os.read(master,1)
+
+    return msg
+
+async def check_send_and_receive():
+
+    master, board = open_pty()
+    c = PyCmdMessenger.AsyncCmdMessenger(board,COMMANDS)
+
+    await c.send("kMultiValuePing",-100,123456,2.5)
+    loop = asyncio.get_running_loop()
+    msg = await loop.run_in_executor(None,read_message,master)
+    assert msg == c._compile_message(b"1",[struct.pack("<h",-100),
+                                           struct.pack("<i",123456),
+                                           struct.pack("<f",2.5)])
+
+    # Arrays go through the same non-blocking write
+    await c.send_array("multi_pong",[0.5,1.5])
+    msg = await loop.run_in_executor(None,read_message,master)
+    assert msg == c._encode_array("multi_pong",([0.5,1.5],))
+
+    # Two messages in one write, plus the first half of a third
+    pong = c._compile_message(b"2",[struct.pack("<h",7),
+                                    struct.pack("<i",8),
+                                    struct.pack("<f",9.5)])
+    os.write(master,b"0,Arduino/, ready;" +
+                    c._compile_message(b"3",[struct.pack("<f",1.0)]) +
+                    pong[:5])
+
+    received = await c.receive(timeout=2)
+    assert received[0] == "kAcknowledge"
+    assert received[1] == ["Arduino, ready"]
+
+    received = await c.receive(timeout=2)
+    assert received[0] == "multi_pong"
+    assert received[1] == [1.0]
+
+    # Only half of kMultiValuePong has arrived
+    assert await c.receive(timeout=0.1) is None
+
+    os.write(master,pong[5:])
+    received = await c.receive(timeout=2)
+    assert received[0] == "kMultiValuePong"
+    assert received[1] == [7,8,9.5]
+
+    c.close()
+    board.close()
+    os.close(master)
+
+async def check_query_and_iterate():
+
+    master, board = open_pty()
+    c = PyCmdMessenger.AsyncCmdMessenger(board,COMMANDS)
+    loop = asyncio.get_running_loop()
+
+    def pong(num_messages):
+        for i in range(num_messages):
+            msg = read_message(master)
+            os.write(master,b"2" + msg[1:])
+
+    task = loop.run_in_executor(None,pong,3)
+    for i in range(3):
+        received = await c.query("kMultiValuePing",i,i*1000,i/2.0,timeout=2)
+        assert received[0] == "kMultiValuePong"
+        assert received[1] == [i,i*1000,i/2.0]
+    await task
+
+    os.write(master,c._compile_message(b"3",[struct.pack("<f",v) for v in (1,2,3)]))
+    os.write(master,b"0,done;")
+    seen = []
+    async for cmd_name, received, message_time in c:
+        seen.append((cmd_name,received))
+        if cmd_name == "kAcknowledge":
+            c.close()
+    assert seen == [("multi_pong",[1.0,2.0,3.0]),("kAcknowledge",["done"])]
+
+    board.close()
+    os.close(master)
+
+async def check_pipelined_queries():
+
+    master, board = open_pty()
+    c = PyCmdMessenger.AsyncCmdMessenger(board,COMMANDS)
+    loop = asyncio.get_running_loop()
+
+    def pong(num_messages):
+        # Read every ping before answering any, with a stray message in front
+        msgs = [read_message(master) for i in range(num_messages)]
+        os.write(master,b"0,stray;" + b"".join([b"5" + m[1:] for m in msgs]))
+
+    task = loop.run_in_executor(None,pong,2)
+    replies = await asyncio.gather(c.query("kValuePing",1,timeout=2),
+                                   c.query("kValuePing",2,timeout=2))
+    await task
+
+    task = loop.run_in_executor(None,pong,2)
+    replies += await c.query_many([("kValuePing",(3,)),("kValuePing",(4,))],
+                                  timeout=2)
+    await task
+
+    assert [r[0] for r in replies] == ["kValuePong"]*4
+    assert [r[1] for r in replies] == [[1],[2],[3],[4]]
+
+    for i in range(2):
+        received = await c.receive(timeout=2)
+        assert received[1] == ["stray"]
+
+    # No reply coming
+    assert await c.query("kValuePing",5,timeout=0.1) is None
+    read_message(master)
+
+    c.close()
+    board.close()
+    os.close(master)
+
+def test_send_and_receive():
+    asyncio.run(check_send_and_receive())
+
+def test_query_and_iterate():
+    asyncio.run(check_query_and_iterate())
+
+def test_pipelined_queries():
+    asyncio.run(check_pipelined_queries())
+
+def main(argv=None):
+
+    for test in [test_send_and_receive,test_query_and_iterate,
+                 test_pipelined_queries]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
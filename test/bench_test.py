@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Smoke test the benchmark suite with a handful of messages on each transport.
+No hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./bench_test.py"
+
+import json
+from PyCmdMessenger import bench
+
+def test_run():
+
+    for transport in bench.TRANSPORTS:
+
+        results = bench.run(number=50,transport=transport)
+
+        # Must be plain JSON
+        results = json.loads(json.dumps(results))
+
+        for section in ["encode","decode"]:
+            assert sorted(results[section].keys()) == \
+                   sorted([name for name, fmt, args in bench.TYPE_CASES])
+            for r in results[section].values():
+                assert r["messages_per_s"] > 0
+                assert r["bytes_per_s"] > r["messages_per_s"]
+
+        assert results["query"]["p50_us"] <= results["query"]["p99_us"]
+        assert results["threaded_ingest"]["messages_per_s"] > 0
+        assert results["hub_ingest"]["hub"]["messages_per_s"] > 0
+        assert sorted(results["crc"].keys()) == \
+               sorted([cmd for cmd, args in bench.CASES])
+        assert results["capture"]["send_captured_us"] > 0
+        assert results["capture"]["replay"]["messages_per_s"] > 0
+        assert results["writer"]["writer"]["stats"]["messages"] == \
+               50//10*results["writer"]["num_threads"]
+
+def main(argv=None):
+
+    test_run()
+    print("{:30s} --> PASS".format("test_run"))
+
+if __name__ == "__main__":
+    main()
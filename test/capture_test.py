@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test capturing the raw traffic of a board and replaying it into the
+decoders, using a pyserial loop:// port and a pty.  No hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./capture_test.py"
+
+import os, tempfile, time
+import PyCmdMessenger
+from PyCmdMessenger import capture
+
+COMMANDS = [["kAcknowledge","s"],
+            ["kValuePing","i","kValuePing"],
+            ["kMultiValuePing","ild"],
+            ["kValuePong","i"]]
+
+def capture_path():
+
+    f = tempfile.NamedTemporaryFile(suffix=".cap",delete=False)
+    f.close()
+
+    return f.name
+
+def record_session(path,num_messages=20,delay=0.0):
+    """
+    Send messages over loop:// with a capture running, so every message shows
+    up once written and once read.  Returns what was received.
+    """
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.1,settle_time=0,
+                                        int_bytes=4,capture=path)
+    c = PyCmdMessenger.CmdMessenger(board,COMMANDS)
+
+    received = []
+    for i in range(num_messages):
+        c.send("kMultiValuePing",i,-i,i/4)
+        c.send("kAcknowledge","msg;{}".format(i))
+        for j in range(2):
+            cmd_name, values, message_time = c.receive()
+            received.append((cmd_name,values))
+        time.sleep(delay)
+
+    board.close()
+
+    return received
+
+def test_capture_file():
+
+    path = capture_path()
+    try:
+        received = record_session(path)
+
+        records = list(capture.read_capture(path))
+        written = b"".join([r[2] for r in records if r[1] == capture.WRITE])
+        read = b"".join([r[2] for r in records if r[1] == capture.READ])
+
+        assert len(written) > 0
+        assert written == read
+        times = [r[0] for r in records]
+        assert times == sorted(times)
+
+        with open(path,"rb") as f:
+            start_time, parameters = capture.read_header(f)
+        assert abs(start_time - time.time()) < 60
+        assert parameters["device"] == "loop://"
+        assert parameters["int_bytes"] == 4
+
+        # A capture cut short mid-record still reads up to the last full one
+        with open(path,"rb") as f:
+            data = f.read()
+        with open(path,"wb") as f:
+            f.write(data[:-3])
+        assert len(list(capture.read_capture(path))) == len(records) - 1
+
+        with open(path,"wb") as f:
+            f.write(b"not a capture")
+        try:
+            list(capture.read_capture(path))
+            assert False
+        except ValueError:
+            pass
+    finally:
+        os.remove(path)
+
+def test_capture_threaded():
+
+    path = capture_path()
+    master, slave = os.openpty()
+    board = PyCmdMessenger.ArduinoBoard(os.ttyname(slave),baud_rate=115200,
+                                        settle_time=0)
+    os.close(slave)
+
+    class Collector(PyCmdMessenger.CmdMessengerThreaded):
+        def response_to_command(self,cmd_name,msg,message_time):
+            pass
+
+    c = Collector(board,COMMANDS)
+    c.enable_queue()
+    board.start_capture(path)
+
+    try:
+        incoming = c._encode("kValuePong",(5,))
+        os.write(master,incoming)
+        assert c.get(timeout=2)[1] == [5]
+
+        c.send("kValuePing",7)
+        outgoing = c._encode("kValuePing",(7,))
+        end = time.time() + 2
+        sent = b""
+        while len(sent) < len(outgoing) and time.time() < end:
+            sent += os.read(master,1024)
+        assert sent == outgoing
+
+        c.stop()
+        board.close()
+        assert board.capture is None
+
+        records = list(capture.read_capture(path))
+        assert [r[1:] for r in records] == [(capture.READ,incoming),
+                                            (capture.WRITE,outgoing)]
+    finally:
+        os.close(master)
+        os.remove(path)
+
+def test_replay():
+
+    path = capture_path()
+    try:
+        received = record_session(path)
+
+        # Sizes come from the capture header
+        board = PyCmdMessenger.ReplayBoard(path,timeout=0.05)
+        assert board.int_bytes == 4
+
+        c = PyCmdMessenger.CmdMessenger(board,COMMANDS)
+        replayed = []
+        for msg in iter(c.receive,None):
+            cmd_name, values, message_time = msg
+            replayed.append((cmd_name,values))
+        assert replayed == received
+        assert board.comm.finished
+
+        # Sends go nowhere
+        c.send("kValuePong",1)
+        assert board.comm.bytes_written == len(c._encode("kValuePong",(1,)))
+
+        board.comm.rewind()
+        assert c.receive()[1] == received[0][1]
+        board.close()
+
+        # Into the threaded decoder.  The reader starts in the constructor,
+        # so collect in response_to_command rather than a queue enabled after
+        replayed = []
+        class Collector(PyCmdMessenger.CmdMessengerThreaded):
+            def response_to_command(self,cmd_name,msg,message_time):
+                replayed.append((cmd_name,msg))
+
+        board = PyCmdMessenger.ReplayBoard(path,timeout=0.05)
+        c = Collector(board,COMMANDS)
+        deadline = time.time() + 2
+        while len(replayed) < len(received) and time.time() < deadline:
+            time.sleep(0.01)
+        assert replayed == received
+
+        c.stop()
+        board.close()
+    finally:
+        os.remove(path)
+
+def test_replay_pacing():
+
+    path = capture_path()
+    try:
+        received = record_session(path,num_messages=5,delay=0.02)
+        records = [r for r in capture.read_capture(path) if r[1] == capture.READ]
+        duration = records[-1][0] - records[0][0]
+        assert duration > 0.07
+
+        for speed in [1.0,2.0]:
+            board = PyCmdMessenger.ReplayBoard(path,speed=speed,timeout=1)
+            c = PyCmdMessenger.CmdMessenger(board,COMMANDS)
+
+            start = time.perf_counter()
+            for i in range(len(received)):
+                assert c.receive() is not None
+            elapsed = time.perf_counter() - start
+
+            assert elapsed > 0.9*duration/speed
+            assert elapsed < duration/speed + 0.1
+            board.close()
+
+        try:
+            PyCmdMessenger.ReplayBoard(path,speed=0)
+            assert False
+        except ValueError:
+            pass
+    finally:
+        os.remove(path)
+
+def main(argv=None):
+
+    for test in [test_capture_file,test_capture_threaded,test_replay,
+                 test_replay_pacing]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test first-byte arrival timestamps and the board to host clock estimator,
+against a pyserial loop:// port, a pty and the emulated clock sketch.  No
+hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./clock_test.py"
+
+import os, threading, time
+import PyCmdMessenger
+from PyCmdMessenger import emulator
+
+COMMANDS = [["kAcknowledge","s"],
+            ["kValuePong","i"]]
+
+CLOCK_COMMANDS = [["kGetMicros","","kMicros"],
+                  ["kMicros","L"],
+                  ["kGetReading","","kReading"],
+                  ["kReading","Lf"]]
+
+def write_later(write,data,delay):
+
+    def run():
+        time.sleep(delay)
+        write(data)
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+    return thread
+
+def test_first_byte_time():
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.5,settle_time=0)
+    c = PyCmdMessenger.CmdMessenger(board,COMMANDS)
+
+    # Half a message, then the rest 50 ms later
+    msg = c._encode("kAcknowledge",("first byte",))
+    first = c.clock()
+    board.write(msg[:4])
+    thread = write_later(board.write,msg[4:] + c._encode("kValuePong",(3,)),0.05)
+
+    cmd_name, received, message_time = c.receive()
+    assert received == ["first byte"]
+    assert first <= message_time < first + 0.03
+
+    # The second message arrived with the end of the first
+    cmd_name, received, second_time = c.receive()
+    assert received == [3]
+    assert second_time >= first + 0.05
+
+    # Same scale as time.time()
+    assert abs(message_time - time.time()) < 1
+    thread.join()
+    board.close()
+
+def test_threaded_first_byte_time():
+
+    master, slave = os.openpty()
+    board = PyCmdMessenger.ArduinoBoard(os.ttyname(slave),baud_rate=115200,
+                                        settle_time=0)
+    os.close(slave)
+
+    class Collector(PyCmdMessenger.CmdMessengerThreaded):
+        def response_to_command(self,cmd_name,msg,message_time):
+            pass
+
+    c = Collector(board,COMMANDS)
+    c.enable_queue()
+
+    msg = c._encode("kAcknowledge",("threaded",))
+    first = c.clock()
+    os.write(master,msg[:4])
+    thread = write_later(lambda d: os.write(master,d),msg[4:],0.05)
+
+    cmd_name, received, message_time = c.get(timeout=2)
+    assert received == ["threaded"]
+    assert first <= message_time < first + 0.03
+
+    thread.join()
+    c.stop()
+    board.close()
+    os.close(master)
+
+def test_fit():
+
+    # Board clock 250 ppm fast and about to wrap, 2 ms round trips (plus a
+    # few slow ones that should be ignored)
+    rate = 1.00025
+    board_start = 2**32 - 3000000
+    host_start = 1000.0
+
+    sync = PyCmdMessenger.ClockSync(None)
+    for i in range(20):
+        board_seconds = i*0.5
+        ticks = int(round(board_start + board_seconds*1e6)) % 2**32
+        host = host_start + board_seconds/rate
+
+        round_trip = 0.002
+        if i % 5 == 0:
+            round_trip = 0.05
+        sync.add_sample(ticks,host - round_trip/2,host + round_trip/2)
+
+    assert sync.num_samples == 20
+    assert abs(sync.drift - (1/rate - 1)) < 1e-7
+    assert abs(sync.uncertainty - 0.001) < 1e-9
+
+    # Readings on either side of the wrap
+    for board_seconds in [1.0,2.9,3.1,9.5,12.0]:
+        ticks = int(round(board_start + board_seconds*1e6)) % 2**32
+        assert abs(sync.to_host(ticks) - (host_start + board_seconds/rate)) < 1e-5
+
+    sync.reset()
+    assert sync.num_samples == 0
+    try:
+        sync.to_host(0)
+        assert False
+    except RuntimeError:
+        pass
+
+def test_emulated_board():
+
+    arduino = emulator.clock_sketch()
+    arduino.clock_rate = 1.01
+    board = PyCmdMessenger.ArduinoBoard(arduino.device,baud_rate=115200,
+                                        timeout=1,settle_time=0)
+    arduino.start()
+
+    c = PyCmdMessenger.CmdMessenger(board,CLOCK_COMMANDS)
+
+    try:
+        PyCmdMessenger.ClockSync(c,"kMicros")
+        assert False
+    except ValueError:
+        pass
+
+    sync = PyCmdMessenger.ClockSync(c,"kGetMicros")
+    for i in range(20):
+        assert sync.ping() is not None
+        time.sleep(0.01)
+
+    assert abs(sync.drift - (1/1.01 - 1)) < 0.003
+
+    # A board timestamp lands between asking for it and the reply arriving
+    for i in range(5):
+        sent = c.clock()
+        cmd_name, received, message_time = c.query("kGetReading")
+        assert received[1] == 1.5
+        host_time = sync.to_host(received[0])
+        assert sent - 0.002 < host_time < message_time + 0.002
+
+    board.close()
+    arduino.close()
+
+def main(argv=None):
+
+    for test in [test_first_byte_time,test_threaded_first_byte_time,test_fit,
+                 test_emulated_board]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test the per-command codecs compiled by CmdMessenger against the per-field
+send/receive methods they replace, on uno and due sized boards.  Uses a
+pyserial loop:// port, so no arduino is needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./codec_test.py"
+
+import warnings
+import PyCmdMessenger
+from PyCmdMessenger import bench
+
+COMMANDS = [["kInts","iIlL"],
+            ["kFloats","fd"],
+            ["kMixed","ib?s"],
+            ["kChar","c"],
+            ["kStar","if*"],
+            ["kEmpty",""]]
+
+def messengers():
+
+    for board_class in [PyCmdMessenger.ArduinoBoard,PyCmdMessenger.ArduinoDueBoard]:
+        board = board_class("loop://",timeout=0.1,settle_time=0)
+        yield board, PyCmdMessenger.CmdMessenger(board,COMMANDS)
+        board.close()
+
+def messages(board):
+
+    return [("kInts",(-5,7,-100000,100000)),
+            ("kInts",(board.int_min,board.unsigned_int_max,
+                      board.long_min,board.unsigned_long_max)),
+            ("kFloats",(1.5,-2.25)),
+            ("kMixed",(3,255,True,"text")),
+            ("kChar",("x",)),
+            ("kStar",(3,1.0,2.0,3.0)),
+            ("kStar",(3,0.5)),
+            ("kEmpty",())]
+
+def test_matches_per_field():
+
+    for board, c in messengers():
+        for cmd, args in messages(board):
+
+            fields = bench.compiled_encode(c,cmd,args)
+            assert fields == bench.per_field_encode(c,cmd,args)
+
+            # Decoding gives back the arguments, just as per-field did
+            cmd_name, received = c._decode(fields)
+            assert (cmd_name,received) == bench.per_field_decode(c,fields)
+            assert cmd_name == cmd
+            assert tuple(received) == args
+
+            # And the same through the serial port
+            c.send(cmd,*args)
+            assert c.receive()[:2] == (cmd,list(args))
+
+def test_coercion_and_errors():
+
+    for board, c in messengers():
+
+        # Values of the wrong python type take the per-field path, warnings
+        # and all
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            fields = c._get_codec("kInts").encode((2.0,3,4,5))
+        assert len(w) == 1
+        assert fields == c._get_codec("kInts").encode((2,3,4,5))
+
+        for args in [(board.int_max + 1,0,0,0),(0,-1,0,0),
+                     (0,0,board.long_min - 1,0)]:
+            try:
+                c._encode("kInts",args)
+                assert False
+            except OverflowError:
+                pass
+
+        try:
+            c._encode("kFloats",(board.float_max*10,0.0))
+            assert False
+        except OverflowError:
+            pass
+
+        try:
+            c._encode("kInts",(1,2))
+            assert False
+        except ValueError:
+            pass
+
+        try:
+            c._decode([b"0",b"1"])
+            assert False
+        except ValueError:
+            pass
+
+def test_codec_cache():
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.1,settle_time=0)
+    c = PyCmdMessenger.CmdMessenger(board,COMMANDS)
+
+    # One codec per command, compiled up front
+    codec = c._get_codec("kInts")
+    assert codec is c._get_codec("kInts")
+    assert codec.is_fixed
+    assert codec.prefix == b"0"
+
+    # "*" formats expand once per argument count
+    star = c._get_codec("kStar")
+    assert not star.is_fixed
+    assert star.expand(3) is star.expand(3)
+    assert star.expand(3).arg_formats == "iff"
+    assert star.expand(4).arg_formats == "ifff"
+
+    # arg_formats overrides are compiled on first use and kept
+    override = c._get_codec("kInts","ii")
+    assert override is c._get_codec("kInts","ii")
+    assert override is not codec
+    assert override.prefix == codec.prefix
+
+    # Broken "*" formats are caught when the messenger is made
+    try:
+        PyCmdMessenger.CmdMessenger(board,[["kBad","*i"]])
+        assert False
+    except ValueError:
+        pass
+
+    board.close()
+
+def main(argv=None):
+
+    for test in [test_matches_per_field,test_coercion_and_errors,test_codec_cache]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test the CRC16 frame check on a pyserial loop:// port and against the emulated
+rapid-float sketch.  No hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./crc_test.py"
+
+import binascii, os, time
+import PyCmdMessenger
+from PyCmdMessenger import emulator
+
+COMMANDS = [["kAcknowledge","s"],
+            ["kValuePing","i"],
+            ["kMultiValuePing","ild"]]
+
+PING_COMMANDS = [["double_ping","d","double_pong"],
+                 ["double_pong","d"]]
+
+def wait_for(condition,timeout=2):
+
+    end = time.time() + timeout
+    while not condition() and time.time() < end:
+        time.sleep(0.001)
+
+    return condition()
+
+def test_xmodem():
+
+    # Standard CRC-16/XMODEM check value
+    assert binascii.crc_hqx(b"123456789",0) == 0x31c3
+
+def test_round_trip():
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.2,settle_time=0)
+    c = PyCmdMessenger.CmdMessenger(board,COMMANDS,crc=True,warnings=False)
+
+    # Include values whose CRC has to be escaped
+    values = list(range(-150,150))
+    bodies = [b"1," + c._escape_field(c._send_int(v)) for v in values]
+    escaped = [b for b in bodies if len(c._crc_field(b)) > 2]
+    assert len(escaped) > 0
+
+    c.send_many([("kValuePing",(v,)) for v in values])
+    c.send("kMultiValuePing",-1,123456,2.5)
+    c.send("kAcknowledge","a;b,c/d")
+
+    assert [r[1][0] for r in c.receive_many(len(values),deadline=1)] == values
+    assert c.receive()[1] == [-1,123456,2.5]
+    assert c.receive()[1] == ["a;b,c/d"]
+
+    stats = c.corruption_stats()
+    assert stats["received"] == len(values) + 2
+    assert stats["corrupted"] == 0
+
+    board.close()
+
+def test_corrupted_messages():
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.2,settle_time=0)
+    c = PyCmdMessenger.CmdMessenger(board,COMMANDS,crc=True,warnings=False)
+
+    good = c._encode("kMultiValuePing",(7,8,9.5))
+    flipped = bytearray(good)
+    flipped[2] ^= 0x04
+
+    # A flipped bit, a message without a CRC, then a good one
+    board.write(bytes(flipped) + b"0,hello;" + good)
+    received = c.receive()
+    assert received[0] == "kMultiValuePing"
+    assert received[1] == [7,8,9.5]
+
+    assert c.corruption_stats() == {"received":3,"corrupted":2,
+                                    "crc_errors":2,
+                                    "percent_corrupted":100.0*2/3}
+    assert c.corrupted_cmds == 100.0*2/3
+
+    # Line endings after the command separator are not covered by the CRC
+    board.write(good + b"\r\n" + good)
+    assert c.receive()[1] == [7,8,9.5]
+    assert c.receive()[1] == [7,8,9.5]
+    assert c.corruption_stats()["crc_errors"] == 2
+
+    board.close()
+
+def test_emulator():
+
+    arduino = emulator.rapid_float_sketch()
+    arduino.use_crc16()
+    board = PyCmdMessenger.ArduinoBoard(arduino.device,baud_rate=115200,
+                                        settle_time=0)
+    arduino.start()
+
+    c = PyCmdMessenger.CmdMessenger(board,PING_COMMANDS,crc=True)
+    replies = c.query_many([("double_ping",(i*0.25,)) for i in range(50)])
+    assert [r[1][0] for r in replies] == [i*0.25 for i in range(50)]
+
+    # The arduino drops messages with a bad (or no) CRC
+    msg = bytearray(c._encode("double_ping",(1.0,)))
+    msg[3] ^= 0x10
+    board.write(bytes(msg) + b"0,/\x00/\x00/\x00/\x00/\x00/\x00\xf0?;")
+    assert wait_for(lambda: arduino.crc_errors == 2)
+    assert c.query("double_ping",2.0)[1] == [2.0]
+    assert c.corruption_stats()["corrupted"] == 0
+
+    board.close()
+    arduino.close()
+
+def test_threaded():
+
+    arduino = emulator.rapid_float_sketch()
+    arduino.use_crc16()
+    board = PyCmdMessenger.ArduinoBoard(arduino.device,baud_rate=115200,
+                                        settle_time=0)
+    arduino.start()
+
+    c = PyCmdMessenger.CmdMessengerThreaded(board,PING_COMMANDS,warnings=False,
+                                            crc=True)
+    c.enable_queue()
+
+    c.send("double_ping",1.5)
+    assert c.get(timeout=2)[1] == [1.5]
+
+    pong = bytearray(c._encode("double_pong",(3.0,)))
+    pong[-2] ^= 0x01
+    os.write(arduino._master,bytes(pong) + c._encode("double_pong",(4.0,)))
+    assert c.get(timeout=2)[1] == [4.0]
+
+    stats = c.corruption_stats()
+    assert stats["received"] == 3
+    assert stats["crc_errors"] == 1
+
+    c.close()
+    arduino.close()
+
+def main(argv=None):
+
+    for test in [test_xmodem,test_round_trip,test_corrupted_messages,
+                 test_emulator,test_threaded]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test finding boards by asking them who they are, using ptys running the
+emulated example sketch.  No hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./discovery_test.py"
+
+import os, tempfile, threading, time
+import PyCmdMessenger
+from PyCmdMessenger import discovery, emulator
+
+COMMANDS = [["who_are_you","","my_name_is"],
+            ["my_name_is","s"],
+            ["sum_two_ints","ii","sum_is"],
+            ["sum_is","i"],
+            ["error","s"]]
+
+def start_sketches(names,delay=0.0):
+
+    sketches = [emulator.example_sketch(name) for name in names]
+    for arduino in sketches:
+        timer = threading.Timer(delay,arduino.start)
+        timer.daemon = True
+        timer.start()
+
+    return sketches
+
+def test_identify():
+
+    arduino = start_sketches(["Bob"],delay=0.3)[0]
+    try:
+        assert discovery.identify(arduino.device,COMMANDS,baud_rate=115200) == "Bob"
+    finally:
+        arduino.close()
+
+    master, slave = os.openpty()
+    try:
+        start = time.perf_counter()
+        assert discovery.identify(os.ttyname(slave),COMMANDS,timeout=0.3) is None
+        assert time.perf_counter() - start < 1.0
+    finally:
+        os.close(master)
+        os.close(slave)
+
+    assert discovery.identify("/dev/no_such_board",COMMANDS) is None
+
+    try:
+        discovery.identify("/dev/no_such_board",[["who_are_you",""]])
+        assert False
+    except ValueError:
+        pass
+
+def test_discover():
+
+    names = ["Bob","Alice","Carol"]
+    sketches = start_sketches(names,delay=0.3)
+    master, slave = os.openpty()
+    silent = os.ttyname(slave)
+
+    tmp = tempfile.mkdtemp()
+    cache = os.path.join(tmp,"ports.json")
+    try:
+        devices = [a.device for a in sketches] + [silent,"/dev/no_such_board"]
+
+        # All at once: about the time of the slowest port, not the sum
+        start = time.perf_counter()
+        ports = PyCmdMessenger.discover(COMMANDS,devices,cache=cache,timeout=1.0)
+        assert time.perf_counter() - start < 2.0
+        assert ports == dict([(n,a.device) for n, a in zip(names,sketches)])
+        assert discovery.load_cache(cache) == ports
+
+        # The cached devices still answer, so nothing else is probed
+        assert PyCmdMessenger.discover(COMMANDS,[],cache=cache,timeout=1.0) == ports
+
+        # ... unless a board has gone missing
+        sketches[1].close()
+        ports = PyCmdMessenger.discover(COMMANDS,devices,cache=cache,timeout=0.5)
+        assert ports == {"Bob":sketches[0].device,"Carol":sketches[2].device}
+
+        # Two boards with the same name
+        twin = start_sketches(["Bob"])[0]
+        try:
+            PyCmdMessenger.discover(COMMANDS,[sketches[0].device,twin.device],timeout=1.0)
+            assert False
+        except ValueError:
+            pass
+        finally:
+            twin.close()
+
+        assert discovery.candidate_ports(os.path.join(tmp,"*.json")) == [cache]
+    finally:
+        for arduino in sketches:
+            arduino.close()
+        os.close(master)
+        os.close(slave)
+        os.remove(cache)
+        os.rmdir(tmp)
+
+def stream_junk(master,done):
+    """
+    Write NMEA-style lines (no command separators) to a pty until done.
+    """
+
+    os.set_blocking(master,False)
+    def stream():
+        while not done.is_set():
+            try:
+                os.write(master,b"$GPGGA,123519,4807.038,N,01131.000,E*47\r\n")
+            except BlockingIOError:
+                pass
+            time.sleep(0.002)
+
+    thread = threading.Thread(target=stream)
+    thread.daemon = True
+    thread.start()
+
+    return thread
+
+def test_noisy_ports():
+
+    # A burst of junk with no command separator
+    master, slave = os.openpty()
+    try:
+        os.write(master,b"bootloader junk")
+        start = time.perf_counter()
+        assert discovery.identify(os.ttyname(slave),COMMANDS,timeout=0.5) is None
+        assert time.perf_counter() - start < 1.5
+    finally:
+        os.close(master)
+        os.close(slave)
+
+    # A port that never stops talking, next to a real board
+    arduino = start_sketches(["Bob"])[0]
+    master, slave = os.openpty()
+    done = threading.Event()
+    thread = stream_junk(master,done)
+    try:
+        start = time.perf_counter()
+        assert discovery.identify(os.ttyname(slave),COMMANDS,timeout=0.5) is None
+        assert time.perf_counter() - start < 1.5
+
+        ports = PyCmdMessenger.discover(COMMANDS,[arduino.device,os.ttyname(slave)],
+                                        timeout=1.0)
+        assert ports == {"Bob":arduino.device}
+        assert time.perf_counter() - start < 3.0
+    finally:
+        done.set()
+        thread.join()
+        arduino.close()
+        os.close(master)
+        os.close(slave)
+
+def main(argv=None):
+
+    for test in [test_identify,test_discover,test_noisy_ports]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+from __future__ import print_function
 __description__ = \
 """
 Test ability to send duplex data (e.g. read args while sending them out with
@@ -11,8 +12,6 @@ __usage__ = "./duplex.py serial_device (like /dev/ttyACM0)"
 import random, sys
 import PyCmdMessenger
 
-from __future__ import print_function
-
 def main(argv=None):
     
     if argv == None:
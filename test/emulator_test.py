@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Run PyCmdMessenger against the emulated pingpong, rapid-float and duplex
+sketches.  No hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./emulator_test.py"
+
+import random, struct
+import PyCmdMessenger
+from PyCmdMessenger import emulator
+
+PINGPONG_COMMANDS = [["kCommError",""],
+                     ["kComment",""],
+                     ["kAcknowledge","s"],
+                     ["kAreYouReady","s"],
+                     ["kError","s"],
+                     ["kAskUsIfReady","s"],
+                     ["kYouAreReady","s"],
+                     ["kValuePing","gg"],
+                     ["kValuePong","g"],
+                     ["kMultiValuePing","ild"],
+                     ["kMultiValuePong","ild"]]
+
+def connect(arduino,commands,board_class=PyCmdMessenger.ArduinoBoard):
+    """
+    Open a board on the emulator, then start it (as if it had just reset).
+    """
+
+    board = board_class(arduino.device,baud_rate=115200,timeout=1.0,
+                        settle_time=0)
+    arduino.start()
+
+    return board, PyCmdMessenger.CmdMessenger(board,commands,warnings=False)
+
+def ping(c,type_name,value,arg_format):
+
+    type_id = emulator.PINGPONG_TYPES.index(type_name)
+    c.send("kValuePing",type_id,value,arg_formats="g" + arg_format)
+
+    return c.receive(arg_formats=arg_format)[1][0]
+
+def test_pingpong_binary():
+
+    with emulator.pingpong_sketch() as arduino:
+        board, c = connect(arduino,PINGPONG_COMMANDS)
+
+        assert c.receive()[1] == ["Arduino has resetted!"]
+        assert c.query("kAreYouReady")[1] == ["Arduino ready"]
+
+        for value in [True,False]:
+            assert ping(c,"kBBool",value,"?") == value
+        for value in range(0,256,5):
+            assert ping(c,"kBByte",value,"b") == value
+        for value in [-2**15,-1,0,44,59,2**15-1]:
+            assert ping(c,"kBInt16",value,"i") == value
+        for value in [-2**31,-1,0,47,2**31-1]:
+            assert ping(c,"kBInt32",value,"l") == value
+        for value in [0.0,1.5,-2.25e10,1e-30]:
+            assert ping(c,"kBFloat",value,"f") == struct.unpack("f",struct.pack("f",value))[0]
+            assert ping(c,"kBDouble",value,"d") == struct.unpack("f",struct.pack("f",value))[0]
+        for value in ["Test string","Test string/, with escape","a;b,c//"]:
+            assert ping(c,"kEscString",value,"s") == value
+
+        c.send("kMultiValuePing",-30000,2**30,0.5)
+        assert c.receive()[1] == [-30000,2**30,0.5]
+
+        board.close()
+
+def test_pingpong_text():
+
+    with emulator.pingpong_sketch() as arduino:
+        board, c = connect(arduino,PINGPONG_COMMANDS)
+        c.receive()
+
+        assert ping(c,"kInt16","70000","s") == "4464"
+        assert ping(c,"kInt32","-123abc","s") == "-123"
+        assert ping(c,"kFloat","3.14159","s") == "3.14"
+        assert ping(c,"kFloatSci","-12345.678","s") == "-1.234568E+4"
+        assert ping(c,"kBool","7","s") == "1"
+
+        # Unknown command goes to the default callback
+        c.send("kCommError")
+        assert c.receive()[1] == ["Unknown command"]
+        assert c.receive(arg_formats="ss")[1] == ["Command without attached callback","0"]
+
+        # The arduino asks us if we are ready and waits for an acknowledge
+        c.send("kAskUsIfReady")
+        assert c.receive()[0] == "kAreYouReady"
+        c.send("kAcknowledge","")
+        assert c.receive()[1] == ["1"]
+
+        board.close()
+
+def test_message_too_long():
+
+    with emulator.pingpong_sketch() as arduino:
+        board, c = connect(arduino,PINGPONG_COMMANDS)
+        c.receive()
+
+        # Overflows the 64 byte command buffer, so the arduino drops the
+        # first 63 bytes and treats the rest as an unknown command
+        c.send("kValuePing",emulator.PINGPONG_TYPES.index("kString"),"x"*70,
+               arg_formats="gs")
+        assert c.receive()[1] == ["Unknown command"]
+        assert c.receive(arg_formats="ss")[0] == "kYouAreReady"
+        assert c.query("kAreYouReady")[1] == ["Arduino ready"]
+
+        board.close()
+
+def test_rapid_float_and_duplex():
+
+    random.seed(0)
+    for sketch, fmt in [(emulator.rapid_float_sketch,"d"),
+                        (emulator.duplex_sketch,"fff")]:
+        with sketch() as arduino:
+            board, c = connect(arduino,[["double_ping",fmt],["double_pong",fmt]])
+
+            for i in range(500):
+                values = [2*(random.random() - 0.5) for f in fmt]
+                c.send("double_ping",*values)
+                received = c.receive()[1]
+                for v, r in zip(values,received):
+                    assert abs(v - r) < 0.000001
+
+            board.close()
+
+def test_due_sizes():
+
+    with emulator.rapid_float_sketch(board="due") as arduino:
+        board, c = connect(arduino,[["double_ping","d"],["double_pong","d"]],
+                           PyCmdMessenger.ArduinoDueBoard)
+
+        value = 1/3.0
+        c.send("double_ping",value)
+        assert c.receive()[1] == [value]
+
+        board.close()
+
+def main(argv=None):
+
+    for test in [test_pingpong_binary,test_pingpong_text,test_message_too_long,
+                 test_rapid_float_and_duplex,test_due_sizes]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Fuzz the single-pass escaping in CmdMessenger against the original approach of
+running a regular expression over every field.  Both must give byte-identical
+messages.  Runs against a pyserial loop:// port, so no arduino is needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./escape-fuzz_test.py [number_of_trials]"
+
+import random, struct, sys
+import PyCmdMessenger
+
+SEPARATORS = [(",",";","/"),
+              ("|","#","~"),
+              (":","!","%")]
+
+COMMANDS = [["kMultiValuePing","ild"],
+            ["kValuePing","d"],
+            ["kAcknowledge","s"],
+            ["multi_ping","f*"]]
+
+def regex_message(c,prefix,fields):
+    """
+    Escape every field with the regular expression, as send used to.
+    """
+
+    escaped = [c._escape_re.sub(c._byte_escape_sep + b"\\1",f) for f in fields]
+
+    return c._byte_field_sep.join([prefix] + escaped) + c._byte_command_sep
+
+def random_field(c):
+    """
+    Random bytes, heavily weighted towards the characters that need escaping.
+    """
+
+    special = [c._byte_field_sep,c._byte_command_sep,c._byte_escape_sep,b"\0"]
+
+    field = []
+    for i in range(random.choice(range(0,9))):
+        if random.random() < 0.3:
+            field.append(random.choice(special))
+        else:
+            field.append(struct.pack("B",random.choice(range(256))))
+
+    return b"".join(field)
+
+def messengers():
+
+    for field_sep, command_sep, escape_sep in SEPARATORS:
+        board = PyCmdMessenger.ArduinoBoard("loop://",settle_time=0)
+        yield PyCmdMessenger.CmdMessenger(board,COMMANDS,
+                                          field_separator=field_sep,
+                                          command_separator=command_sep,
+                                          escape_separator=escape_sep,
+                                          warnings=False)
+        board.close()
+
+def test_random_fields(num_trials=2000):
+
+    random.seed(0)
+    for c in messengers():
+        for i in range(num_trials):
+            fields = [random_field(c) for j in range(random.choice(range(6)))]
+            assert c._compile_message(b"9",fields) == regex_message(c,b"9",fields)
+
+def test_random_binary_values(num_trials=2000):
+
+    random.seed(1)
+    for c in messengers():
+        for i in range(num_trials):
+
+            args = (random.choice(range(c.board.int_min,c.board.int_max)),
+                    random.choice(range(c.board.long_min,c.board.long_max)),
+                    random.uniform(-1e6,1e6))
+
+            codec = c._get_codec("kMultiValuePing")
+            fields = codec.encode(args)
+            expected = regex_message(c,codec.prefix,fields)
+
+            assert c._encode("kMultiValuePing",args) == expected
+
+            # and it must survive the trip through the loop back port
+            c.send("kMultiValuePing",*args)
+            received = c.receive()
+            assert received[0] == "kMultiValuePing"
+            assert received[1][:2] == list(args[:2])
+
+def test_star_format_values(num_trials=200):
+
+    random.seed(2)
+    for c in messengers():
+        for i in range(num_trials):
+
+            args = tuple([struct.unpack("<f",struct.pack("<f",random.uniform(-10,10)))[0]
+                          for j in range(random.choice(range(1,50)))])
+
+            codec = c._get_codec("multi_ping")
+            expected = regex_message(c,codec.prefix,codec.encode(args))
+
+            assert c._encode("multi_ping",args) == expected
+
+            c.send("multi_ping",*args)
+            assert c.receive()[1] == list(args)
+
+def main(argv=None):
+
+    if argv == None:
+        argv = sys.argv[1:]
+
+    try:
+        num_trials = int(argv[0])
+    except IndexError:
+        num_trials = 2000
+    except ValueError:
+        err = "Incorrect arguments. Usage:\n\n{}\n\n".format(__usage__)
+        raise ValueError(err)
+
+    for test in [test_random_fields,test_random_binary_values]:
+        test(num_trials)
+        print("{:30s} --> PASS".format(test.__name__))
+
+    test_star_format_values(num_trials//10)
+    print("{:30s} --> PASS".format("test_star_format_values"))
+
+if __name__ == "__main__":
+    main()
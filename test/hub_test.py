@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test running several boards from one MessengerHub, using ptys and the emulated
+clock sketch.  No hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./hub_test.py"
+
+import os, time
+import PyCmdMessenger
+from PyCmdMessenger import emulator
+
+COMMANDS = [["kAcknowledge","s"],
+            ["kValuePong","i"]]
+
+CLOCK_COMMANDS = [["kGetMicros","","kMicros"],
+                  ["kMicros","L"],
+                  ["kGetReading","","kReading"],
+                  ["kReading","Lf"]]
+
+def open_pty_messenger():
+
+    master, slave = os.openpty()
+    board = PyCmdMessenger.ArduinoBoard(os.ttyname(slave),baud_rate=115200,
+                                        timeout=1,settle_time=0)
+    os.close(slave)
+
+    return master, PyCmdMessenger.CmdMessenger(board,COMMANDS,warnings=False)
+
+def test_many_boards():
+
+    hub = PyCmdMessenger.MessengerHub()
+    masters = {}
+    for i in range(6):
+        name = "board{}".format(i)
+        masters[name], c = open_pty_messenger()
+        hub.add(name,c)
+
+    try:
+        hub.add("board0",hub["board0"])
+        assert False
+    except ValueError:
+        pass
+
+    hub.start()
+    try:
+        # Interleave writes across the boards, including split messages
+        for j in range(20):
+            for name, master in masters.items():
+                msg = hub[name]._encode("kValuePong",(j,))
+                os.write(master,msg[:2])
+                os.write(master,msg[2:])
+
+        received = {}
+        for i in range(20*len(masters)):
+            board_name, cmd_name, values, message_time = hub.get(timeout=2)
+            assert cmd_name == "kValuePong"
+            received.setdefault(board_name,[]).extend(values)
+
+        for name in masters:
+            assert received[name] == list(range(20))
+        assert hub.get(timeout=0.05) is None
+
+        # Sending goes to the right board
+        hub.send("board4","kAcknowledge","hi")
+        expected = hub["board4"]._encode("kAcknowledge",("hi",))
+        assert os.read(masters["board4"],1024) == expected
+
+        # A removed board is no longer read
+        c = hub.remove("board5")
+        os.write(masters["board5"],c._encode("kValuePong",(1,)))
+        assert hub.get(timeout=0.1) is None
+        assert c.receive()[1] == [1]
+        c.board.close()
+        assert len(hub) == 5
+    finally:
+        hub.close()
+        for master in masters.values():
+            os.close(master)
+
+    assert len(hub) == 0
+
+def test_callback_and_poll():
+
+    seen = []
+    hub = PyCmdMessenger.MessengerHub(callback=lambda *msg: seen.append(msg))
+
+    master, c = open_pty_messenger()
+    hub.add("only",c)
+
+    try:
+        hub.get()
+        assert False
+    except RuntimeError:
+        pass
+
+    # Run from our own loop instead of a thread
+    os.write(master,c._encode("kAcknowledge",("one",)) + c._encode("kValuePong",(2,)))
+    os.write(master,b"9,bad;")
+    end = time.time() + 2
+    while len(seen) < 3 and time.time() < end:
+        hub.poll(0.1)
+
+    assert [m[:3] for m in seen] == [("only","kAcknowledge",["one"]),
+                                     ("only","kValuePong",[2]),
+                                     ("only","unknown",["bad"])]
+
+    # Closing the other end loses the board
+    os.close(master)
+    end = time.time() + 2
+    while "only" not in hub.lost and time.time() < end:
+        hub.poll(0.1)
+    assert "only" in hub.lost
+    assert len(hub) == 0
+
+    hub.close()
+    c.board.close()
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",settle_time=0)
+    try:
+        hub = PyCmdMessenger.MessengerHub()
+        hub.add("loop",PyCmdMessenger.CmdMessenger(board,COMMANDS))
+        assert False
+    except ValueError:
+        pass
+    hub.close()
+    board.close()
+
+def test_conflate_per_board():
+
+    hub = PyCmdMessenger.MessengerHub(maxsize=10,policy="conflate")
+    masters = {}
+    for name in ["b0","b1"]:
+        masters[name], c = open_pty_messenger()
+        hub.add(name,c)
+
+    try:
+        for i in range(3):
+            for name, master in masters.items():
+                os.write(master,hub[name]._encode("kValuePong",(i,)))
+                end = time.time() + 2
+                while hub.poll(0.1) == 0 and time.time() < end:
+                    pass
+
+        # The latest reading from each board, not just from the last one
+        received = [m[:3] for m in hub.messages(timeout=0.05)]
+        assert received == [("b0","kValuePong",[2]),("b1","kValuePong",[2])]
+        assert hub.dropped_messages() == {"kValuePong":4}
+    finally:
+        hub.close()
+        for master in masters.values():
+            os.close(master)
+
+def test_close_when_full():
+
+    hub = PyCmdMessenger.MessengerHub(maxsize=2,policy="block")
+    master, c = open_pty_messenger()
+    hub.add("b0",c)
+    hub.start()
+
+    # The hub thread ends up blocked putting into the full queue
+    os.write(master,b"".join([c._encode("kValuePong",(i,)) for i in range(5)]))
+    end = time.time() + 2
+    while len(hub._queue) < 2 and time.time() < end:
+        time.sleep(0.01)
+    time.sleep(0.05)
+
+    start = time.time()
+    hub.close()
+    assert time.time() - start < 0.5
+    os.close(master)
+
+def test_query():
+
+    sketches = []
+    with PyCmdMessenger.MessengerHub() as hub:
+
+        for i in range(3):
+            arduino = emulator.clock_sketch()
+            board = PyCmdMessenger.ArduinoBoard(arduino.device,baud_rate=115200,
+                                                timeout=1,settle_time=0)
+            arduino.start()
+            sketches.append(arduino)
+            hub.add("clock{}".format(i),PyCmdMessenger.CmdMessenger(board,CLOCK_COMMANDS))
+
+        futures = [hub.query_async(name,"kGetReading") for name in hub.names]
+        for f in futures:
+            cmd_name, received, message_time = f.result(timeout=2)
+            assert cmd_name == "kReading"
+            assert received[1] == 1.5
+
+        reply = hub.query("clock1","kGetMicros")
+        assert reply[0] == "kMicros"
+
+        # Replies go to the query, not the queue
+        assert hub.get(timeout=0.05) is None
+
+    for arduino in sketches:
+        arduino.close()
+
+def main(argv=None):
+
+    for test in [test_many_boards,test_callback_and_poll,test_conflate_per_board,
+                 test_close_when_full,test_query]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test the overflow policies of the bounded inbound queue.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./inbound_test.py"
+
+import threading, time
+from PyCmdMessenger.inbound import InboundQueue
+
+def fill(q,messages):
+    return [q.put(cmd_name,(cmd_name,value)) for cmd_name, value in messages]
+
+def drain(q):
+
+    out = []
+    while True:
+        msg = q.get(timeout=0)
+        if msg is None:
+            return out
+        out.append(msg)
+
+MESSAGES = [("a",0),("b",0),("a",1),("a",2),("b",1)]
+
+def test_drop_oldest():
+
+    q = InboundQueue(3,"drop_oldest")
+    assert fill(q,MESSAGES) == [True]*5
+    assert drain(q) == [("a",1),("a",2),("b",1)]
+    assert q.dropped == {"a":1,"b":1}
+
+def test_drop_newest():
+
+    q = InboundQueue(3,"drop_newest")
+    assert fill(q,MESSAGES) == [True,True,True,False,False]
+    assert drain(q) == [("a",0),("b",0),("a",1)]
+    assert q.dropped == {"a":1,"b":1}
+
+def test_conflate():
+
+    q = InboundQueue(10,"conflate")
+    fill(q,MESSAGES)
+    assert drain(q) == [("a",2),("b",1)]
+    assert q.dropped == {"a":2,"b":1}
+
+    # Conflating by key
+    q = InboundQueue(10,"conflate",{("b1","a"):"drop_newest"})
+    for board in ["b0","b1"]:
+        for cmd_name, value in MESSAGES:
+            q.put(cmd_name,(board,cmd_name,value),key=(board,cmd_name))
+    assert drain(q) == [("b0","a",2),("b0","b",1),
+                        ("b1","a",0),("b1","b",1),("b1","a",1),("b1","a",2)]
+
+    # Per command: conflate samples, keep every alarm
+    q = InboundQueue(10,"drop_newest",{"a":"conflate"})
+    fill(q,MESSAGES)
+    assert drain(q) == [("a",2),("b",0),("b",1)]
+
+def test_block():
+
+    q = InboundQueue(2,"block")
+    fill(q,MESSAGES[:2])
+
+    # Times out, dropping the message
+    assert not q.put("a",("a",1),timeout=0.05)
+    assert q.dropped == {"a":1}
+
+    # Waits for room
+    done = []
+    t = threading.Thread(target=lambda: done.append(q.put("a",("a",2))))
+    t.start()
+    time.sleep(0.05)
+    assert done == []
+    assert q.get() == ("a",0)
+    t.join(1)
+    assert done == [True]
+    assert drain(q) == [("b",0),("a",2)]
+
+    # Closing wakes a blocked put and a blocked get
+    fill(q,MESSAGES[:2])
+    t = threading.Thread(target=lambda: done.append(q.put("a",("a",3))))
+    t.start()
+    q.close()
+    t.join(1)
+    assert done == [True,False]
+    assert drain(q) == [("a",0),("b",0)]
+    assert q.get() is None
+
+def test_mixed_policies():
+
+    # Bulk traffic never pushes out a block message
+    q = InboundQueue(3,"conflate",{"alarm":"block","sample":"drop_oldest"})
+    assert q.put("alarm",("alarm",0))
+    assert q.put("temp",("temp",0))
+    assert q.put("alarm",("alarm",1))
+    assert q.put("sample",("sample",0))
+    assert q.put("temp",("temp",1))
+    assert q.dropped == {"temp":1,"sample":1}
+    assert drain(q) == [("alarm",0),("alarm",1),("temp",1)]
+
+    # Only block messages queued: the newcomer is dropped instead
+    fill(q,[("alarm",2),("alarm",3),("alarm",4)])
+    assert not q.put("sample",("sample",1))
+    assert not q.put("temp",("temp",2))
+    assert q.dropped == {"temp":2,"sample":2}
+    assert drain(q) == [("alarm",2),("alarm",3),("alarm",4)]
+
+def test_bad_policy():
+
+    try:
+        InboundQueue(10,"drop_everything")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("bad policy accepted")
+
+def main(argv=None):
+
+    for test in [test_drop_oldest,test_drop_newest,test_conflate,test_block,
+                 test_mixed_policies,test_bad_policy]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test the shared memory ring buffer and multi-process ingestion from ptys.  No
+hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./ingest_test.py"
+
+import os, time
+import numpy as np
+import PyCmdMessenger
+from PyCmdMessenger.ingest import SharedRing
+
+COMMANDS = [["kAcknowledge","s"],
+            ["kReading","Lfi"],
+            ["kStatus","?c"]]
+
+def open_ptys(num):
+
+    masters, boards = [], []
+    for i in range(num):
+        master, slave = os.openpty()
+        masters.append(master)
+        boards.append(("board{}".format(i),{"device":os.ttyname(slave),
+                                            "baud_rate":115200}))
+
+        # Keep the slave end open until the worker has it
+        masters.append(slave)
+
+    return masters[::2], masters[1::2], boards
+
+def test_ring():
+
+    dtype = np.dtype([("message_time","<f8"),("board","<u2"),("f0","<i4"),("f1","S1")])
+    ring = SharedRing(dtype,capacity=4)
+    other = SharedRing(dtype,name=ring.name)
+    try:
+        # Wrap around a few times
+        expected = []
+        for i in range(10):
+            assert other.append(i/2,i % 3,-i,b"x")
+            expected.append(i)
+            if i % 3 == 2:
+                rows = ring.read()
+                assert list(rows["f0"]) == [-e for e in expected]
+                expected = []
+        assert len(ring) == 1
+
+        # Full: the newest rows are dropped
+        for i in range(5):
+            other.append(0.0,0,i,b"y")
+        assert ring.dropped == 2
+        rows = ring.read(max_rows=2)
+        assert list(rows["f0"]) == [-9,0]
+        assert list(ring.read()["f0"]) == [1,2]
+        assert len(ring.read()) == 0
+
+        try:
+            SharedRing(np.dtype([("f0","<i4")]),name=ring.name)
+            assert False
+        except ValueError:
+            pass
+    finally:
+        other.close()
+        ring.close()
+        ring.unlink()
+
+def test_pool():
+
+    masters, slaves, boards = open_ptys(3)
+    described = [dict(kwargs) for name, kwargs in boards]
+    pool = PyCmdMessenger.IngestPool(COMMANDS,boards,num_workers=2)
+    for slave in slaves:
+        os.close(slave)
+
+    try:
+        assert pool.record == ["kReading","kStatus"]
+        encoder = PyCmdMessenger.CmdMessenger(PyCmdMessenger.ArduinoBoard("loop://",settle_time=0),COMMANDS)
+
+        for i in range(50):
+            for b, master in enumerate(masters):
+                os.write(master,encoder._encode("kReading",(1000*b + i,i/4,-i)))
+        os.write(masters[2],encoder._encode("kStatus",(True,"k")))
+        os.write(masters[1],encoder._encode("kAcknowledge",("not recorded",)))
+
+        rows = []
+        end = time.time() + 10
+        while sum([len(r) for r in rows]) < 150 and time.time() < end:
+            rows.append(pool.read("kReading"))
+            time.sleep(0.01)
+        rows = np.concatenate(rows)
+
+        assert rows.dtype.names == ("message_time","board","f0","f1","f2")
+        for b in range(3):
+            mine = rows[rows["board"] == b]
+            assert list(mine["f0"]) == [1000*b + i for i in range(50)]
+            assert list(mine["f2"]) == [-i for i in range(50)]
+            assert np.all(np.diff(mine["message_time"]) >= 0)
+
+        end = time.time() + 5
+        status = pool.read("kStatus")
+        while len(status) == 0 and time.time() < end:
+            status = pool.read("kStatus")
+        assert pool.board_names[status["board"][0]] == "board2"
+        assert status["f1"][0] == b"k"
+
+        assert pool.get(timeout=5)[:3] == ("board1","kAcknowledge",["not recorded"])
+
+        # Commands reach the board through its worker
+        pool.send("board0","kAcknowledge","hello")
+        expected = encoder._encode("kAcknowledge",("hello",))
+        received = b""
+        end = time.time() + 5
+        while len(received) < len(expected) and time.time() < end:
+            received += os.read(masters[0],1024)
+        assert received == expected
+
+        assert pool.dropped() == {"kReading":0,"kStatus":0}
+        encoder.board.close()
+
+        # The caller's board descriptions are left alone
+        assert [kwargs for name, kwargs in boards] == described
+
+        # A dead worker is reported, not silently missed
+        pool._workers[1].terminate()
+        pool._workers[1].join()
+        try:
+            pool.read("kReading")
+            assert False
+        except RuntimeError:
+            pass
+    finally:
+        pool.close()
+        for master in masters:
+            os.close(master)
+
+    try:
+        PyCmdMessenger.IngestPool(COMMANDS,boards,record=["kAcknowledge"])
+        assert False
+    except ValueError:
+        pass
+
+    # An uno and a due would need different row layouts
+    mixed = [("uno",{"device":"/dev/null"}),
+             ("due",{"device":"/dev/null","int_bytes":4,"double_bytes":8})]
+    try:
+        PyCmdMessenger.IngestPool(COMMANDS,mixed)
+        assert False
+    except ValueError:
+        pass
+
+def main(argv=None):
+
+    for test in [test_ring,test_pool]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test the link and command metrics on a pyserial loop:// port, which echoes
+everything sent back as received.  No hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./metrics_test.py"
+
+import time, urllib.request
+import PyCmdMessenger
+from PyCmdMessenger.metrics import LinkMetrics
+
+COMMANDS = [["kAcknowledge","s"],
+            ["kValuePing","i","kValuePing"],
+            ["kMultiValuePing","ild"],
+            ["kValuePong","i"],
+            ["kNoReply","i","kValuePong"]]
+
+def open_messenger(**kwargs):
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.1,settle_time=0)
+
+    return PyCmdMessenger.CmdMessenger(board,COMMANDS,warnings=False,**kwargs)
+
+def test_send_and_receive():
+
+    c = open_messenger()
+
+    c.send("kAcknowledge","hello")
+    c.send("kMultiValuePing",257,16843009,1.1)
+
+    # 11308 is sent as ",,", so both bytes need an escape
+    c.send("kValuePing",11308)
+
+    for i in range(3):
+        assert c.receive() is not None
+
+    snapshot = c.metrics.snapshot()
+    commands = snapshot["commands"]
+
+    assert commands["kAcknowledge"]["sent_messages"] == 1
+    assert commands["kAcknowledge"]["sent_bytes"] == len(b"0,hello;")
+    assert commands["kAcknowledge"]["received_bytes"] == len(b"0,hello;")
+    assert commands["kValuePing"]["sent_messages"] == 1
+    assert commands["kValuePing"]["sent_bytes"] == len(b"1,/,/,;")
+    assert commands["kValuePing"]["received_messages"] == 1
+    assert commands["kMultiValuePing"]["received_messages"] == 1
+    assert "kValuePong" not in commands
+
+    assert snapshot["sent"]["messages"] == 3
+    assert snapshot["received"]["messages"] == 3
+    assert snapshot["sent"]["bytes"] == snapshot["received"]["bytes"]
+    assert snapshot["sent"]["escape_bytes"] == 2
+    assert snapshot["received"]["escape_bytes"] == 2
+
+    num_bytes = snapshot["sent"]["bytes"] + snapshot["received"]["bytes"]
+    assert snapshot["escape_overhead"] == 4/(num_bytes - 4)
+
+    c.metrics.reset()
+    snapshot = c.metrics.snapshot()
+    assert snapshot["commands"] == {}
+    assert snapshot["sent"] == {"messages":0,"bytes":0,"escape_bytes":0}
+
+    c.board.close()
+
+def test_errors_and_timeouts():
+
+    c = open_messenger()
+
+    # Unknown command ids (out of range and not a number) decode as unknown,
+    # even with warnings off
+    c.board.write(b"99,abc;x,abc;")
+    for i in range(2):
+        assert c.receive()[0] == "unknown"
+
+    # Too many fields for kValuePong
+    c.board.write(b"3,a,b;")
+    try:
+        c.receive()
+        assert False
+    except ValueError:
+        pass
+
+    # Nothing arrives, then only half a message
+    assert c.receive() is None
+    c.board.write(b"0,abc")
+    try:
+        c.receive()
+        assert False
+    except EOFError:
+        pass
+
+    snapshot = c.metrics.snapshot()
+    assert snapshot["errors"] == {"unknown_command":2,
+                                  "argument_count":1,
+                                  "decode":1,
+                                  "crc":0,
+                                  "incomplete":1}
+    assert snapshot["timeouts"]["receive"] == 1
+    assert snapshot["commands"]["unknown"]["received_messages"] == 2
+
+    c.board.close()
+
+    # CRC failures count towards the totals, but no command
+    c = open_messenger(crc=True)
+    msg = bytearray(c._encode("kValuePong",(7,)))
+    msg[2] ^= 0x01
+    c.board.write(bytes(msg) + c._encode("kValuePong",(8,)))
+    assert c.receive()[1] == [8]
+
+    snapshot = c.metrics.snapshot()
+    assert snapshot["errors"]["crc"] == 1
+    assert snapshot["received"]["messages"] == 2
+    assert snapshot["commands"]["kValuePong"]["received_messages"] == 1
+
+    c.board.close()
+
+def test_query_latency():
+
+    c = open_messenger()
+
+    # loop:// sends kValuePing straight back, which is its own reply
+    for i in range(5):
+        assert c.query("kValuePing",i)[1] == [i]
+
+    # kNoReply waits for a kValuePong that never comes (the echo of the
+    # query is held as unsolicited)
+    assert c.query("kNoReply",1) is None
+    assert c.receive()[0] == "kNoReply"
+
+    snapshot = c.metrics.snapshot()
+    assert snapshot["timeouts"]["query"] == 1
+
+    latency = snapshot["query_latency"]["kValuePing"]
+    assert latency["count"] == 5
+    assert 0 < latency["sum"] < 5
+    assert latency["buckets"][-1] == (float("inf"),5)
+    counts = [b[1] for b in latency["buckets"]]
+    assert counts == sorted(counts)
+
+    c.board.close()
+
+def test_threaded():
+
+    class Collector(PyCmdMessenger.CmdMessengerThreaded):
+
+        def response_to_command(self,cmd_name,msg,message_time):
+            pass
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.1,settle_time=0)
+    c = Collector(board,COMMANDS,warnings=False)
+
+    for i in range(3):
+        assert c.query("kValuePing",i,timeout=2)[1] == [i]
+    c.send("kValuePong",1)
+    c.board.comm.write(b"3,a,b;")
+
+    end = time.time() + 2
+    while c.metrics.snapshot()["errors"]["decode"] == 0 and time.time() < end:
+        time.sleep(0.001)
+
+    snapshot = c.metrics.snapshot()
+    assert snapshot["query_latency"]["kValuePing"]["count"] == 3
+    assert snapshot["commands"]["kValuePong"]["received_messages"] == 2
+    assert snapshot["errors"]["argument_count"] == 1
+    assert snapshot["errors"]["decode"] == 1
+
+    c.stop()
+    board.close()
+
+def test_prometheus():
+
+    m = LinkMetrics()
+    m.count_sent(b"1",10,2)
+    m.count_received(b"1",12)
+    m.count_received(None,5)
+    m.count_error("crc")
+    m.observe_query("pong",0.003)
+    m.observe_query("pong",10.0)
+
+    text = m.prometheus()
+    lines = text.split("\n")
+
+    assert "# TYPE cmdmessenger_sent_messages_total counter" in lines
+    assert 'cmdmessenger_sent_messages_total{command="1"} 1' in lines
+    assert 'cmdmessenger_received_bytes_total{command="1"} 12' in lines
+    assert 'cmdmessenger_escape_bytes_total{direction="sent"} 2' in lines
+    assert 'cmdmessenger_errors_total{kind="crc"} 1' in lines
+    assert "# TYPE cmdmessenger_query_latency_seconds histogram" in lines
+    assert 'cmdmessenger_query_latency_seconds_bucket{command="pong",le="0.0025"} 0' in lines
+    assert 'cmdmessenger_query_latency_seconds_bucket{command="pong",le="0.005"} 1' in lines
+    assert 'cmdmessenger_query_latency_seconds_bucket{command="pong",le="+Inf"} 2' in lines
+    assert 'cmdmessenger_query_latency_seconds_count{command="pong"} 2' in lines
+    assert 'cmdmessenger_query_latency_seconds_sum{command="pong"} 10.003' in lines
+
+    host, port = m.serve()
+    try:
+        url = "http://{}:{}/metrics".format(host,port)
+        with urllib.request.urlopen(url,timeout=2) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert response.read().decode() == text
+
+        try:
+            m.serve()
+            assert False
+        except RuntimeError:
+            pass
+    finally:
+        m.stop_serving()
+
+def main(argv=None):
+
+    for test in [test_send_and_receive,test_errors_and_timeouts,
+                 test_query_latency,test_threaded,test_prometheus]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
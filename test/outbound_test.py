@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test merging outgoing messages into batches on the writer thread.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./outbound_test.py"
+
+import threading, time
+from PyCmdMessenger.outbound import OutboundWriter
+
+class SlowPort:
+    """
+    Records every write, taking delay seconds over each.
+    """
+
+    def __init__(self,delay=0.0):
+        self.delay = delay
+        self.writes = []
+
+    def write(self,data):
+        time.sleep(self.delay)
+        self.writes.append(data)
+
+MESSAGES = [b"0,1;",b"0,2;",b"0,3;",b"0,4;",b"0,5;"]
+
+def test_linger():
+
+    port = SlowPort()
+    writer = OutboundWriter(port.write,linger=0.05)
+    for m in MESSAGES:
+        writer.put(m)
+    assert port.writes == []
+    assert writer.flush(1)
+
+    # Everything arrived within the linger time
+    assert port.writes == [b"".join(MESSAGES)]
+    stats = writer.stats()
+    assert stats["batches"] == 1
+    assert stats["mean_batch_messages"] == 5
+    assert stats["max_batch_bytes"] == 20
+    assert 0.04 < stats["max_queue_time"] < 0.5
+
+    # A full batch goes out without waiting out the linger time
+    writer.max_batch_bytes = 8
+    start = time.perf_counter()
+    writer.put(MESSAGES[0])
+    writer.put(MESSAGES[1])
+    writer.put(MESSAGES[2])
+    writer.flush(1)
+    assert port.writes[1:] == [b"0,1;0,2;",b"0,3;"]
+    assert time.perf_counter() - start < 0.2
+
+    writer.close()
+    try:
+        writer.put(b"0,6;")
+        assert False
+    except RuntimeError:
+        pass
+
+def test_no_linger():
+
+    # Messages put while a write is in progress go out together next
+    port = SlowPort(delay=0.05)
+    writer = OutboundWriter(port.write)
+    writer.put(MESSAGES[0])
+    time.sleep(0.01)
+    for m in MESSAGES[1:]:
+        writer.put(m)
+    writer.close()
+
+    assert port.writes == [MESSAGES[0],b"".join(MESSAGES[1:])]
+    assert writer.stats()["max_batch_messages"] == 4
+
+    # Messages bigger than a batch are written on their own
+    port = SlowPort()
+    writer = OutboundWriter(port.write,max_batch_bytes=2)
+    for m in MESSAGES:
+        writer.put(m)
+    writer.flush(1)
+    assert port.writes == MESSAGES
+    writer.close()
+
+def test_many_threads():
+
+    port = SlowPort()
+    writer = OutboundWriter(port.write,linger=0.001)
+
+    def put(t):
+        for i in range(200):
+            writer.put("{},{};".format(t,i).encode())
+
+    threads = [threading.Thread(target=put,args=(t,)) for t in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.flush(2)
+
+    messages = b"".join(port.writes).decode().split(";")[:-1]
+    assert len(messages) == 800
+    for t in range(4):
+        mine = [m for m in messages if m.startswith("{},".format(t))]
+        assert mine == ["{},{}".format(t,i) for i in range(200)]
+    assert writer.stats()["batches"] == len(port.writes)
+    writer.close()
+
+def test_priorities():
+
+    # Two messages per write, each write taking a while
+    port = SlowPort(delay=0.05)
+    writer = OutboundWriter(port.write,max_batch_bytes=8)
+    for i in range(6):
+        writer.put("0,{};".format(i).encode())
+    time.sleep(0.01)
+
+    # Jumps ahead of the bulk messages still queued, at the next write
+    writer.put(b"9;",priority=5)
+    writer.put(b"8;",priority=1)
+    writer.flush(2)
+    assert port.writes == [b"0,0;0,1;",b"9;8;0,2;",b"0,3;0,4;",b"0,5;"]
+
+    stats = writer.stats()
+    assert sorted(stats["priorities"].keys()) == [0,1,5]
+    assert stats["priorities"][0]["messages"] == 6
+    assert stats["priorities"][5]["messages"] == 1
+    assert stats["priorities"][5]["max_queue_time"] < 0.1
+    assert stats["priorities"][0]["max_queue_time"] > 0.1
+    assert stats["messages"] == 8
+    writer.close()
+
+    # Urgent messages do not linger
+    port = SlowPort()
+    writer = OutboundWriter(port.write,linger=1.0)
+    start = time.perf_counter()
+    writer.put(b"9;",priority=1)
+    writer.flush(2)
+    assert time.perf_counter() - start < 0.5
+
+    writer.reset_stats()
+    assert writer.stats()["priorities"][1]["messages"] == 0
+
+    try:
+        writer.put(b"9;",priority="high")
+        assert False
+    except ValueError:
+        pass
+    writer.close()
+
+def test_chunks():
+
+    # Chunks are written one by one, with nothing merged into or between them
+    port = SlowPort()
+    started = threading.Event()
+    proceed = threading.Event()
+    def write(data):
+        port.write(data)
+        if data == b"0,1;0,":
+            started.set()
+            proceed.wait(2)
+
+    writer = OutboundWriter(write,linger=0.01)
+    writer.put(b"0,0;")
+    writer.put_chunks([b"0,1;0,",b"2;0,3;"])
+    assert started.wait(2)
+    writer.put(b"9;",priority=5)
+    writer.put(b"0,4;")
+    proceed.set()
+    writer.flush(2)
+    assert port.writes == [b"0,0;",b"0,1;0,",b"2;0,3;",b"9;0,4;"]
+
+    stats = writer.stats()
+    assert stats["batches"] == 4
+    assert stats["messages"] == 4
+    assert stats["bytes"] == 22
+
+    writer.put_chunks([])
+    writer.flush(1)
+    assert len(port.writes) == 4
+    writer.close()
+
+def test_failed_write():
+
+    def write(data):
+        raise OSError("port went away")
+
+    writer = OutboundWriter(write)
+    writer.put(b"0;")
+    try:
+        writer.flush(1)
+        assert False
+    except RuntimeError:
+        pass
+
+    try:
+        writer.put(b"0;")
+        assert False
+    except RuntimeError:
+        pass
+
+    try:
+        OutboundWriter(write,linger=-1)
+        assert False
+    except ValueError:
+        pass
+
+def main(argv=None):
+
+    for test in [test_linger,test_no_linger,test_many_threads,test_priorities,
+                 test_chunks,test_failed_write]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+from __future__ import print_function
 __description__ = \
 """
 Run full test suite on PyCmdMessenger/arduino interface.
@@ -10,8 +11,6 @@ __usage__ = "run_test.py serial_device [s] (optional s will test string interfac
 import PyCmdMessenger
 import time, string, sys, struct, random
 
-from __future__ import print_function
-
 BAUD_RATE = 115200
 
 COMMANDS = [["kCommError",""],
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test matching replies to queries.  The pyserial loop:// port echoes every
+message back, so each command is declared as its own reply.  No arduino needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./query_test.py"
+
+import threading, time
+import PyCmdMessenger
+
+COMMANDS = [["kAcknowledge","s"],
+            ["kValuePing","i","kValuePing"],
+            ["kMultiValuePing","ild","kMultiValuePing"]]
+
+def messenger():
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.2,settle_time=0)
+
+    return board, PyCmdMessenger.CmdMessenger(board,COMMANDS)
+
+def test_query_holds_back_other_messages():
+
+    board, c = messenger()
+
+    c.send("kAcknowledge","first")
+    received = c.query("kValuePing",5)
+    assert received[0] == "kValuePing"
+    assert received[1] == [5]
+
+    # The message that got in the way is still there for receive
+    received = c.receive()
+    assert received[0] == "kAcknowledge"
+    assert received[1] == ["first"]
+
+    assert c.receive() is None
+
+    board.close()
+
+def test_query_many():
+
+    board, c = messenger()
+
+    queries = [("kValuePing",(i,)) for i in range(5)]
+    queries.insert(2,("kMultiValuePing",(1,2,0.5)))
+    c.send("kAcknowledge","in the way")
+
+    replies = c.query_many(queries)
+    assert [r[1] for r in replies] == [[0],[1],[1,2,0.5],[2],[3],[4]]
+    assert c.receive()[1] == ["in the way"]
+
+    board.close()
+
+def test_query_timeout():
+
+    board, c = messenger()
+
+    # Nothing will ever answer a query that never got sent
+    future = c._expect_reply("kValuePing")
+    assert c._gather_replies([future]) == [None]
+    assert c._correlator.num_pending == 0
+
+    board.close()
+
+def test_query_deadline():
+
+    board, c = messenger()
+
+    # Other traffic keeps arriving, but the query still times out
+    other = c._encode("kAcknowledge",("noise",))
+    stop = threading.Event()
+    def chatter():
+        while not stop.is_set():
+            board.comm.write(other*10)
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=chatter)
+    thread.daemon = True
+    thread.start()
+    try:
+        c.max_unsolicited = 50
+        start = time.monotonic()
+        future = c._expect_reply("kValuePing")
+        assert c._gather_replies([future],timeout=0.2) == [None]
+        assert time.monotonic() - start < 1.0
+    finally:
+        stop.set()
+        thread.join()
+
+    # Held back messages are bounded
+    assert len(c._unsolicited) == 50
+    assert c.dropped_unsolicited > 0
+
+    # Empty messages and replies arriving in pieces are waited for
+    while c.receive() is not None:
+        pass
+    reply = c._encode("kValuePing",(7,))
+    timer = threading.Timer(0.05,board.comm.write,[b";" + reply[:3]])
+    timer.start()
+    threading.Timer(0.15,board.comm.write,[reply[3:]]).start()
+    future = c._expect_reply("kValuePing")
+    assert c._gather_replies([future],timeout=1)[0][1] == [7]
+
+    board.close()
+
+def test_bad_response_command():
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",settle_time=0)
+    try:
+        PyCmdMessenger.CmdMessenger(board,[["ping","","pong"]])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown response command accepted")
+
+    board.close()
+
+def main(argv=None):
+
+    for test in [test_query_holds_back_other_messages,test_query_many,
+                 test_query_timeout,test_query_deadline,
+                 test_bad_response_command]:
+        test()
+        print("{:40s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+from __future__ import print_function
 __description__ = \
 """
 Test that sends 10000 floats as fast as possible back and forth to the arduino.
@@ -14,8 +15,6 @@ __usage__ = "./rapid-float.py serial_device (like /dev/ttyACM0)"
 import random, sys
 import PyCmdMessenger
 
-from __future__ import print_function
-
 def main(argv=None):
     
     if argv == None:
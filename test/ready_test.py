@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test probing boards until the sketch answers instead of sleeping settle_time,
+and opening several boards at once, using the emulated clock sketch.  No
+hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./ready_test.py"
+
+import os, threading, time
+import PyCmdMessenger
+from PyCmdMessenger import emulator
+
+COMMANDS = [["kGetMicros","","kMicros"],
+            ["kMicros","L"],
+            ["kGetReading","","kReading"],
+            ["kReading","Lf"]]
+
+# kGetMicros is answered with kMicros
+PROBE = {"baud_rate":115200,"ready_probe":b"0;","ready_reply":b"1,"}
+
+def start_later(arduino,delay):
+
+    timer = threading.Timer(delay,arduino.start)
+    timer.daemon = True
+    timer.start()
+
+    return timer
+
+def test_ready_probe():
+
+    arduino = emulator.clock_sketch()
+    start_later(arduino,0.3)
+    try:
+        start = time.perf_counter()
+        board = PyCmdMessenger.ArduinoBoard(arduino.device,**PROBE)
+        elapsed = time.perf_counter() - start
+        assert 0.3 <= elapsed < 1.5
+
+        # Replies to the earlier probes do not reach the messenger
+        c = PyCmdMessenger.CmdMessenger(board,COMMANDS)
+        assert board.comm.in_waiting == 0
+        assert c.query("kGetReading")[1][1] == 1.5
+
+        assert board.wait_ready() < 0.5
+        board.close()
+    finally:
+        arduino.close()
+
+    # A board that never answers
+    master, slave = os.openpty()
+    try:
+        start = time.perf_counter()
+        PyCmdMessenger.ArduinoBoard(os.ttyname(slave),ready_timeout=0.3,**PROBE)
+        assert False
+    except RuntimeError:
+        assert time.perf_counter() - start < 1.0
+    finally:
+        os.close(master)
+        os.close(slave)
+
+def test_open_boards():
+
+    sketches = [emulator.clock_sketch() for i in range(4)]
+    for i, arduino in enumerate(sketches):
+        start_later(arduino,0.2 + 0.1*i)
+
+    try:
+        start = time.perf_counter()
+        boards = PyCmdMessenger.open_boards([dict(device=a.device,**PROBE)
+                                             for a in sketches])
+        elapsed = time.perf_counter() - start
+
+        # As long as the slowest board, not all of them in turn
+        assert 0.5 <= elapsed < 1.5
+        assert [b.device for b in boards] == [a.device for a in sketches]
+        for b in boards:
+            c = PyCmdMessenger.CmdMessenger(b,COMMANDS)
+            assert c.query("kGetMicros")[0] == "kMicros"
+            b.close()
+
+        # One failure closes the rest
+        master, slave = os.openpty()
+        devices = [sketches[0].device,os.ttyname(slave)]
+        try:
+            PyCmdMessenger.open_boards([dict(device=d,ready_timeout=0.3,**PROBE)
+                                        for d in devices])
+            assert False
+        except RuntimeError:
+            pass
+        finally:
+            os.close(master)
+            os.close(slave)
+
+        assert PyCmdMessenger.open_boards([]) == []
+
+        try:
+            PyCmdMessenger.open_boards([{"baud_rate":115200}])
+            assert False
+        except ValueError:
+            pass
+    finally:
+        for arduino in sketches:
+            arduino.close()
+
+def test_open_due_boards():
+
+    sketches = [emulator.clock_sketch(board="due") for i in range(2)]
+    for arduino in sketches:
+        start_later(arduino,0.1)
+
+    try:
+        boards = PyCmdMessenger.open_boards([dict(device=a.device,**PROBE)
+                                             for a in sketches],
+                                            board_class=PyCmdMessenger.ArduinoDueBoard)
+        for b in boards:
+            assert isinstance(b,PyCmdMessenger.ArduinoDueBoard)
+            assert b.int_bytes == 4
+            c = PyCmdMessenger.CmdMessenger(b,COMMANDS)
+            assert c.query("kGetReading")[1][1] == 1.5
+            b.close()
+    finally:
+        for arduino in sketches:
+            arduino.close()
+
+def stream_readings(a):
+    """
+    loop() of a sketch that sends a reading every pass, from boot on.
+    """
+
+    a.send_cmd_start("kReading")
+    a.send_cmd_bin_arg(a.micros(),"unsigned long")
+    a.send_cmd_bin_arg(2.5,"float")
+    a.send_cmd_end()
+
+def test_streaming_sketch():
+
+    # The port never goes quiet, so draining the probe replies has to stop
+    # on its own
+    sketches = [emulator.clock_sketch(loop=stream_readings) for i in range(2)]
+    for arduino in sketches:
+        start_later(arduino,0.1)
+
+    try:
+        start = time.perf_counter()
+        board = PyCmdMessenger.ArduinoBoard(sketches[0].device,ready_timeout=1.0,
+                                            **PROBE)
+        assert time.perf_counter() - start < 1.5
+
+        c = PyCmdMessenger.CmdMessenger(board,COMMANDS)
+        readings = []
+        while len(readings) < 5 and time.perf_counter() - start < 3:
+            try:
+                readings.extend(c.receive_many(5,deadline=0.5))
+            except ValueError:
+                pass
+        assert len(readings) >= 5
+        assert set([r[0] for r in readings]) == set(["kReading"])
+        board.close()
+
+        start = time.perf_counter()
+        boards = PyCmdMessenger.open_boards([dict(device=a.device,ready_timeout=1.0,
+                                                  **PROBE) for a in sketches])
+        assert time.perf_counter() - start < 1.5
+        for b in boards:
+            b.close()
+    finally:
+        for arduino in sketches:
+            arduino.close()
+
+def main(argv=None):
+
+    for test in [test_ready_probe,test_open_boards,test_open_due_boards,
+                 test_streaming_sketch]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test ArduinoBoard.read_available and how CmdMessenger.receive frames messages
+out of its receive buffer, on a pty and on a pyserial loop:// port.  No
+arduino needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./receive_test.py"
+
+import os, threading, time
+import PyCmdMessenger
+
+COMMANDS = [["kAcknowledge","s"],
+            ["kValuePing","i"],
+            ["kMultiValuePing","ild"]]
+
+def pty_board(timeout=0.5):
+
+    master, slave = os.openpty()
+    board = PyCmdMessenger.ArduinoBoard(os.ttyname(slave),timeout=timeout,
+                                        settle_time=0)
+
+    return master, slave, board
+
+def check_read_available(board,write):
+
+    # Everything waiting comes back in one call
+    for data in [b"1,", b"2;", b"3,4;"]:
+        write(data)
+    time.sleep(0.05)
+    assert board.read_available() == b"1,2;3,4;"
+
+    # Nothing waiting: wait up to the timeout given, leaving the board's
+    # timeout alone
+    start = time.perf_counter()
+    assert board.read_available(0.1) == b""
+    assert 0.08 <= time.perf_counter() - start < 0.4
+    assert board.comm.timeout == board.timeout
+
+    # Bytes arriving while waiting end the wait early
+    timer = threading.Timer(0.05,write,[b"5;"])
+    timer.start()
+    start = time.perf_counter()
+    assert board.read_available(2) == b"5;"
+    assert time.perf_counter() - start < 1
+    timer.join()
+    assert board.comm.timeout == board.timeout
+
+    # The board timeout is used by default
+    start = time.perf_counter()
+    assert board.read_available() == b""
+    assert time.perf_counter() - start >= board.timeout*0.8
+
+def test_read_available():
+
+    master, slave, board = pty_board(timeout=0.2)
+    try:
+        assert board._fd is not None
+        check_read_available(board,lambda data: os.write(master,data))
+    finally:
+        board.close()
+        os.close(master)
+        os.close(slave)
+
+    # No file descriptor to wait on
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.2,settle_time=0)
+    assert board._fd is None
+    check_read_available(board,board.comm.write)
+    board.close()
+
+def test_concurrent_reads():
+
+    # A long read on one thread is not cut short by a short one on another
+    master, slave, board = pty_board(timeout=0.5)
+    try:
+        results = []
+        def long_read():
+            start = time.perf_counter()
+            results.append((board.read_available(),time.perf_counter() - start))
+
+        thread = threading.Thread(target=long_read)
+        thread.start()
+        for i in range(5):
+            board.read_available(0.01)
+        thread.join()
+
+        assert results[0][0] == b""
+        assert results[0][1] >= 0.4
+    finally:
+        board.close()
+        os.close(master)
+        os.close(slave)
+
+def test_framing():
+
+    master, slave, board = pty_board()
+    try:
+        c = PyCmdMessenger.CmdMessenger(board,COMMANDS)
+
+        # Several messages in one read come out one receive at a time; the
+        # rest stay buffered, not on the port
+        messages = [c._encode("kValuePing",(i,)) for i in range(3)]
+        os.write(master,b"".join(messages))
+        time.sleep(0.05)
+        assert c.receive()[1] == [0]
+        assert board.comm.in_waiting == 0
+        assert c.receive()[1] == [1]
+        assert c.receive()[1] == [2]
+
+        # A message split across reads
+        msg = c._encode("kMultiValuePing",(-7,123456,2.5))
+        threading.Timer(0.05,os.write,[master,msg[5:]]).start()
+        os.write(master,msg[:5])
+        cmd_name, received, message_time = c.receive()
+        assert cmd_name == "kMultiValuePing"
+        assert received == [-7,123456,2.5]
+
+        # Escaped separators inside a binary field, and blank input
+        value = 0x3B2C
+        msg = c._encode("kValuePing",(value,))
+        assert b"/" in msg
+        os.write(master,b"\r\n" + msg)
+        assert c.receive()[1] == [value]
+
+        # Nothing more: None after the timeout
+        assert c.receive() is None
+    finally:
+        board.close()
+        os.close(master)
+        os.close(slave)
+
+def test_frames_from_chunk():
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.1,settle_time=0)
+    c = PyCmdMessenger.CmdMessenger(board,COMMANDS,warnings=False)
+
+    # Whole messages come out, empty ones are skipped and a partial one waits
+    # for the next chunk
+    msg = c._encode("kMultiValuePing",(1,2,3.0))
+    chunk = c._encode("kValuePing",(5,)) + b";" + msg[:4]
+    frames = list(c._frames_from_chunk(chunk))
+    assert [c._decode(f)[1] for f, t in frames] == [[5]]
+
+    frames = list(c._frames_from_chunk(msg[4:]))
+    assert [c._decode(f)[1] for f, t in frames] == [[1,2,3.0]]
+
+    # A message that will not decode is still yielded; _decode_counted
+    # counts it
+    frames = list(c._frames_from_chunk(b"1,x;"))
+    assert c._decode_counted(frames[0][0]) is None
+    assert c.corruption_stats()["corrupted"] == 1
+
+    board.close()
+
+def main(argv=None):
+
+    for test in [test_read_available,test_concurrent_reads,test_framing,
+                 test_frames_from_chunk]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+from __future__ import print_function
 __description__ = \
 """
 Test the use of the * format. It sends a random list of longs (without a pre-
@@ -12,8 +13,6 @@ __usage__ = "./duplex.py serial_device (like /dev/ttyACM0)"
 import random, sys
 import PyCmdMessenger
 
-from __future__ import print_function
-
 def main(argv=None):
     
     if argv == None:
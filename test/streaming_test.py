@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test messages() and receive_many() on a pyserial loop:// port.  No arduino
+needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./streaming_test.py"
+
+import time
+import PyCmdMessenger
+
+COMMANDS = [["kAcknowledge","s"],
+            ["kValuePing","i"],
+            ["kMultiValuePing","ild"]]
+
+def messenger():
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.5,settle_time=0)
+
+    return board, PyCmdMessenger.CmdMessenger(board,COMMANDS)
+
+def test_messages():
+
+    board, c = messenger()
+
+    c.send_many([("kValuePing",(i,)) for i in range(5)] +
+                [("kAcknowledge",("skip me",))] +
+                [("kValuePing",(i,)) for i in range(5,10)])
+
+    start = time.time()
+    seen = [r[0] for cmd_name, r, t in c.messages(timeout=0.05,
+                                                 commands=["kValuePing"])]
+    assert seen == list(range(10))
+
+    # Stopped after the (short) timeout, not the serial timeout
+    assert time.time() - start < 0.4
+
+    board.close()
+
+def test_receive_many():
+
+    board, c = messenger()
+
+    c.send_many([("kValuePing",(i,)) for i in range(10)])
+    batch = c.receive_many(4)
+    assert [b[1][0] for b in batch] == [0,1,2,3]
+
+    batch = c.receive_many(100,deadline=0.05)
+    assert [b[1][0] for b in batch] == list(range(4,10))
+
+    assert c.receive_many(100,deadline=0) == []
+
+    board.close()
+
+def test_partial_message_kept():
+
+    board, c = messenger()
+
+    msg = c._encode("kMultiValuePing",(1,2,3.0))
+    board.write(msg[:4])
+    assert c.receive_many(1,deadline=0.05) == []
+
+    board.write(msg[4:])
+    batch = c.receive_many(1,deadline=1)
+    assert batch[0][1] == [1,2,3.0]
+
+    board.close()
+
+def test_deadline_while_streaming():
+
+    board, c = messenger()
+
+    # Bytes are always waiting, but never make a message
+    board.read_available = lambda timeout=None: b"$GPGGA,123519,4807.038,N\r\n"
+
+    start = time.time()
+    assert c.receive_many(1,deadline=0.2) == []
+    assert list(c.messages(timeout=0.2)) == []
+    assert time.time() - start < 1.0
+
+    board.close()
+
+def test_send_many_chunks():
+
+    board, c = messenger()
+
+    writes = []
+    board_write = board.write
+    def record(data):
+        writes.append(data)
+        board_write(data)
+    board.write = record
+
+    # Chunks are filled with whole messages up to max_chunk_size
+    commands = [("kValuePing",(i,)) for i in range(10)]
+    num_bytes = c.send_many(commands,max_chunk_size=16)
+    messages = [c._encode(cmd,args) for cmd, args in commands]
+    assert num_bytes == [len(m) for m in messages]
+    assert max([len(w) for w in writes]) <= 16
+    assert len(writes) < len(messages)
+    assert b"".join(writes) == b"".join(messages)
+    for w in writes:
+        assert w.endswith(b";")
+
+    batch = c.receive_many(100,deadline=0.5)
+    assert [b[1][0] for b in batch] == list(range(10))
+
+    # A message longer than a chunk is split into max_chunk_size pieces
+    writes.clear()
+    text = "a message longer than one chunk"
+    big = c._encode("kAcknowledge",(text,))
+    num_bytes = c.send_many([("kValuePing",(1,)),("kAcknowledge",(text,)),
+                             ("kValuePing",(2,))],max_chunk_size=8)
+    assert num_bytes[1] == len(big) > 8
+    assert max([len(w) for w in writes]) <= 8
+    assert big[:8] in writes
+
+    batch = c.receive_many(3,deadline=0.5)
+    assert [b[1][0] for b in batch] == [1,text,2]
+
+    try:
+        c.send_many(commands,max_chunk_size=0)
+        assert False
+    except ValueError:
+        pass
+
+    board.close()
+
+def main(argv=None):
+
+    for test in [test_messages,test_receive_many,test_partial_message_kept,
+                 test_deadline_while_streaming,test_send_many_chunks]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test the memory-mapped telemetry store, filled from a pyserial loop:// port
+(which echoes everything sent back as received) and read from another process.
+No hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./telemetry_test.py"
+
+import os, shutil, subprocess, sys, tempfile, time
+import numpy as np
+import PyCmdMessenger
+from PyCmdMessenger import telemetry
+
+COMMANDS = [["kReading","Lfi?c"],
+            ["kValuePing","i","kValuePing"],
+            ["kAcknowledge","s"],
+            ["kArray","f*"],
+            ["kEmpty",""]]
+
+NAMES = {"kReading":["micros","value","count","ok","unit"]}
+
+def open_messenger(threaded=False):
+
+    board = PyCmdMessenger.ArduinoBoard("loop://",timeout=0.1,settle_time=0)
+    if not threaded:
+        return PyCmdMessenger.CmdMessenger(board,COMMANDS)
+
+    class Collector(PyCmdMessenger.CmdMessengerThreaded):
+        def response_to_command(self,cmd_name,msg,message_time):
+            pass
+
+    c = Collector(board,COMMANDS)
+    c.enable_queue()
+
+    return c
+
+def readings(num):
+
+    # 11308 is sent as ",,", so some messages need escapes
+    return [(1000*i,i/4,[-i,11308][i % 2],i % 3 == 0,"V") for i in range(num)]
+
+def test_dtype():
+
+    uno = PyCmdMessenger.ArduinoBoard("loop://",settle_time=0)
+    due = PyCmdMessenger.ArduinoDueBoard("loop://",settle_time=0)
+
+    dtype = telemetry.telemetry_dtype(uno,"Lfi?c",NAMES["kReading"])
+    assert dtype.names == ("message_time","micros","value","count","ok","unit")
+    assert dtype["count"] == np.dtype("<i2")
+    assert dtype.itemsize == 8 + 4 + 4 + 2 + 1 + 1
+
+    assert telemetry.telemetry_dtype(due,"id").names == ("message_time","f0","f1")
+    assert telemetry.telemetry_dtype(due,"id")["f0"] == np.dtype("<i4")
+    assert telemetry.telemetry_dtype(due,None).names == ("message_time",)
+
+    for bad in ["s","f*","g"]:
+        try:
+            telemetry.telemetry_dtype(uno,bad)
+            assert False
+        except ValueError:
+            pass
+
+    try:
+        telemetry.telemetry_dtype(uno,"ii",["a"])
+        assert False
+    except ValueError:
+        pass
+
+    uno.close()
+    due.close()
+
+def test_store():
+
+    directory = tempfile.mkdtemp()
+    c = open_messenger()
+    try:
+        store = PyCmdMessenger.TelemetryStore(directory,c,names=NAMES,chunk_rows=4)
+
+        # Only commands with fixed-size arguments get a table
+        assert sorted(store.tables.keys()) == ["kEmpty","kReading","kValuePing"]
+        try:
+            PyCmdMessenger.TelemetryStore(directory,c,["kAcknowledge"])
+            assert False
+        except ValueError:
+            pass
+
+        expected = readings(10)
+        table = store["kReading"]
+        num_copied = 0
+        for values in expected:
+            c.send("kReading",*values)
+            fields = c._read_fields()
+            if table.append_fields(fields,c.clock()):
+                num_copied += 1
+            else:
+                cmd_name, received = c._decode(fields)
+                store.append(cmd_name,received,c.clock())
+
+        # Escaped messages are copied straight from the unescaped buffer too
+        assert num_copied == 10
+        assert len(table) == 10
+        assert table.capacity == 12
+
+        rows = table.rows
+        assert list(rows["micros"]) == [v[0] for v in expected]
+        assert list(rows["value"]) == [v[1] for v in expected]
+        assert list(rows["count"]) == [v[2] for v in expected]
+        assert list(rows["ok"]) == [v[3] for v in expected]
+        assert list(rows["unit"]) == [b"V"]*10
+        assert np.all(np.diff(rows["message_time"]) >= 0)
+
+        # A message with too few arguments is not copied, and does not decode
+        c.board.write(b"0,abcd;")
+        fields = c._read_fields()
+        assert not table.append_fields(fields,c.clock())
+
+        # ... nor is one of the right length with separators in the wrong places
+        c.board.write(b"0,A,BCDEF,GH,IJ,KL;")
+        fields = c._read_fields()
+        assert not table.append_fields(fields,c.clock())
+        assert len(table) == 10
+
+        store.append("kEmpty",[],1.5)
+        store.append("kAcknowledge",["not stored"],1.5)
+
+        # Readers see rows as they are written
+        readers = PyCmdMessenger.read_store(directory)
+        assert sorted(readers.keys()) == ["kEmpty","kReading","kValuePing"]
+        assert np.array_equal(readers["kReading"].rows,rows)
+        store.append("kReading",expected[0],2.0)
+        assert len(readers["kReading"]) == 11
+        assert readers["kEmpty"].rows["message_time"][0] == 1.5
+
+        # Closing trims the unused rows
+        store.close()
+        size = os.path.getsize(table.path)
+        assert size == table._offset + 11*table.dtype.itemsize
+        assert readers["kReading"].rows[-1]["message_time"] == 2.0
+
+        try:
+            telemetry.TelemetryReader(c.board.device)
+            assert False
+        except (ValueError,OSError):
+            pass
+    finally:
+        c.board.close()
+        shutil.rmtree(directory)
+
+def test_threaded_record_to():
+
+    directory = tempfile.mkdtemp()
+    c = open_messenger(threaded=True)
+    try:
+        store = PyCmdMessenger.TelemetryStore(directory,c,["kReading"],NAMES)
+        c.record_to(store)
+
+        expected = readings(50)
+        for values in expected:
+            c.send("kReading",*values)
+        c.send("kAcknowledge","still dispatched")
+
+        assert c.get(timeout=2)[1] == ["still dispatched"]
+
+        end = time.time() + 2
+        while len(store["kReading"]) < len(expected) and time.time() < end:
+            time.sleep(0.001)
+
+        rows = store["kReading"].rows
+        assert list(rows["micros"]) == [v[0] for v in expected]
+        assert list(rows["count"]) == [v[2] for v in expected]
+
+        # Back to dispatching
+        c.record_to(None)
+        c.send("kReading",*expected[0])
+        assert c.get(timeout=2)[0] == "kReading"
+        assert len(store["kReading"]) == len(expected)
+
+        # Another process reads the table while it is still open
+        script = "import PyCmdMessenger; r = PyCmdMessenger.read_store({!r}); " \
+                 "print(int(r['kReading'].rows['micros'].sum()))".format(directory)
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.dirname(os.path.dirname(os.path.abspath(PyCmdMessenger.__file__)))
+        output = subprocess.check_output([sys.executable,"-c",script],env=env)
+        assert int(output.split()[-1]) == sum([v[0] for v in expected])
+
+        store.close()
+    finally:
+        c.stop()
+        c.board.close()
+        shutil.rmtree(directory)
+
+def main(argv=None):
+
+    for test in [test_dtype,test_store,test_threaded_record_to]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()
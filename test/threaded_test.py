@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+__description__ = \
+"""
+Test CmdMessengerThreaded against the emulated rapid-float sketch.  No
+hardware needed.
+"""
+__author__ = "Michael J. Harms"
+__date__ = "2026-10-17"
+__usage__ = "./threaded_test.py"
+
+import concurrent.futures, os, threading, time
+import numpy as np
+import PyCmdMessenger
+from PyCmdMessenger import emulator
+
+COMMANDS = [["double_ping","d","double_pong"],
+            ["double_pong","d"]]
+
+class Collector(PyCmdMessenger.CmdMessengerThreaded):
+    """
+    Keeps every message passed to response_to_command.
+    """
+
+    def __init__(self,*args,**kwargs):
+        self.seen = []
+        self.got_message = threading.Event()
+        PyCmdMessenger.CmdMessengerThreaded.__init__(self,*args,**kwargs)
+
+    def made_connection(self,transport):
+        pass
+
+    def response_to_command(self,cmd_name,msg,message_time):
+        self.seen.append((cmd_name,msg))
+        self.got_message.set()
+
+def connect():
+
+    arduino = emulator.rapid_float_sketch()
+    board = PyCmdMessenger.ArduinoBoard(arduino.device,baud_rate=115200,
+                                        settle_time=0)
+    arduino.start()
+
+    return arduino, board, Collector(board,COMMANDS,warnings=False)
+
+def test_receive_and_query():
+
+    arduino, board, c = connect()
+
+    c.send("double_ping",0.5)
+    assert c.got_message.wait(2)
+    assert c.seen == [("double_pong",[0.5])]
+
+    replies = c.query_many([("double_ping",(i*1.5,)) for i in range(100)])
+    assert [r[1][0] for r in replies] == [i*1.5 for i in range(100)]
+    assert len(c.seen) == 1
+
+    c.close()
+    arduino.close()
+
+def test_idle_and_stop():
+
+    arduino, board, c = connect()
+
+    # An idle line should cost (next to) no CPU
+    before = os.times()
+    time.sleep(0.5)
+    after = os.times()
+    assert (after.user - before.user) + (after.system - before.system) < 0.1
+
+    start = time.time()
+    c.stop()
+    assert time.time() - start < 0.5
+    assert not c.is_alive()
+
+    board.close()
+    arduino.close()
+
+def test_corrupted_messages():
+
+    arduino, board, c = connect()
+
+    # A double_pong with a two byte "double" can't be decoded; the reader
+    # skips it and keeps going
+    os.write(arduino._master,b"1,ab;" + c._encode("double_pong",(2.0,)))
+    assert c.got_message.wait(2)
+    assert c.seen == [("double_pong",[2.0])]
+    assert c.corrupted_cmds == 50.0
+
+    c.close()
+    arduino.close()
+
+def test_handlers():
+
+    arduino, board, c = connect()
+
+    slow = []
+    def slow_handler(cmd_name,received,message_time):
+        time.sleep(0.005)
+        slow.append(received[0])
+
+    fast = []
+    def fast_handler(cmd_name,received,message_time):
+        fast.append(received[0])
+
+    executor = concurrent.futures.ThreadPoolExecutor(4)
+    c.on("double_pong",slow_handler,executor=executor)
+    c.on("double_ping",fast_handler)
+
+    data = b"".join([c._encode("double_pong",(float(i),)) +
+                     c._encode("double_ping",(float(i),)) for i in range(50)])
+    os.write(arduino._master,data)
+
+    # The fast handler runs on the reader thread and isn't held up by the
+    # slow one
+    deadline = time.time() + 2
+    while len(fast) < 50 and time.time() < deadline:
+        time.sleep(0.001)
+    assert fast == [float(i) for i in range(50)]
+    assert c.handler_stats()["double_pong"]["queue_depth"] > 0
+
+    executor.shutdown(wait=True)
+    assert slow == [float(i) for i in range(50)]
+
+    stats = c.handler_stats()
+    assert stats["double_pong"]["calls"] == 50
+    assert stats["double_pong"]["max_queue_depth"] > 1
+    assert stats["double_pong"]["mean_time"] >= 0.005
+    assert stats["double_ping"]["queue_depth"] == 0
+    assert c.seen == []
+
+    # Back to response_to_command
+    c.on("double_pong",None)
+    c.send("double_ping",1.0)
+    assert c.got_message.wait(2)
+    assert c.seen == [("double_pong",[1.0])]
+
+    c.close()
+    arduino.close()
+
+def test_queue():
+
+    arduino, board, c = connect()
+    c.enable_queue(10,"drop_oldest")
+
+    data = b"".join([c._encode("double_pong",(float(i),)) for i in range(50)])
+    os.write(arduino._master,data)
+
+    deadline = time.time() + 2
+    while sum(c.dropped_messages().values()) < 40 and time.time() < deadline:
+        time.sleep(0.001)
+    assert c.dropped_messages() == {"double_pong":40}
+
+    received = [c.get(timeout=1)[1][0] for i in range(10)]
+    assert received == [float(i) for i in range(40,50)]
+    assert c.get(timeout=0.01) is None
+    assert c.seen == []
+
+    os.write(arduino._master,b"".join([c._encode("double_pong",(float(i),))
+                                       for i in range(10)]))
+    batch = c.receive_many(5,deadline=1)
+    assert [m[1][0] for m in batch] == [0.0,1.0,2.0,3.0,4.0]
+    assert [m[1][0] for m in c.messages(timeout=0.05)] == [5.0,6.0,7.0,8.0,9.0]
+
+    # Stopping wakes up a waiting consumer
+    threading.Timer(0.05,c.stop).start()
+    assert c.get() is None
+
+    board.close()
+    arduino.close()
+
+def test_writer():
+
+    arduino, board, c = connect()
+    c.enable_writer(linger=0.005)
+
+    # Several threads sending at once; each thread's pings stay in order
+    def ping(start):
+        for i in range(50):
+            c.send("double_ping",float(start + i))
+
+    threads = [threading.Thread(target=ping,args=(1000*t,)) for t in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert c.flush(2)
+
+    deadline = time.time() + 2
+    while len(c.seen) < 200 and time.time() < deadline:
+        time.sleep(0.01)
+    for t in range(4):
+        pongs = [m[1][0] for m in c.seen if 1000*t <= m[1][0] < 1000*(t + 1)]
+        assert pongs == [float(1000*t + i) for i in range(50)]
+
+    stats = c.writer_stats()
+    assert stats["messages"] == 200
+    assert stats["batches"] < 200
+    assert stats["max_batch_messages"] > 1
+    assert stats["queued"] == 0
+
+    # Queries go through the writer too
+    assert c.query("double_ping",2.5,timeout=1)[1] == [2.5]
+
+    # Priorities per command and per send
+    try:
+        c.enable_writer(command_priorities={"not_a_command":1})
+        assert False
+    except ValueError:
+        pass
+
+    c.enable_writer(command_priorities={"double_ping":2})
+    c.send("double_ping",1.0)
+    c.send("double_ping",2.0,priority=0)
+    c.send_many([("double_ping",(3.0,))])
+    c.flush(1)
+    priorities = c.writer_stats()["priorities"]
+    assert priorities[2]["messages"] == 2
+    assert priorities[0]["messages"] == 1
+
+    # Chunks from send_many are never merged past max_chunk_size
+    writes = []
+    board_write = board.write
+    def record(data):
+        writes.append(data)
+        board_write(data)
+    board.write = record
+
+    c.enable_writer(linger=0.01)
+    queries = [("double_ping",(float(i),)) for i in range(15)]
+    c.send("double_ping",-1.0)
+    c.send_many(queries,max_chunk_size=16)
+    c.send("double_ping",-2.0)
+    c.flush(1)
+    expected = [c._encode("double_ping",(-1.0,))] + \
+               c._compile_batch(queries,16)[0] + \
+               [c._encode("double_ping",(-2.0,))]
+    assert writes == expected
+    assert max([len(w) for w in writes[1:-1]]) <= 16
+
+    c.close()
+    arduino.close()
+
+def test_send_array():
+
+    arduino = emulator.rapid_float_sketch()
+    board = PyCmdMessenger.ArduinoBoard(arduino.device,baud_rate=115200,
+                                        settle_time=0)
+    arduino.start()
+    c = Collector(board,COMMANDS + [["double_array","d*"]],warnings=False)
+
+    writes = []
+    board_write = board.write
+    def record(data):
+        writes.append(data)
+        board_write(data)
+    board.write = record
+
+    # Arrays wait their turn on the writer thread like everything else
+    c.enable_writer(linger=0.2)
+    values = np.array([1.0,2.0,3.0])
+    c.send("double_ping",1.0)
+    c.send_array("double_array",values)
+    c.send("double_ping",2.0)
+    assert c.writer_stats()["queued"] == 3
+    c.flush(1)
+    assert b"".join(writes) == c._encode("double_ping",(1.0,)) + \
+                               c._encode_array("double_array",(values,)) + \
+                               c._encode("double_ping",(2.0,))
+
+    # ... and can jump the queue
+    writes.clear()
+    c.send("double_ping",3.0)
+    c.send_array("double_array",[4.0],priority=1)
+    c.flush(1)
+    assert b"".join(writes) == c._encode_array("double_array",([4.0],)) + \
+                               c._encode("double_ping",(3.0,))
+
+    c.close()
+    arduino.close()
+
+def main(argv=None):
+
+    for test in [test_receive_and_query,test_idle_and_stop,
+                 test_corrupted_messages,test_handlers,test_queue,
+                 test_writer,test_send_array]:
+        test()
+        print("{:30s} --> PASS".format(test.__name__))
+
+if __name__ == "__main__":
+    main()